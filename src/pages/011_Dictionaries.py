@@ -2,6 +2,7 @@ from pathlib import Path
 
 import streamlit as st
 
+import scripts.profile_functions as profile_functs
 import scripts.script_functions as functs
 
 
@@ -14,12 +15,14 @@ def get_dirs() -> Path:
 def main() -> None:
     page_title = "Dictionary Terms"
     functs.set_page_configs(page_title)
+    profile_functs.start_page_profile(page_title)
 
     dictionary_dicts = functs.create_dictionary_dicts()
     for dictionary_name, dictionary_dict in dictionary_dicts.items():
         st.write(
             f"### {dictionary_dict['label']} ({dictionary_name}) dictionary:\ndictionary terms: {', '.join(dictionary_dict['terms'])}"
         )
+    profile_functs.finish_page_profile()
     st.sidebar.write(functs.print_updated_time())  # PROGRESSTRACKING:
     print(functs.print_updated_time())  # PROGRESSTRACKING:
 
@@ -2,7 +2,11 @@ import plotly.express as px
 import polars as pl
 import streamlit as st
 
+import scripts.chart_functions as chart_functs
+import scripts.corpus_functions as corpus_functs
+import scripts.profile_functions as profile_functs
 import scripts.script_functions as functs
+import scripts.viewer_functions as viewer_functs
 
 
 def get_word_count_by_year(dta: pl.DataFrame) -> pl.DataFrame:  # TODO: test
@@ -22,6 +26,8 @@ def get_posts_by_date(dta: pl.DataFrame) -> pl.DataFrame:
     return dta.group_by(pl.col("year_month_dt")).agg(pl.len().alias("count")).sort("year_month_dt")
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_post_by_date(fig_dta: pl.DataFrame):
     fig_title = "Posts by Date"
     # fig = alt.Chart(fig_dta).mark_line().encode(x="year_month_dt", y="count", color="company_name")
@@ -40,6 +46,8 @@ def get_posts_by_date_by_company(dta: pl.DataFrame) -> pl.DataFrame:
     )
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_post_by_date_by_company(fig_dta: pl.DataFrame):
     fig_title = "Posts by Company by Date"
     # fig = alt.Chart(fig_dta).mark_line().encode(x="year_month_dt", y="count", color="company_name")
@@ -49,25 +57,28 @@ def graph_post_by_date_by_company(fig_dta: pl.DataFrame):
 
 def display_graph(fig_title, fig, fig_dta):
     st.write(f"## {fig_title}")
-    st.plotly_chart(fig, use_container_width=True)
+    functs.display_chart(fig)
     chart_display = st.checkbox(f"Display Dataframe for {fig_title}?")
     if chart_display:
         st.write(f"#### {fig_title} Dataframe")
-        st.dataframe(fig_dta)
+        viewer_functs.display_frame_viewer(fig_dta, fig_title)
         st.write(f"Dataframe shape: {fig_dta.shape}")
 
 
 def main() -> None:
     page_title = "Descriptive Graphs"
     functs.set_page_configs(page_title)
-    dta = functs.load_dta()
-    dta = functs.get_year_selection_filter_bar(dta)
-    dta = functs.get_article_word_count(dta)
-    dta = dta.drop(["source_url", "text", "year", "month"])
+    profile_functs.start_page_profile(page_title)
+    with profile_functs.time_stage("load"):
+        dta = corpus_functs.scan_corpus()
+    with profile_functs.time_stage("year_filter"):
+        dta = functs.get_year_selection_filter_bar(dta)
+        dta = dta.select(pl.col(["company_name", "date", "year", "word_count"])).collect()
+    profile_functs.record_frame("year_filter", dta)
     # get start year by company
-    dta_start_year = dta[["company_name", "year_int"]]
-    dta_start_year = dta_start_year.group_by(pl.col("company_name")).agg(pl.min("year_int"))
-    dta_start_year = dta_start_year.rename({"year_int": "start_year"})
+    dta_start_year = dta[["company_name", "year"]]
+    dta_start_year = dta_start_year.group_by(pl.col("company_name")).agg(pl.min("year"))
+    dta_start_year = dta_start_year.rename({"year": "start_year"})
     dta_start_year = dta_start_year.unique()
     dta_start_year = dta_start_year.sort("company_name", "start_year")
     st.write("## Start Year by Company")
@@ -85,6 +96,7 @@ def main() -> None:
     dta_total_word_count = dta_total_word_count.sort("company_name")
     st.write("## Total Word Count by Company")
     st.write(dta_total_word_count)
+    profile_functs.finish_page_profile()
     st.sidebar.write(functs.print_updated_time())  # PROGRESSTRACKING:
     print(functs.print_updated_time())  # PROGRESSTRACKING:
 
@@ -2,8 +2,12 @@ import plotly.express as px
 import polars as pl
 import streamlit as st
 
+import scripts.chart_functions as chart_functs
 import scripts.company_functions as company_functs
+import scripts.corpus_functions as corpus_functs
+import scripts.profile_functions as profile_functs
 import scripts.script_functions as functs
+import scripts.viewer_functions as viewer_functs
 
 
 def get_word_count_by_year(dta: pl.DataFrame) -> pl.DataFrame:  # TODO: test
@@ -23,6 +27,8 @@ def get_posts_by_date(dta: pl.DataFrame) -> pl.DataFrame:
     return dta.group_by(pl.col("year_month_dt")).agg(pl.len().alias("count")).sort("year_month_dt")
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_post_by_date(fig_dta: pl.DataFrame):
     fig_title = "Total Posts by Date"
     # fig = alt.Chart(fig_dta).mark_line().encode(x="year_month_dt", y="count", color="company_name")
@@ -41,6 +47,8 @@ def get_posts_by_date_by_company(dta: pl.DataFrame) -> pl.DataFrame:
     )
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_post_by_date_by_company(fig_dta: pl.DataFrame):
     fig_title = "Posts by Company by Date"
     # fig = alt.Chart(fig_dta).mark_line().encode(x="year_month_dt", y="count", color="company_name")
@@ -57,30 +65,31 @@ def graph_post_by_date_by_company(fig_dta: pl.DataFrame):
 
 def display_graph(fig_title, fig, fig_dta):
     st.write(f"## {fig_title}")
-    st.plotly_chart(fig, use_container_width=True)
+    functs.display_chart(fig)
     chart_display = st.checkbox(f"Display Dataframe for {fig_title}?")
     if chart_display:
         st.write(f"#### {fig_title} Dataframe")
-        st.dataframe(fig_dta)
+        viewer_functs.display_frame_viewer(fig_dta, fig_title)
         st.write(f"Dataframe shape: {fig_dta.shape}")
 
 
 def main() -> None:
     page_title = "Descriptive Graphs"
     functs.set_page_configs(page_title)
-    dta = functs.load_dta()
-    dta = functs.get_year_selection_filter_bar(dta)
-    # st.write(f"dta.columns: {dta.columns}")  # TEMPPRINT:
-    dta = functs.get_article_word_count(dta)
+    profile_functs.start_page_profile(page_title)
+    with profile_functs.time_stage("load"):
+        dta = corpus_functs.scan_corpus()
+    with profile_functs.time_stage("year_filter"):
+        dta = functs.get_year_selection_filter_bar(dta)
+        dta = dta.select(pl.col(["company_name", "year_month_dt"])).collect()
+    profile_functs.record_frame("year_filter", dta)
     dta_by_date = get_posts_by_date(dta)
     fig, fig_title, fig_dta = graph_post_by_date(dta_by_date)
-    st.plotly_chart(fig, use_container_width=True)
-    functs.display_graph_dta(fig_dta, fig_title)
+    functs.display_chart_section(fig, fig_title, fig_dta)
     # display_graph(fig, fig_title, fig_dta)
     dta_by_date = get_posts_by_date_by_company(dta)
     fig, fig_title, fig_dta = graph_post_by_date_by_company(dta_by_date)
-    st.plotly_chart(fig, use_container_width=True)
-    functs.display_graph_dta(fig_dta, fig_title)
+    functs.display_chart_section(fig, fig_title, fig_dta)
     # display_graph(fig, fig_title, fig_dta)
     # st.altair_chart(fig, use_container_width=True)
     # fig = px.line(
@@ -94,6 +103,7 @@ def main() -> None:
     #     st.write(
     #         f"### {dictionary_dict['label']} ({dictionary_name}) dictionary:\ndictionary terms: {', '.join(dictionary_dict['terms'])}"
     #     )
+    profile_functs.finish_page_profile()
     st.sidebar.write(functs.print_updated_time())  # PROGRESSTRACKING:
     print(functs.print_updated_time())  # PROGRESSTRACKING:
 
@@ -2,13 +2,19 @@ import plotly.express as px
 import polars as pl
 import streamlit as st
 
+import scripts.chart_functions as chart_functs
+import scripts.corpus_functions as corpus_functs
+import scripts.profile_functions as profile_functs
 import scripts.script_functions as functs
+import scripts.viewer_functions as viewer_functs
 
 
 def get_posts_by_date(dta: pl.DataFrame) -> pl.DataFrame:
     return dta.group_by(pl.col("year_month_dt")).agg(pl.len().alias("count")).sort("year_month_dt")
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_post_by_date(fig_dta: pl.DataFrame):
     fig_title = "Posts by Date"
     # fig = alt.Chart(fig_dta).mark_line().encode(x="year_month_dt", y="count", color="company_name")
@@ -25,30 +31,35 @@ def get_posts_by_date_by_company(dta: pl.DataFrame) -> pl.DataFrame:
     )
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_terms_by_date_raw_count(fig_dta: pl.DataFrame, term_col_names: list[str]):
     fig_title = "Terms by Date Raw Count (All Companies)"
     col_names = term_col_names.copy()
     col_names.append("year_month_dt")
     fig_dta = fig_dta.select(pl.col(col_names))
-    term_col_names.append("year_month_dt")
     fig_dta = fig_dta.group_by(pl.col("year_month_dt")).sum().sort("year_month_dt")
     fig = px.line(fig_dta, x="year_month_dt", y=term_col_names, title=fig_title)
     return fig, fig_title, fig_dta
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_terms_by_date_raw_count_companies(
     fig_dta: pl.DataFrame, term_col_names: list[str], companies_selection: list[str]
 ):
     companies_selection_string = ", ".join(companies_selection)
     fig_title = f"Terms by Date Raw Count ({companies_selection_string})"
     col_names = term_col_names.copy()
+    col_names.append("year_month_dt")
     fig_dta = fig_dta.select(pl.col(col_names))
-    term_col_names.append("year_month_dt")
     fig_dta = fig_dta.group_by(pl.col("year_month_dt")).sum().sort("year_month_dt")
     fig = px.line(fig_dta, x="year_month_dt", y=term_col_names, title=fig_title)
     return fig, fig_title, fig_dta
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_terms_by_date_prop(fig_dta: pl.DataFrame, term_col_names: list[str]):
     fig_title = "Terms by Date Proportion of Words (All Companies)"
     col_names = term_col_names.copy()
@@ -66,6 +77,8 @@ def graph_terms_by_date_prop(fig_dta: pl.DataFrame, term_col_names: list[str]):
     return fig, fig_title, fig_dta
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_terms_by_date_prop_companies(
     fig_dta: pl.DataFrame, term_col_names: list[str], companies_selection: list[str]
 ):
@@ -86,6 +99,8 @@ def graph_terms_by_date_prop_companies(
     return fig, fig_title, fig_dta
 
 
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
 def graph_post_by_date_by_company(fig_dta: pl.DataFrame):
     fig_title = "Posts by Company by Date"
     fig = px.line(
@@ -102,63 +117,69 @@ def display_graph_dta(fig_dta, fig_title):
     chart_display = st.checkbox(f"Display Dataframe for {fig_title}?")
     if chart_display:
         st.write(f"#### {fig_title} Dataframe")
-        st.dataframe(fig_dta)
+        viewer_functs.display_frame_viewer(fig_dta, fig_title)
         st.write(f"Dataframe shape: {fig_dta.shape}")
 
 
+@st.fragment
+@profile_functs.profiled_section("companies terms chart")
+def display_companies_terms_section(
+    dta: pl.DataFrame, term_col_names: list[str], raw_counts_selection: bool
+) -> None:
+    companies_selection = st.segmented_control(
+        label="Select Companies to Include in Line Graphs",
+        options=dta["company_name"].unique().sort().to_list(),
+        selection_mode="multi",
+    )
+    if raw_counts_selection:
+        fig, fig_title, fig_dta = graph_terms_by_date_raw_count_companies(
+            dta, term_col_names, companies_selection
+        )
+    else:
+        fig, fig_title, fig_dta = graph_terms_by_date_prop_companies(
+            dta, term_col_names, companies_selection
+        )
+    functs.display_chart(fig)
+    display_graph_dta(fig_dta, fig_title)
+
+
 def display_graph(fig_title, fig, fig_dta):
     st.write(f"## {fig_title}")
-    st.plotly_chart(fig, use_container_width=True)
+    functs.display_chart(fig)
     chart_display = st.checkbox(f"Display Dataframe for {fig_title}?")
     if chart_display:
         st.write(f"#### {fig_title} Dataframe")
-        st.dataframe(fig_dta)
+        viewer_functs.display_frame_viewer(fig_dta, fig_title)
         st.write(f"Dataframe shape: {fig_dta.shape}")
 
 
 def main() -> None:
     page_title = "Basic Dictionary Term Graphs"
     functs.set_page_configs(page_title)
+    profile_functs.start_page_profile(page_title)
     dictionary_dicts = functs.create_dictionary_dicts()
     dict_key, dict_label, dict_terms, dict_terms_colors = functs.select_dictionary(dictionary_dicts)
 
-    dta = functs.load_dta()
-    dta = functs.get_year_selection_filter_bar(dta)
-    # st.write(f"dta.columns: {dta.columns}")  # TEMPPRINT:
-    dta = functs.get_article_word_count(dta)
+    with profile_functs.time_stage("load"):
+        dta, term_store = corpus_functs.scan_term_count_source(
+            ["company_name", "year", "year_month_dt", "word_count"]
+        )
+    with profile_functs.time_stage("year_filter"):
+        dta = functs.get_year_selection_filter_bar(dta).collect()
+    profile_functs.record_frame("year_filter", dta)
     # st.write(f"dta.columns: {dta.columns}")  # TEMPPRINT:
-    dta = functs.get_word_count_by_month_by_company(dta)
-    dta, term_col_names = functs.get_dict_term_count(dta, dict_terms)
+    year_range = (dta["year"].min(), dta["year"].max())
+    rows_key = (corpus_functs.get_corpus_key(), year_range)
+    dta, term_col_names = functs.get_dict_term_count(dta, dict_terms, term_store, rows_key)
     raw_counts_selection = st.checkbox("Show Raw Counts?", value=False)
     if raw_counts_selection:
         fig, fig_title, fig_dta = graph_terms_by_date_raw_count(dta, term_col_names)
-        st.plotly_chart(fig, use_container_width=True)
-        display_graph_dta(fig_dta, fig_title)
-        companies_selection = st.segmented_control(
-            label="Select Companies to Include in Line Graphs",
-            options=dta["company_name"].unique().sort().to_list(),
-            selection_mode="multi",
-        )
-        fig, fig_title, fig_dta = graph_terms_by_date_raw_count_companies(
-            dta, term_col_names, companies_selection
-        )
-        st.plotly_chart(fig, use_container_width=True)
-        display_graph_dta(fig_dta, fig_title)
     else:
         fig, fig_title, fig_dta = graph_terms_by_date_prop(dta, term_col_names)
-        st.plotly_chart(fig, use_container_width=True)
-        display_graph_dta(fig_dta, fig_title)
-        companies_selection = st.segmented_control(
-            label="Select Companies to Include in Line Graphs",
-            options=dta["company_name"].unique().sort().to_list(),
-            selection_mode="multi",
-        )
-        fig, fig_title, fig_dta = graph_terms_by_date_prop_companies(
-            dta, term_col_names, companies_selection
-        )
-        st.plotly_chart(fig, use_container_width=True)
-        display_graph_dta(fig_dta, fig_title)
+    functs.display_chart_section(fig, fig_title, fig_dta)
+    display_companies_terms_section(dta, term_col_names, raw_counts_selection)
 
+    profile_functs.finish_page_profile()
     st.sidebar.write(functs.print_updated_time())  # PROGRESSTRACKING:
     print(functs.print_updated_time())  # PROGRESSTRACKING:
 
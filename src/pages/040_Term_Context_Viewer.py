@@ -0,0 +1,102 @@
+import polars as pl
+import streamlit as st
+
+import scripts.cache_functions as cache_functs
+import scripts.corpus_functions as corpus_functs
+import scripts.index_functions as index_functs
+import scripts.kwic_functions as kwic_functs
+import scripts.profile_functions as profile_functs
+import scripts.script_functions as functs
+import scripts.viewer_functions as viewer_functs
+
+
+def get_snippets_markdown(contexts: pl.DataFrame) -> str:
+    """
+    Writes the contexts of a page as markdown, one line per hit with the hit highlighted.
+
+    Args:
+        contexts (pl.DataFrame): The hits with their context from `kwic_functions.get_kwic_page`.
+
+    Returns:
+        str: The markdown of the snippets.
+    """
+    return "\n\n".join(
+        f"**{company_name}** {date} (document {doc_id}, word {word_index}): "
+        f"{before} :orange-background[{hit}] {after}"
+        for company_name, date, doc_id, word_index, before, hit, after in contexts.select(
+            "company_name", "date", "doc_id", "word_index", *kwic_functs.KWIC_CONTEXT_COLS
+        ).iter_rows()
+    )
+
+
+@st.fragment
+@profile_functs.profiled_section("term contexts")
+def display_contexts_section(token_index: dict, terms: list[str], rows_key: tuple) -> None:
+    window = st.slider(
+        "Words Shown Before and After the Term",
+        min_value=1,
+        max_value=kwic_functs.KWIC_MAX_WINDOW,
+        value=kwic_functs.KWIC_DEFAULT_WINDOW,
+    )
+    with profile_functs.time_stage("kwic_hits"):
+        hits = kwic_functs.get_kwic_hits(token_index, terms, rows_key)
+    page_count = viewer_functs.get_page_count(hits.height, kwic_functs.KWIC_PAGE_SIZE)
+    # new terms or years can leave fewer pages than the page shown before
+    if st.session_state.get("kwic_page_number", 1) > page_count:
+        st.session_state["kwic_page_number"] = page_count
+    page_number = st.number_input("Page", min_value=1, max_value=page_count, key="kwic_page_number")
+    contexts = kwic_functs.get_kwic_page(token_index, hits, page_number, window)
+    st.write(f"{hits.height} hits, page {page_number} of {page_count}")
+    if contexts.is_empty():
+        return
+    st.write("## Contexts Table")
+    st.dataframe(contexts.drop("hit_length"))
+    st.write("## Contexts Text")
+    st.markdown(get_snippets_markdown(contexts))
+
+
+def main() -> None:
+    page_title = "Term Context Viewer"
+    functs.set_page_configs(page_title)
+    profile_functs.start_page_profile(page_title)
+    token_index = corpus_functs.load_token_index()
+    if token_index is None:
+        st.warning("The term contexts are read from the token index, which is missing or stale.")
+        profile_functs.finish_page_profile()
+        return
+    with profile_functs.time_stage("year_filter"):
+        years = functs.get_year_selection_filter_bar(corpus_functs.scan_corpus().select("year"))
+        year_range = (
+            years.select(pl.min("year").alias("start_year"), pl.max("year").alias("end_year"))
+            .collect()
+            .row(0)
+        )
+
+    search_mode = st.radio("Search For", options=["Dictionary Terms", "Any Terms"], horizontal=True)
+    if search_mode == "Dictionary Terms":
+        dictionary_dicts = functs.create_dictionary_dicts()
+        _, dict_label, dict_terms, _ = functs.select_dictionary(dictionary_dicts)
+        terms = st.multiselect(f"Select {dict_label} Terms", options=list(dict_terms))
+    else:
+        user_terms = st.text_input(
+            "Enter a Term to Search\n\nIf you want to use more than 1 term separate them by using the character ','",
+            "scope 1,scope 2,scope 3",
+        )
+        terms = [term.strip() for term in user_terms.split(",") if term.strip()]
+    unindexed_terms = [term for term in terms if not index_functs.is_indexed_term(term)]
+    if unindexed_terms:
+        st.warning(
+            "Only words and phrases of letters and numbers are searched, skipping: "
+            + ", ".join(unindexed_terms)
+        )
+    if terms:
+        rows_key = (corpus_functs.get_corpus_key(), year_range)
+        display_contexts_section(token_index, terms, rows_key)
+
+    cache_functs.display_result_cache_stats()
+    profile_functs.finish_page_profile()
+    st.sidebar.write(functs.print_updated_time())  # PROGRESSTRACKING:
+    print(functs.print_updated_time())  # PROGRESSTRACKING:
+
+
+main()
@@ -0,0 +1,189 @@
+import polars as pl
+
+# the grain the dictionary graphs are computed at, the company and the first day of its
+# cell (see `get_cell_start_expr`), every period and the all companies views are rollups of
+# these cells
+CUBE_KEY_COLS = ["company_name", "date"]
+# bump when the cells or columns written by build_cube change so older cubes are rebuilt
+CUBE_FORMAT_VERSION = 3
+# the periods the dictionary graphs can be drawn at: the `dt.truncate` interval giving the
+# first day of the period, the period column and its label
+GRANULARITIES = {
+    "week": {"interval": "1w", "period_col": "week_dt", "label": "Week"},
+    "month": {"interval": "1mo", "period_col": "year_month_dt", "label": "Month"},
+    "quarter": {"interval": "1q", "period_col": "quarter_dt", "label": "Quarter"},
+    "year": {"interval": "1y", "period_col": "year_dt", "label": "Year"},
+}
+
+
+def get_cell_start_expr() -> pl.Expr:
+    """
+    Returns the first day of the cell of each 'date': the part of its week within its month.
+
+    A week can start in one month and end in the next, so weeks do not roll up to months.
+    Splitting the weeks at month boundaries gives the coarsest cells that roll up exactly to
+    weeks, months, quarters and years, at most six cells a month instead of one per day.
+    Every day of a cell truncates to the same week, month, quarter and year as its first
+    day, so a cell start is its own cell start.
+
+    Returns:
+        pl.Expr: The later of the first day of the week and of the month of 'date'.
+    """
+    return pl.max_horizontal(
+        pl.col("date").dt.truncate(GRANULARITIES["week"]["interval"]),
+        pl.col("date").dt.truncate(GRANULARITIES["month"]["interval"]),
+    )
+
+
+def build_cube(dta: pl.DataFrame, term_counts: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Pre-aggregates the corpus and its sparse term counts to company x week of month cells,
+    the part of a week within a month (see `get_cell_start_expr`).
+
+    The dictionary graphs only need word counts and term counts summed by company and
+    period, so the cube holds:
+    - words: one row per cell with a 'cell_id', its first day as 'date', the other date
+      columns of the corpus ('year_month_dt', 'year', 'year_dt' and 'month'), 'word_count'
+      and 'doc_count'.
+    - counts: the non zero term counts of each cell ('cell_id', 'term_id', 'count'), with the
+      same term ids as the document term store.
+
+    Args:
+        dta (pl.DataFrame): The corpus with 'doc_id', 'company_name', date and 'word_count' columns.
+        term_counts (pl.DataFrame): The sparse document term counts from
+                                    `term_functions.build_term_counts`.
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame]: The cube words and counts.
+    """
+    dta = dta.with_columns(get_cell_start_expr().alias("date"))
+    cube_words = (
+        dta.group_by(CUBE_KEY_COLS)
+        .agg(
+            pl.first("year_month_dt"),
+            pl.first("year"),
+            pl.first("year_dt"),
+            pl.first("month"),
+            pl.sum("word_count"),
+            pl.len().alias("doc_count"),
+        )
+        .sort(CUBE_KEY_COLS)
+        .with_row_index("cell_id")
+    )
+    doc_cells = dta.select("doc_id", *CUBE_KEY_COLS).join(
+        cube_words.select("cell_id", *CUBE_KEY_COLS), on=CUBE_KEY_COLS, how="left"
+    )
+    cube_counts = (
+        term_counts.join(doc_cells.select("doc_id", "cell_id"), on="doc_id", how="inner")
+        .group_by("cell_id", "term_id")
+        .agg(pl.sum("count"))
+        .sort("cell_id", "term_id")
+    )
+    return cube_words, cube_counts
+
+
+def merge_cube(
+    cube_words: pl.DataFrame,
+    cube_counts: pl.DataFrame,
+    dta: pl.DataFrame,
+    term_counts: pl.DataFrame,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Adds new documents to a cube without reading the documents already in it.
+
+    The cells of the new documents are built with `build_cube` and summed into the existing
+    cells. The cells are then renumbered in the same order `build_cube` numbers them, so the
+    merged cube is the cube of all the documents.
+
+    Args:
+        cube_words (pl.DataFrame): The words of the existing cube.
+        cube_counts (pl.DataFrame): The counts of the existing cube.
+        dta (pl.DataFrame): The new documents with 'doc_id', 'company_name', date and
+                            'word_count' columns, 'company_name' with the Enum of the merged
+                            corpus.
+        term_counts (pl.DataFrame): The sparse term counts of the new documents.
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame]: The merged cube words and counts.
+    """
+    new_words, new_counts = build_cube(dta, term_counts)
+    cube_words = cube_words.with_columns(
+        pl.col("company_name").cast(pl.Utf8).cast(new_words["company_name"].dtype)
+    )
+    merged_words = (
+        pl.concat([cube_words.drop("cell_id"), new_words.drop("cell_id")])
+        .group_by(CUBE_KEY_COLS)
+        .agg(
+            pl.first("year_month_dt"),
+            pl.first("year"),
+            pl.first("year_dt"),
+            pl.first("month"),
+            pl.sum("word_count"),
+            pl.sum("doc_count"),
+        )
+        .sort(CUBE_KEY_COLS)
+        .with_row_index("cell_id")
+    )
+    merged_counts = []
+    for words, counts in [(cube_words, cube_counts), (new_words, new_counts)]:
+        cell_ids = words.select(pl.col("cell_id").alias("old_cell_id"), *CUBE_KEY_COLS).join(
+            merged_words.select("cell_id", *CUBE_KEY_COLS), on=CUBE_KEY_COLS, how="inner"
+        )
+        merged_counts.append(
+            counts.rename({"cell_id": "old_cell_id"})
+            .join(cell_ids.select("old_cell_id", "cell_id"), on="old_cell_id", how="inner")
+            .select("cell_id", "term_id", "count")
+        )
+    merged_counts = (
+        pl.concat(merged_counts)
+        .group_by("cell_id", "term_id")
+        .agg(pl.sum("count"))
+        .sort("cell_id", "term_id")
+    )
+    return merged_words, merged_counts
+
+
+def get_fine_grain_totals(dta: pl.DataFrame, value_cols: list[str]) -> pl.DataFrame:
+    """
+    Sums the given columns by company and week of month (see `get_cell_start_expr`), the
+    grain every granularity rolls up from.
+
+    Args:
+        dta (pl.DataFrame): The documents or cube cells with 'company_name', 'date' and the
+                            value columns.
+        value_cols (list[str]): The columns to sum, e.g. 'word_count' and the term counts.
+
+    Returns:
+        pl.DataFrame: One row per company and week of month with its first day as 'date',
+                      sorted by company and date.
+    """
+    return (
+        dta.group_by("company_name", get_cell_start_expr().alias("date"))
+        .agg(pl.sum(value_cols))
+        .sort(CUBE_KEY_COLS)
+    )
+
+
+def rollup_to_granularity(dta: pl.DataFrame, granularity: str) -> pl.DataFrame:
+    """
+    Rolls company x week of month totals up to company x period totals.
+
+    Args:
+        dta (pl.DataFrame): The totals from `get_fine_grain_totals`.
+        granularity (str): A key of GRANULARITIES.
+
+    Returns:
+        pl.DataFrame: One row per company and period with the period column of the
+                      granularity (e.g. 'year_month_dt') instead of 'date', sorted by company
+                      and period.
+    """
+    period = GRANULARITIES[granularity]
+    value_cols = [col_name for col_name in dta.columns if col_name not in CUBE_KEY_COLS]
+    return (
+        dta.group_by(
+            "company_name",
+            pl.col("date").dt.truncate(period["interval"]).alias(period["period_col"]),
+        )
+        .agg(pl.sum(value_cols))
+        .sort("company_name", period["period_col"])
+    )
@@ -0,0 +1,376 @@
+import argparse
+import datetime
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import polars as pl
+
+import scripts.aggregate_functions as aggregate_functs
+import scripts.dictionary_graph_functions as dictionary_graph_functs
+import scripts.profile_functions as profile_functs
+import scripts.script_functions as functs
+import scripts.synthetic_functions as synthetic_functs
+
+BENCHMARK_RESULTS_FILE_NAME = "benchmark_results.jsonl"
+# the real corpus, the other benchmark corpora are the SYNTHETIC_CORPUS_SIZES
+SOURCE_CORPUS_LABEL = "source"
+
+
+def get_article_word_count_unfused(dta: pl.DataFrame) -> pl.DataFrame:
+    """
+    The former multi pass implementation of `get_article_word_count`, kept only as the
+    baseline for the normalizer benchmark.
+    """
+    regex_pattern = r"[^A-Za-z0-9 ]+"
+    dta = dta.with_columns(pl.col("text").str.to_lowercase().alias("clean_text"))
+    dta = dta.with_columns(pl.col("clean_text").str.replace_all(regex_pattern, " "))
+    dta = dta.with_columns(pl.col("clean_text").str.replace_all(r"\W", " "))
+    dta = dta.with_columns(pl.col("clean_text").str.replace_all(r"\n", " "))
+    dta = dta.with_columns(pl.col("clean_text").str.replace_all(r" +", " "))
+    dta = dta.with_columns(pl.col("clean_text").str.strip_chars())
+    dta = dta.with_columns((pl.col("clean_text").str.split(" ")).alias("word_list"))
+    dta = dta.with_columns((pl.col("word_list").list.len()).alias("word_count"))
+    dta = dta.drop("word_list")
+    return dta
+
+
+def count_dictionary_terms(dta: pl.DataFrame) -> pl.DataFrame:
+    for dictionary_dict in functs.create_dictionary_dicts().values():
+        dta, _ = functs.get_dict_term_count(dta, list(dictionary_dict["terms"].keys()))
+    return dta
+
+
+def count_combined_dictionaries(dta: pl.DataFrame) -> pl.DataFrame:
+    dta, _, _ = functs.get_dicts_combined_term_count(dta, functs.create_dictionary_dicts())
+    return dta
+
+
+def roll_up_word_counts_by_month(dta: pl.DataFrame) -> pl.DataFrame:
+    """
+    Sums the word counts by company and week of month and rolls them up to months, as the dictionary
+    graph pages aggregate the documents.
+    """
+    return aggregate_functs.rollup_to_granularity(
+        aggregate_functs.get_fine_grain_totals(dta, ["word_count"]), "month"
+    )
+
+
+def build_dictionary_graphs_by_month(dictionary_totals: tuple) -> None:
+    """
+    Builds the line graphs of the dictionary graph pages at month grain with the builders
+    the pages run, past the figure cache (`__wrapped__`) so every repeat builds them.
+    """
+    dta, term_col_names, term_col_colors = dictionary_totals
+    period_col = aggregate_functs.GRANULARITIES["month"]["period_col"]
+    companies_selection = dta["company_name"].unique().sort().to_list()[:2]
+    dictionary_graph_functs.graph_terms_by_date_raw_count.__wrapped__(
+        dta, term_col_names, term_col_colors, period_col
+    )
+    dictionary_graph_functs.graph_terms_by_date_prop.__wrapped__(
+        dta, term_col_names, term_col_colors, period_col
+    )
+    dictionary_graph_functs.graph_terms_by_date_raw_count_companies.__wrapped__(
+        dta, term_col_names, term_col_colors, companies_selection, period_col
+    )
+    dictionary_graph_functs.graph_terms_by_date_prop_companies.__wrapped__(
+        dta, term_col_names, term_col_colors, companies_selection, period_col
+    )
+    dictionary_graph_functs.graph_terms_by_date_prop_select_companies_dictionary.__wrapped__(
+        dta, term_col_names, term_col_colors, companies_selection, term_col_names[0], "month"
+    )
+
+
+def get_benchmark_stages() -> dict:
+    """
+    Returns the benchmarked stages by name with the input each stage takes:
+    - 'path': the path of the corpus parquet file.
+    - 'dta': the corpus as returned by `load_dta`.
+    - 'corpus': the corpus with the 'clean_text' and 'word_count' of `get_article_word_count`.
+    - 'dictionary_totals': the company x month word and dictionary counts of the corpus with
+      their columns and colors, as the dictionary graph pages pass them to their builders.
+    """
+    return {
+        "load_dta": ("path", functs.read_dta),
+        "normalize_unfused": ("dta", get_article_word_count_unfused),
+        "normalize_fused": ("dta", functs.get_article_word_count),
+        "dict_term_count": ("corpus", count_dictionary_terms),
+        "dicts_combined_term_count": ("corpus", count_combined_dictionaries),
+        "word_count_rollup_by_month": ("corpus", roll_up_word_counts_by_month),
+        "dictionary_graphs_by_month": ("dictionary_totals", build_dictionary_graphs_by_month),
+    }
+
+
+def get_corpus_labels() -> list[str]:
+    return [SOURCE_CORPUS_LABEL, *synthetic_functs.SYNTHETIC_CORPUS_SIZES.keys()]
+
+
+def get_benchmark_corpus_path(corpus_label: str) -> Path:
+    """
+    Returns the parquet file of a benchmark corpus, generating the synthetic corpora on first
+    use (see `synthetic_functions.generate_synthetic_corpus`).
+    """
+    if corpus_label == SOURCE_CORPUS_LABEL:
+        return functs.get_dataframe_dir() / "combined_oil_company_dta.parquet"
+    return synthetic_functs.generate_synthetic_corpus(corpus_label)
+
+
+def get_stage_input(input_name: str, corpus_path: Path):
+    if input_name == "path":
+        return corpus_path
+    dta = functs.read_dta(corpus_path)
+    if input_name in ("corpus", "dictionary_totals"):
+        dta = functs.get_article_word_count(dta)
+    if input_name == "dictionary_totals":
+        dta, term_col_names, term_col_colors = functs.get_dicts_combined_term_count(
+            dta, functs.create_dictionary_dicts()
+        )
+        dta = aggregate_functs.rollup_to_granularity(
+            aggregate_functs.get_fine_grain_totals(dta, ["word_count", *term_col_names]), "month"
+        )
+        return dta, term_col_names, term_col_colors
+    return dta
+
+
+def run_stage(stage_name: str, repeats: int, corpus_label: str = SOURCE_CORPUS_LABEL) -> dict:
+    """
+    Runs one benchmark stage on a benchmark corpus in the current process.
+
+    The input of the stage is prepared before measuring, so the peak memory is the growth of
+    the resident set size while the stage runs. Every stage should be run in a fresh process
+    (see `run_stage_subprocess`) so memory kept by the allocator from an earlier stage does
+    not hide the peak of a later one.
+
+    Args:
+        stage_name (str): A key of `get_benchmark_stages`.
+        repeats (int): How many times to run the stage, the fastest run is reported.
+        corpus_label (str): 'source' for the real corpus or a synthetic corpus size.
+
+    Returns:
+        dict: The stage and corpus names, documents, input MB, best seconds, MB/s and peak
+              memory in MB.
+    """
+    input_name, stage = get_benchmark_stages()[stage_name]
+    corpus_path = get_benchmark_corpus_path(corpus_label)
+    documents, text_mb = (
+        pl.scan_parquet(corpus_path)
+        .select(pl.len(), pl.col("text").str.len_bytes().sum() / 1024**2)
+        .collect()
+        .row(0)
+    )
+    stage_input = get_stage_input(input_name, corpus_path)
+    seconds = []
+    with profile_functs.PeakRssSampler() as sampler:
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            stage(stage_input)
+            seconds.append(time.perf_counter() - start_time)
+    best_seconds = min(seconds)
+    return {
+        "stage": stage_name,
+        "corpus": corpus_label,
+        "documents": documents,
+        "input_mb": round(text_mb, 2),
+        "seconds": round(best_seconds, 4),
+        "mb_per_second": round(text_mb / best_seconds, 2),
+        "peak_memory_mb": round(sampler.peak_delta / 1024**2, 2),
+    }
+
+
+def run_stage_subprocess(
+    stage_name: str, repeats: int, corpus_label: str = SOURCE_CORPUS_LABEL
+) -> dict:
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "scripts.benchmark_functions",
+            "stage",
+            stage_name,
+            "--repeats",
+            str(repeats),
+            "--corpus",
+            corpus_label,
+        ],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def print_results(results: list[dict]) -> None:
+    columns = [
+        "stage",
+        "corpus",
+        "documents",
+        "input_mb",
+        "seconds",
+        "mb_per_second",
+        "peak_memory_mb",
+    ]
+    print(" | ".join(columns))
+    for result in results:
+        print(" | ".join(str(result[column]) for column in columns))
+
+
+def benchmark_normalizer(repeats: int) -> list[dict]:
+    """
+    Compares the fused text normalizer with the former multi pass one on the full corpus.
+
+    Both implementations are run in their own process and their outputs are checked to be
+    identical first.
+
+    Args:
+        repeats (int): How many times to run each implementation.
+
+    Returns:
+        list[dict]: The result of each implementation, see `run_stage`.
+    """
+    dta = functs.load_dta()
+    if not get_article_word_count_unfused(dta).equals(functs.get_article_word_count(dta)):
+        raise ValueError("The fused normalizer output differs from the unfused one")
+    del dta
+    results = [
+        run_stage_subprocess(stage_name, repeats)
+        for stage_name in ["normalize_unfused", "normalize_fused"]
+    ]
+    print_results(results)
+    unfused, fused = results
+    print(
+        f"throughput: {fused['mb_per_second'] / unfused['mb_per_second']:.2f}x, "
+        f"peak memory: {fused['peak_memory_mb']} MB vs {unfused['peak_memory_mb']} MB"
+    )
+    return results
+
+
+def get_benchmark_results_path() -> Path:
+    return functs.get_dataframe_dir() / "benchmarks" / BENCHMARK_RESULTS_FILE_NAME
+
+
+def get_git_commit() -> str:
+    completed = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        check=False,
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    return completed.stdout.strip() if completed.returncode == 0 else "unknown"
+
+
+def read_benchmark_results() -> list[dict]:
+    results_path = get_benchmark_results_path()
+    if not results_path.exists():
+        return []
+    with open(results_path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def save_benchmark_results(results: list[dict]) -> None:
+    """
+    Appends the results of a benchmark run to `Dataframes/benchmarks/benchmark_results.jsonl`,
+    each tagged with the time of the run and the git commit it measured.
+    """
+    results_path = get_benchmark_results_path()
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    run_at = datetime.datetime.now().isoformat(timespec="seconds")
+    git_commit = get_git_commit()
+    with open(results_path, "a") as file:
+        file.writelines(
+            json.dumps({"run_at": run_at, "git_commit": git_commit, **result}) + "\n"
+            for result in results
+        )
+
+
+def print_comparison(results: list[dict], previous_results: list[dict]) -> None:
+    """
+    Compares each result with the latest saved result of the same stage and corpus, so a
+    regression between versions shows as a time or memory ratio above 1.
+    """
+    latest_results = {
+        (previous["stage"], previous["corpus"]): previous for previous in previous_results
+    }
+    print("stage | corpus | previous commit | time ratio | peak memory ratio")
+    for result in results:
+        previous = latest_results.get((result["stage"], result["corpus"]))
+        if previous is None:
+            continue
+        time_ratio = result["seconds"] / previous["seconds"] if previous["seconds"] else 0.0
+        memory_ratio = (
+            result["peak_memory_mb"] / previous["peak_memory_mb"]
+            if previous["peak_memory_mb"]
+            else 0.0
+        )
+        print(
+            f"{result['stage']} | {result['corpus']} | {previous['git_commit']} | "
+            f"{time_ratio:.2f}x | {memory_ratio:.2f}x"
+        )
+
+
+def benchmark_suite(
+    corpus_label: str, stage_names: list[str], repeats: int, save: bool = True
+) -> list[dict]:
+    """
+    Runs the benchmark stages on a corpus, each in its own process, and compares them with
+    the saved results of earlier runs.
+
+    Args:
+        corpus_label (str): 'source' for the real corpus or a synthetic corpus size.
+        stage_names (list[str]): The stages to run, keys of `get_benchmark_stages`.
+        repeats (int): How many times to run each stage.
+        save (bool): Append the results to the saved benchmark results.
+
+    Returns:
+        list[dict]: The result of each stage, see `run_stage`.
+    """
+    get_benchmark_corpus_path(corpus_label)
+    results = [
+        run_stage_subprocess(stage_name, repeats, corpus_label) for stage_name in stage_names
+    ]
+    print_results(results)
+    previous_results = read_benchmark_results()
+    if previous_results:
+        print_comparison(results, previous_results)
+    if save:
+        save_benchmark_results(results)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the corpus processing stages.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    normalizer_parser = subparsers.add_parser(
+        "normalizer", help="compare the fused and unfused text normalizers"
+    )
+    normalizer_parser.add_argument("--repeats", type=int, default=3)
+    suite_parser = subparsers.add_parser(
+        "suite", help="run the benchmark stages on a corpus and save the results"
+    )
+    suite_parser.add_argument("--corpus", choices=get_corpus_labels(), default="10k")
+    suite_parser.add_argument(
+        "--stages", nargs="+", choices=get_benchmark_stages().keys(), default=None
+    )
+    suite_parser.add_argument("--repeats", type=int, default=3)
+    suite_parser.add_argument(
+        "--no-save", action="store_true", help="do not append the results to the saved results"
+    )
+    stage_parser = subparsers.add_parser("stage", help="run one stage and print it as json")
+    stage_parser.add_argument("stage_name", choices=get_benchmark_stages().keys())
+    stage_parser.add_argument("--repeats", type=int, default=3)
+    stage_parser.add_argument("--corpus", choices=get_corpus_labels(), default=SOURCE_CORPUS_LABEL)
+    args = parser.parse_args()
+    if args.command == "normalizer":
+        benchmark_normalizer(args.repeats)
+    elif args.command == "suite":
+        stage_names = args.stages or list(get_benchmark_stages().keys())
+        benchmark_suite(args.corpus, stage_names, args.repeats, save=not args.no_save)
+    elif args.command == "stage":
+        print(json.dumps(run_stage(args.stage_name, args.repeats, args.corpus)))
+
+
+if __name__ == "__main__":
+    main()
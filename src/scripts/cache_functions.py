@@ -0,0 +1,238 @@
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import polars as pl
+import streamlit as st
+
+# environment variable overriding the memory budget of the shared result cache in MB
+RESULT_CACHE_BUDGET_ENV_VAR = "RESULT_CACHE_BUDGET_MB"
+DEFAULT_RESULT_CACHE_BUDGET_MB = 256
+# environment variable overriding the memory budget of the shared figure cache in MB
+FIGURE_CACHE_BUDGET_ENV_VAR = "FIGURE_CACHE_BUDGET_MB"
+DEFAULT_FIGURE_CACHE_BUDGET_MB = 64
+# keys of the frames whose contents are identified by the cached results they are built
+# from, by the id of the frame while it is alive (see `set_frame_key`)
+frame_keys = {}
+
+
+def get_result_size(result) -> int:
+    """
+    Estimates the memory held by a cached result in bytes.
+
+    Args:
+        result: A DataFrame, a Series, a string or a tuple or list of them.
+
+    Returns:
+        int: The estimated size in bytes, 0 for anything else.
+    """
+    if isinstance(result, (pl.DataFrame, pl.Series)):
+        return int(result.estimated_size())
+    if isinstance(result, str):
+        return len(result)
+    if isinstance(result, (tuple, list)):
+        return sum(get_result_size(item) for item in result)
+    return 0
+
+
+class ResultCache:
+    """
+    Least recently used cache of query results bounded by their estimated memory size.
+
+    Entries are evicted oldest use first until a new result fits in the budget, and a result
+    larger than the whole budget is not cached. All methods hold a lock, so one instance can be
+    shared by the sessions of the app, which run in separate threads.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key: tuple, result) -> None:
+        result_size = get_result_size(result)
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self.entries.pop(key)[1]
+            if result_size > self.max_bytes:
+                return
+            while self.entries and self.current_bytes + result_size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+            self.entries[key] = (result, result_size)
+            self.current_bytes += result_size
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "size_mb": round(self.current_bytes / 1024**2, 2),
+                "budget_mb": round(self.max_bytes / 1024**2, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+def get_cache_budget_bytes(env_var: str, default_mb: int) -> int:
+    budget_mb = os.environ.get(env_var, default_mb)
+    return int(float(budget_mb) * 1024**2)
+
+
+@st.cache_resource(show_spinner=False)
+def get_result_cache() -> ResultCache:
+    """
+    Returns the result cache shared by every session of the app, sized by the
+    RESULT_CACHE_BUDGET_MB environment variable (256 MB by default).
+    """
+    return ResultCache(
+        get_cache_budget_bytes(RESULT_CACHE_BUDGET_ENV_VAR, DEFAULT_RESULT_CACHE_BUDGET_MB)
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_figure_cache() -> ResultCache:
+    """
+    Returns the cache of serialized figures shared by every session of the app, sized by the
+    FIGURE_CACHE_BUDGET_MB environment variable (64 MB by default).
+    """
+    return ResultCache(
+        get_cache_budget_bytes(FIGURE_CACHE_BUDGET_ENV_VAR, DEFAULT_FIGURE_CACHE_BUDGET_MB)
+    )
+
+
+def normalize_terms(terms: list[str]) -> tuple[str, ...]:
+    """
+    Normalizes a term query so queries with the same counts share a cache entry: terms are
+    matched in lowercase and the order and repeats of the terms do not change their counts.
+
+    Args:
+        terms (list[str]): The terms (or regex patterns) of the query.
+
+    Returns:
+        tuple[str, ...]: The sorted distinct lowercase terms.
+    """
+    return tuple(sorted({term.lower() for term in terms}))
+
+
+def get_result_key(
+    kind: str,
+    corpus_key: str,
+    year_range: tuple[int, int],
+    granularity: str,
+    terms: list[str],
+    count_source: str,
+) -> tuple:
+    """
+    Builds the key of a cached result.
+
+    Args:
+        kind (str): What the result is, e.g. 'term_count'.
+        corpus_key (str): The corpus the result was computed on, see
+                          `corpus_functions.get_corpus_key`.
+        year_range (tuple[int, int]): The first and last year of the included data.
+        granularity (str): The rows of the result, e.g. 'document' or 'month'.
+        terms (list[str]): The terms of the query, normalized with `normalize_terms`.
+        count_source (str): How the counts were computed, see `get_count_source`.
+
+    Returns:
+        tuple: The hashable cache key.
+    """
+    return (
+        kind,
+        corpus_key,
+        tuple(year_range),
+        granularity,
+        normalize_terms(terms),
+        count_source,
+    )
+
+
+def get_count_source(store: dict | None) -> str:
+    """
+    Names how the counts of a result are computed: 'text' for a scan of the text, otherwise
+    the versioned 'source' of the token index, term store or cube they are read from.
+
+    Args:
+        store (dict | None): The token index, term store or cube, None to scan the text.
+
+    Returns:
+        str: The name of the count source.
+    """
+    return "text" if store is None else store["source"]
+
+
+def get_frame_fingerprint(dta: pl.DataFrame) -> str:
+    """
+    Fingerprints the schema and the values of a frame in one pass over its rows, so frames
+    recomputed with the same contents on a rerun share a cache entry.
+
+    Args:
+        dta (pl.DataFrame): Any frame.
+
+    Returns:
+        str: A hex digest that changes with the column names, types, order or any value.
+    """
+    fingerprint = hashlib.blake2b(digest_size=16)
+    fingerprint.update(repr(list(dta.schema.items())).encode())
+    fingerprint.update(str(dta.height).encode())
+    if dta.width > 0:
+        fingerprint.update(dta.hash_rows(seed=0).to_numpy().tobytes())
+    return fingerprint.hexdigest()
+
+
+def set_frame_key(dta: pl.DataFrame, result_key: tuple) -> None:
+    """
+    Identifies a frame by the key of the cached result it is built from and its schema, so
+    `get_frame_key` does not hash its rows. The key is dropped with the frame.
+
+    Args:
+        dta (pl.DataFrame): A frame whose values only depend on the result key and its
+                            columns, e.g. the documents of a year range with their term
+                            counts.
+        result_key (tuple): The key from `get_result_key`.
+    """
+    frame_id = id(dta)
+    frame_keys[frame_id] = (result_key, repr(list(dta.schema.items())))
+    weakref.finalize(dta, frame_keys.pop, frame_id, None)
+
+
+def get_frame_key(dta: pl.DataFrame) -> tuple:
+    """
+    Returns a hashable key of the contents of a frame: the key given with `set_frame_key`,
+    or otherwise its fingerprint (see `get_frame_fingerprint`).
+    """
+    frame_key = frame_keys.get(id(dta))
+    if frame_key is not None:
+        return ("result", frame_key)
+    return ("fingerprint", get_frame_fingerprint(dta))
+
+
+def display_result_cache_stats() -> None:
+    with st.sidebar.expander("Result Cache"):
+        st.write(get_result_cache().get_stats())
+    with st.sidebar.expander("Figure Cache"):
+        st.write(get_figure_cache().get_stats())
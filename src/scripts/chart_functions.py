@@ -0,0 +1,219 @@
+import datetime
+import functools
+import inspect
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+import polars as pl
+
+import scripts.cache_functions as cache_functs
+import scripts.profile_functions as profile_functs
+
+# environment variables overriding the thresholds below
+CHART_WEBGL_POINTS_ENV_VAR = "CHART_WEBGL_POINTS"
+CHART_WEBGL_TRACES_ENV_VAR = "CHART_WEBGL_TRACES"
+CHART_MAX_POINTS_ENV_VAR = "CHART_MAX_POINTS"
+# a figure with more points or more line traces than these is drawn with WebGL (scattergl)
+# traces, which the browser renders on the GPU instead of as one SVG path per trace
+CHART_WEBGL_POINTS = 10_000
+CHART_WEBGL_TRACES = 30
+# the points of a figure sent to the browser, split evenly between its line traces, traces
+# above their share are downsampled with LTTB
+CHART_MAX_POINTS = 50_000
+# a trace is never downsampled below this many points however many traces share the budget
+CHART_MIN_TRACE_POINTS = 100
+
+
+def get_chart_setting(env_var: str, default: int) -> int:
+    return int(os.environ.get(env_var, default))
+
+
+def get_numeric_x(x) -> np.ndarray:
+    """
+    Returns the x values of a trace as numbers for the LTTB triangle areas: dates as
+    nanoseconds, numbers as they are and anything else (e.g. category labels) as their
+    position.
+    """
+    x = np.asarray(x)
+    if x.dtype == object and len(x) > 0 and isinstance(x[0], datetime.date):
+        x = x.astype("datetime64[ns]")
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    if np.issubdtype(x.dtype, np.number):
+        return x.astype(np.float64)
+    return np.arange(len(x), dtype=np.float64)
+
+
+def get_lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Selects the points of a line that keep its shape with the Largest-Triangle-Three-Buckets
+    algorithm.
+
+    The first and last points are kept and the points in between are split into n_out - 2
+    buckets. From each bucket the point forming the largest triangle with the point kept from
+    the previous bucket and the average of the next bucket is kept, so peaks and troughs
+    survive where a stride would skip them.
+
+    Args:
+        x (np.ndarray): The numeric x values, sorted.
+        y (np.ndarray): The y values.
+        n_out (int): The number of points to keep.
+
+    Returns:
+        np.ndarray: The sorted indices of the kept points.
+    """
+    n_points = len(x)
+    if n_out >= n_points or n_out < 3:
+        return np.arange(n_points)
+    # missing values only take part in the selection as zeros, they are still sent as missing
+    y = np.nan_to_num(y.astype(np.float64))
+    bucket_edges = np.linspace(1, n_points - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n_points - 1
+    # the bucket averages do not depend on the kept points, the last bucket is followed by
+    # the last point
+    average_edges = np.append(bucket_edges[1:], n_points)
+    bucket_sizes = np.diff(average_edges)
+    average_x = np.add.reduceat(x, average_edges[:-1]) / bucket_sizes
+    average_y = np.add.reduceat(y, average_edges[:-1]) / bucket_sizes
+    selected = 0
+    for bucket in range(n_out - 2):
+        start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+        areas = np.abs(
+            (x[selected] - average_x[bucket]) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (average_y[bucket] - y[selected])
+        )
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+    return indices
+
+
+def prepare_figure(fig) -> dict:
+    """
+    Bounds what a figure sends to and draws in the browser however many terms or periods it
+    shows.
+
+    The line traces are downsampled with LTTB (see `get_lttb_indices`) to their share of
+    CHART_MAX_POINTS, and when the figure has more than CHART_WEBGL_POINTS points or
+    CHART_WEBGL_TRACES line traces they are replaced by WebGL traces. The thresholds can be
+    set with the CHART_MAX_POINTS, CHART_WEBGL_POINTS and CHART_WEBGL_TRACES environment
+    variables. The figure is changed in place.
+
+    Args:
+        fig: A plotly figure.
+
+    Returns:
+        dict: The number of line 'traces', the 'points' they had, the 'sent_points' after
+              downsampling and whether they are drawn with 'webgl'.
+    """
+    # plotly express already draws traces of more than 1000 points with WebGL
+    line_traces = [
+        trace
+        for trace in fig.data
+        if trace.type in ("scatter", "scattergl") and trace.y is not None
+    ]
+    points = sum(len(trace.y) for trace in line_traces)
+    if not line_traces:
+        return {"traces": 0, "points": 0, "sent_points": 0, "webgl": False}
+    trace_points = max(
+        get_chart_setting(CHART_MAX_POINTS_ENV_VAR, CHART_MAX_POINTS) // len(line_traces),
+        CHART_MIN_TRACE_POINTS,
+    )
+    # the traces of a wide frame share their x values, which are converted once
+    trace_x, numeric_x = None, None
+    for trace in line_traces:
+        if trace.x is None or len(trace.y) <= trace_points:
+            continue
+        if trace_x is None or not np.array_equal(trace.x, trace_x):
+            trace_x, numeric_x = trace.x, get_numeric_x(trace.x)
+        indices = get_lttb_indices(numeric_x, np.asarray(trace.y), trace_points)
+        trace.update(x=np.asarray(trace.x)[indices], y=np.asarray(trace.y)[indices])
+    sent_points = sum(len(trace.y) for trace in line_traces)
+    webgl_points = get_chart_setting(CHART_WEBGL_POINTS_ENV_VAR, CHART_WEBGL_POINTS)
+    webgl_traces = get_chart_setting(CHART_WEBGL_TRACES_ENV_VAR, CHART_WEBGL_TRACES)
+    webgl = points > webgl_points or len(line_traces) > webgl_traces
+    if webgl:
+        # a figure only takes back its own traces, so the converted ones are added anew
+        traces = [
+            go.Scattergl(trace.to_plotly_json(), skip_invalid=True)
+            if trace.type == "scatter" and trace in line_traces
+            else trace
+            for trace in fig.data
+        ]
+        fig.data = []
+        fig.add_traces(traces)
+    profile_functs.record_counter("chart_points_sent", sent_points)
+    return {
+        "traces": len(line_traces),
+        "points": points,
+        "sent_points": sent_points,
+        "webgl": webgl,
+    }
+
+
+def get_argument_key(value):
+    """
+    Turns an argument of a figure builder into a hashable part of its cache key, frames by
+    their key (see `cache_functions.get_frame_key`).
+    """
+    if isinstance(value, pl.DataFrame):
+        return ("frame", cache_functs.get_frame_key(value))
+    if isinstance(value, (list, tuple)):
+        return tuple(get_argument_key(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, get_argument_key(item)) for key, item in value.items()))
+    return value
+
+
+def cached_figure(build_figure):
+    """
+    Caches the figures of a figure builder in the shared figure cache (see
+    `cache_functions.get_figure_cache`), keyed by the builder and the keys of its
+    arguments, so a rerun that does not change the data of a figure (e.g. ticking a
+    "Display Dataframe" checkbox) does not build it again.
+
+    The figure is kept serialized, and a hit returns a new figure read from it, which the
+    caller can change without touching the cache. Anything the builder returns with the
+    figure (its title and frame) is returned as it was. The builder must not change its
+    arguments.
+
+    Args:
+        build_figure: A function returning a figure or a tuple starting with a figure.
+
+    Returns:
+        The function going through the cache.
+    """
+
+    # the builders are wrapped by `profile_functions.timed_stage`, and those of the pages all
+    # run as __main__, so they are told apart by the module, file and name of the function
+    # they wrap
+    builder = inspect.unwrap(build_figure)
+    builder_key = (builder.__module__, builder.__code__.co_filename, builder.__qualname__)
+
+    @functools.wraps(build_figure)
+    def wrapper(*args, **kwargs):
+        figure_cache = cache_functs.get_figure_cache()
+        figure_key = (
+            *builder_key,
+            get_argument_key(args),
+            get_argument_key(kwargs),
+        )
+        cached = figure_cache.get(figure_key)
+        if cached is None:
+            result = build_figure(*args, **kwargs)
+            fig, other_results = (
+                (result[0], result[1:]) if isinstance(result, tuple) else (result, None)
+            )
+            with profile_functs.time_stage("figure_cache"):
+                figure_cache.put(figure_key, (pio.to_json(fig, validate=False), other_results))
+            return result
+        fig_json, other_results = cached
+        with profile_functs.time_stage("figure_cache"):
+            fig = pio.from_json(fig_json)
+        profile_functs.record_counter("figure_cache_hits", 1)
+        return fig if other_results is None else (fig, *other_results)
+
+    return wrapper
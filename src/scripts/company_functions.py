@@ -1,3 +1,6 @@
+import polars as pl
+
+
 def company_colors_dict() -> dict:
     return {
         # TODO: get the colors for each company ideally from their brand identity
@@ -22,3 +25,19 @@ def company_colors_dict() -> dict:
         "Suncor": "#663800",
         "TotalEnergies": "#000000",
     }
+
+
+def get_company_name_dtype(company_names: pl.Series) -> pl.Enum:
+    """
+    Returns the Enum the 'company_name' column is stored as.
+
+    The categories are the companies of `company_colors_dict` and any other company in the
+    data, in alphabetical order, so sorting the column still sorts by name.
+
+    Args:
+        company_names (pl.Series): The company names of the data.
+
+    Returns:
+        pl.Enum: The company name Enum.
+    """
+    return pl.Enum(sorted(set(company_colors_dict()) | set(company_names.unique().to_list())))
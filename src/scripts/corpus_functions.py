@@ -0,0 +1,1094 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from urllib.parse import quote
+
+import polars as pl
+import streamlit as st
+
+import scripts.aggregate_functions as aggregate_functs
+import scripts.company_functions as company_functs
+import scripts.index_functions as index_functs
+import scripts.script_functions as functs
+import scripts.term_functions as term_functs
+
+# bump when the columns written by build_corpus change so older artifacts are rebuilt
+CORPUS_FORMAT_VERSION = 4
+# small row groups so year filters on the date sorted corpus can skip most of the file
+CORPUS_ROW_GROUP_SIZE = 10_000
+SOURCE_FILE_NAME = "combined_oil_company_dta.parquet"
+# directory of the article batches added with `ingest_functions`, read after the source file
+INGESTED_DIR_NAME = "ingested"
+MANIFEST_FILE_NAME = "corpus_manifest.json"
+# the versioned files derived from the source documents, replaced when a new version is
+# written outside of the build command
+DERIVED_FILE_PATTERNS = [
+    "combined_oil_company_corpus_*.parquet",
+    "appended_corpus_*.parquet",
+    "term_vocab_*.parquet",
+    "term_counts_*.parquet",
+    "cube_words_*.parquet",
+    "cube_counts_*.parquet",
+    "token_vocab_*.parquet",
+    "token_postings_*.parquet",
+]
+# the hive partition columns of the partitioned corpus, every company and year is written to
+# its own 'company_name=<company>/year=<year>' directory
+PARTITION_COLS = ["company_name", "year"]
+# environment variable that keeps the raw 'text' out of the in process corpus when set to 1,
+# it is then fetched by document with `get_document_texts`
+LOW_MEMORY_ENV_VAR = "LOW_MEMORY_CORPUS"
+# session state flag set once the missing corpus warning has been shown
+UNBUILT_CORPUS_WARNED_KEY = "unbuilt_corpus_warned"
+
+
+def get_source_path() -> Path:
+    return functs.get_dataframe_dir() / SOURCE_FILE_NAME
+
+
+def get_corpus_dir() -> Path:
+    return functs.get_dataframe_dir() / "corpus"
+
+
+def get_ingested_dir() -> Path:
+    return functs.get_dataframe_dir() / INGESTED_DIR_NAME
+
+
+def get_ingested_paths() -> list[Path]:
+    """
+    Returns the ingested article batches in the order they were added (their file names
+    start with a sequence number, see `ingest_functions.ingest_batches`).
+    """
+    return sorted(get_ingested_dir().glob("batch_*.parquet"))
+
+
+def get_file_hash(file_path: Path) -> str:
+    """
+    Calculates the sha256 hash of a file by reading it in 1 MB chunks.
+
+    Args:
+        file_path (Path): The file to hash.
+
+    Returns:
+        str: The hex digest of the file contents.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_rules_hash() -> str:
+    """
+    Hashes everything that decides how the corpus is derived from the source file: the
+    text cleaning regexes and the corpus format version.
+
+    Returns:
+        str: The hex digest of the cleaning rules.
+    """
+    rules = {
+        "format_version": CORPUS_FORMAT_VERSION,
+        "clean_text_regexes": functs.CLEAN_TEXT_REGEXES,
+    }
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()
+
+
+def add_batch_hash(source_hash: str, batch_hash: str) -> str:
+    return hashlib.sha256(f"{source_hash}:{batch_hash}".encode()).hexdigest()
+
+
+def get_source_hash() -> str:
+    """
+    Hashes the documents the corpus is built from: the source file and then every ingested
+    batch in order, so ingesting a batch gives the same hash as rebuilding with it.
+
+    Returns:
+        str: The hex digest of the source file and ingested batches.
+    """
+    source_hash = get_file_hash(get_source_path())
+    for batch_path in get_ingested_paths():
+        source_hash = add_batch_hash(source_hash, get_file_hash(batch_path))
+    return source_hash
+
+
+def get_corpus_version(source_hash: str, rules_hash: str) -> str:
+    return hashlib.sha256(f"{source_hash}:{rules_hash}".encode()).hexdigest()[:16]
+
+
+def read_manifest() -> dict | None:
+    manifest_path = get_corpus_dir() / MANIFEST_FILE_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def write_manifest(manifest: dict) -> None:
+    manifest_path = get_corpus_dir() / MANIFEST_FILE_NAME
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file, indent=4)
+
+
+def remove_old_files(glob_patterns: list[str], keep_paths: list[Path]) -> None:
+    corpus_dir = get_corpus_dir()
+    for glob_pattern in glob_patterns:
+        for old_path in corpus_dir.glob(glob_pattern):
+            if old_path not in keep_paths:
+                old_path.unlink()
+
+
+def get_documents_paths() -> list[Path]:
+    return [get_source_path(), *get_ingested_paths()]
+
+
+def scan_numbered_documents() -> pl.LazyFrame:
+    """
+    Scans the documents of the source file and the ingested batches and numbers them with a
+    'doc_id' column, which the term store and the other derived files use to refer to
+    documents.
+
+    Documents with missing values are dropped. The documents of the source file are numbered
+    in date order, and the documents of each ingested batch in date order after those of the
+    files before it, so ingesting a batch never renumbers the documents already in the
+    corpus.
+
+    Returns:
+        pl.LazyFrame: The numbered documents with the columns of the source file.
+    """
+    numbered_documents = []
+    first_doc_id = 0
+    for documents_path in get_documents_paths():
+        documents = number_documents(pl.scan_parquet(documents_path), first_doc_id)
+        first_doc_id += documents.select(pl.len()).collect().item()
+        numbered_documents.append(documents)
+    return pl.concat(numbered_documents)
+
+
+def number_documents(dta: pl.LazyFrame, first_doc_id: int) -> pl.LazyFrame:
+    dta = dta.drop_nulls()
+    dta = dta.sort("date", maintain_order=True)
+    return dta.with_row_index("doc_id", offset=first_doc_id)
+
+
+def prepare_corpus(dta: pl.DataFrame) -> pl.DataFrame:
+    """
+    Adds the company and date columns (see `get_company_name_column` and
+    `get_year_month_column`) and the 'clean_text' and 'word_count' columns to the numbered
+    documents and sorts them by date.
+
+    Args:
+        dta (pl.DataFrame): The documents from `scan_numbered_documents`.
+
+    Returns:
+        pl.DataFrame: The corpus.
+    """
+    dta = functs.get_company_name_column(dta)
+    dta = functs.get_year_month_column(dta)
+    dta = functs.get_article_word_count(dta)
+    dta = dta.sort("date", maintain_order=True)
+    return dta
+
+
+def build_corpus(force: bool = False) -> Path:
+    """
+    Builds the preprocessed corpus parquet file used by the pages.
+
+    Loads the documents of the source parquet file and the ingested batches (see
+    `scan_numbered_documents`), prepares the corpus once (see `prepare_corpus`) and writes
+    the result to `Dataframes/corpus/combined_oil_company_corpus_<version>.parquet`. The
+    version is keyed by the hash of the documents (see `get_source_hash`) and of the cleaning
+    rules, so the file is only rebuilt when one of them changes (or when `force` is set). A
+    corpus of the current version written by an ingest, as the files of the corpus it was
+    ingested into and the appended files of the new documents, is kept as it is.
+
+    Args:
+        force (bool): Rebuild the corpus even if the current version already exists.
+
+    Returns:
+        Path: The path of the preprocessed corpus file, the first file of the corpus.
+    """
+    source_path = get_source_path()
+    source_stat = source_path.stat()
+    source_hash = get_source_hash()
+    rules_hash = get_rules_hash()
+    version = get_corpus_version(source_hash, rules_hash)
+    corpus_dir = get_corpus_dir()
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest() or {}
+    if manifest.get("version") == version:
+        corpus_paths = [corpus_dir / file_name for file_name in get_corpus_file_names(manifest)]
+    else:
+        corpus_paths = [corpus_dir / f"combined_oil_company_corpus_{version}.parquet"]
+    if force or not all(corpus_path.exists() for corpus_path in corpus_paths):
+        corpus_paths = [corpus_dir / f"combined_oil_company_corpus_{version}.parquet"]
+        dta = prepare_corpus(scan_numbered_documents().collect())
+        dta.write_parquet(corpus_paths[0], row_group_size=CORPUS_ROW_GROUP_SIZE)
+        print(f"Built corpus version {version} with {dta.height} documents")
+    else:
+        print(f"Corpus version {version} is already up to date")
+    # old versions are never read again once the manifest points to the new one
+    remove_old_files(
+        ["combined_oil_company_corpus_*.parquet", "appended_corpus_*.parquet"], corpus_paths
+    )
+    manifest.update(
+        {
+            "version": version,
+            "corpus_file": corpus_paths[0].name,
+            "appended_corpus_files": [corpus_path.name for corpus_path in corpus_paths[1:]],
+            "source_hash": source_hash,
+            "source_mtime_ns": source_stat.st_mtime_ns,
+            "source_size": source_stat.st_size,
+            "rules_hash": rules_hash,
+            "ingested_batches": [batch_path.name for batch_path in get_ingested_paths()],
+        }
+    )
+    # derived files record the corpus version they were built from and are ignored once it
+    # no longer matches
+    write_manifest(manifest)
+    return corpus_paths[0]
+
+
+def get_corpus_file_names(manifest: dict) -> list[str]:
+    """
+    Returns the files of the corpus of a manifest: the built corpus file and the files
+    appended to it by `ingest_functions.ingest_batches`, in document order.
+    """
+    return [manifest["corpus_file"], *manifest.get("appended_corpus_files", [])]
+
+
+def get_corpus_paths() -> list[Path] | None:
+    """
+    Returns the preprocessed corpus files if they are current.
+
+    Only the manifest is read, the source file stat'ed and the ingested directory listed, so
+    this is cheap enough to call on every rerun. The corpus is treated as stale when the
+    cleaning rules changed, the source file has a different modification time or size than
+    the one it was built from or the ingested batches differ from the ones it holds.
+
+    Returns:
+        list[Path] | None: The paths of the current corpus files (see
+                           `get_corpus_file_names`), which are read together as one corpus,
+                           or None if it needs rebuilding.
+    """
+    manifest = read_manifest()
+    if manifest is None or manifest["rules_hash"] != get_rules_hash():
+        return None
+    source_stat = get_source_path().stat()
+    if (
+        manifest["source_mtime_ns"] != source_stat.st_mtime_ns
+        or manifest["source_size"] != source_stat.st_size
+        or manifest.get("ingested_batches", [])
+        != [batch_path.name for batch_path in get_ingested_paths()]
+    ):
+        return None
+    corpus_paths = [get_corpus_dir() / file_name for file_name in get_corpus_file_names(manifest)]
+    if not all(corpus_path.exists() for corpus_path in corpus_paths):
+        return None
+    return corpus_paths
+
+
+def is_low_memory_mode() -> bool:
+    return os.environ.get(LOW_MEMORY_ENV_VAR, "0") == "1"
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_corpus_cached(corpus_paths: tuple[str, ...], low_memory: bool) -> pl.DataFrame:
+    if low_memory:
+        return pl.scan_parquet(list(corpus_paths)).drop("text").collect()
+    return pl.read_parquet(list(corpus_paths))
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_corpus_unbuilt_cached(
+    source_path: str,
+    file_mtime_ns: int,
+    file_size: int,
+    rules_hash: str,
+    ingested_batches: tuple[str, ...],
+    low_memory: bool,
+) -> pl.DataFrame:
+    dta = prepare_corpus(scan_numbered_documents().collect())
+    if low_memory:
+        # the raw text is released once normalized
+        return dta.drop("text")
+    return dta
+
+
+def load_corpus() -> pl.DataFrame:
+    """
+    Loads the preprocessed corpus with the 'clean_text' and 'word_count' columns.
+
+    Reads the versioned corpus file written by `build_corpus` when it is current. Otherwise
+    the corpus is derived from the source file in process (and cached) so the pages keep
+    working until the build command is run again.
+
+    With LOW_MEMORY_CORPUS=1 the raw 'text' is never read from the corpus file, or released
+    right after normalization when the corpus is derived in process, so each worker only
+    holds 'clean_text'. Use `get_document_texts` for the original text of a few documents.
+
+    Returns:
+        pl.DataFrame: The corpus with date, 'clean_text' and 'word_count' columns.
+    """
+    corpus_paths = get_corpus_paths()
+    if corpus_paths is not None:
+        return load_corpus_cached(tuple(map(str, corpus_paths)), is_low_memory_mode())
+    # the pages keep working from the source file, the warning is only shown once per session
+    if not st.session_state.get(UNBUILT_CORPUS_WARNED_KEY, False):
+        st.session_state[UNBUILT_CORPUS_WARNED_KEY] = True
+        st.warning(
+            "The preprocessed corpus is missing or stale, it is derived from the source file "
+            "until it is built with: python -m scripts.corpus_functions build"
+        )
+    source_path = get_source_path()
+    source_stat = source_path.stat()
+    return load_corpus_unbuilt_cached(
+        str(source_path),
+        source_stat.st_mtime_ns,
+        source_stat.st_size,
+        get_rules_hash(),
+        tuple(batch_path.name for batch_path in get_ingested_paths()),
+        is_low_memory_mode(),
+    )
+
+
+def scan_corpus_files(corpus_paths: list[Path]) -> pl.LazyFrame:
+    """
+    Scans the files of the corpus (see `get_corpus_paths`) as one lazy corpus.
+
+    A corpus of one file is scanned directly, so filters and column selections are pushed
+    down into the parquet reader. With appended files, polars cannot stack the files when a
+    filter leaves one of them empty, so the filters are applied after reading each file and
+    only the column selections reach the reader. Lookups of a few documents or years that
+    need the row groups skipped read the files one by one instead (see `read_corpus_files`).
+
+    Args:
+        corpus_paths (list[Path]): The corpus files.
+
+    Returns:
+        pl.LazyFrame: The lazy corpus.
+    """
+    if len(corpus_paths) == 1:
+        return pl.scan_parquet(corpus_paths[0])
+    return pl.concat(
+        [
+            pl.scan_parquet(corpus_path).map_batches(
+                lambda dta: dta, predicate_pushdown=False, streamable=True
+            )
+            for corpus_path in corpus_paths
+        ]
+    )
+
+
+def read_corpus_files(
+    corpus_paths: list[Path], predicate: pl.Expr, columns: list[str]
+) -> pl.DataFrame:
+    """
+    Reads the rows of the corpus files (see `get_corpus_paths`) that match a filter, one
+    file at a time so the filter is pushed down into the reader of each and skips the row
+    groups without a match.
+
+    The columns are put back in the given order, as polars returns those of a filtered file
+    in file order, and the 'company_name' of a file without a match comes back as a
+    Categorical, so it is cast to the Enum of the first file.
+
+    Args:
+        corpus_paths (list[Path]): The corpus files.
+        predicate (pl.Expr): The filter of the rows, e.g. on 'doc_id' or 'year'.
+        columns (list[str]): The columns to read.
+
+    Returns:
+        pl.DataFrame: The matching rows in file order.
+    """
+    company_name_dtype = pl.read_parquet(corpus_paths[0], columns=["company_name"], n_rows=1)[
+        "company_name"
+    ].dtype
+    return pl.concat(
+        [
+            pl.scan_parquet(corpus_path)
+            .filter(predicate)
+            .select(columns)
+            .collect()
+            .select(columns)
+            .with_columns(pl.col("^company_name$").cast(company_name_dtype))
+            for corpus_path in corpus_paths
+        ]
+    )
+
+
+def scan_corpus() -> pl.LazyFrame:
+    """
+    Scans the preprocessed corpus lazily so pages only decode what they use.
+
+    Column selections and the year filter applied to the returned LazyFrame are pushed down
+    into the parquet reader, so only the needed columns and row groups are read when the
+    page collects its result. Without current corpus files the in process cached corpus
+    from `load_corpus` is scanned instead.
+
+    Returns:
+        pl.LazyFrame: The lazy corpus with date, 'clean_text' and 'word_count' columns.
+    """
+    corpus_paths = get_corpus_paths()
+    if corpus_paths is not None:
+        return scan_corpus_files(corpus_paths)
+    return load_corpus().lazy()
+
+
+def get_corpus_key() -> str:
+    """
+    Returns a key identifying the corpus the pages currently read, for caches of results
+    computed on it: the version of the current corpus file, or otherwise the source file it
+    is derived from in process.
+    """
+    if get_corpus_paths() is not None:
+        return read_manifest()["version"]
+    source_stat = get_source_path().stat()
+    return (
+        f"unbuilt:{source_stat.st_mtime_ns}:{source_stat.st_size}:{get_rules_hash()}:"
+        f"{len(get_ingested_paths())}"
+    )
+
+
+def get_document_texts(doc_ids: list[int]) -> pl.DataFrame:
+    """
+    Fetches the original 'text' of documents by their 'doc_id', for features that show the
+    raw text (e.g. snippets) when the corpus is held without it.
+
+    Reads only the 'doc_id' and 'text' columns of the corpus files, whose row groups are
+    skipped unless they hold one of the documents (see `read_corpus_files`). Without current
+    corpus files the texts
+    come from the in process corpus, or in low memory mode from the source file and the
+    ingested batches (see `scan_numbered_documents`).
+
+    Args:
+        doc_ids (list[int]): The ids of the documents.
+
+    Returns:
+        pl.DataFrame: The 'doc_id' and 'text' of the documents, sorted by 'doc_id'.
+    """
+    corpus_paths = get_corpus_paths()
+    if corpus_paths is not None:
+        dta_text = read_corpus_files(
+            corpus_paths, pl.col("doc_id").is_in(doc_ids), ["doc_id", "text"]
+        ).lazy()
+    elif not is_low_memory_mode():
+        dta_text = load_corpus().lazy().select("doc_id", "text")
+    else:
+        dta_text = scan_numbered_documents().select("doc_id", "text")
+    return dta_text.filter(pl.col("doc_id").is_in(doc_ids)).sort("doc_id").collect()
+
+
+def get_partition_path(partitioned_dir: Path, company_name: str, year: int) -> Path:
+    return (
+        partitioned_dir
+        / f"company_name={quote(company_name, safe='')}"
+        / f"year={year}"
+        / "part-0.parquet"
+    )
+
+
+def build_partitioned_corpus(force: bool = False) -> Path:
+    """
+    Rewrites the current corpus into a hive partitioned dataset with one parquet file per
+    company and year (see PARTITION_COLS), so narrow views only read the files of the
+    companies and years they show (see `scan_corpus_partitions`).
+
+    The partition columns are only stored in the directory names. The dataset has the same
+    version as the corpus it is written from and the manifest lists every partition with
+    its rows and bytes.
+
+    Args:
+        force (bool): Rewrite the dataset even if the current version already exists.
+
+    Returns:
+        Path: The directory of the partitioned corpus.
+    """
+    corpus_paths = get_corpus_paths()
+    if corpus_paths is None:
+        raise FileNotFoundError("Build the corpus before partitioning it")
+    manifest = read_manifest()
+    version = manifest["version"]
+    corpus_dir = get_corpus_dir()
+    partitioned_dir = corpus_dir / f"partitioned_corpus_{version}"
+    partitioned_corpus = manifest.get("partitioned_corpus")
+    if (
+        force
+        or partitioned_corpus is None
+        or partitioned_corpus["version"] != version
+        or not partitioned_dir.exists()
+    ):
+        shutil.rmtree(partitioned_dir, ignore_errors=True)
+        dta = pl.read_parquet(corpus_paths)
+        partitions = []
+        for (company_name, year), dta_partition in sorted(
+            dta.partition_by(PARTITION_COLS, as_dict=True, maintain_order=True).items()
+        ):
+            partition_path = get_partition_path(partitioned_dir, company_name, year)
+            partition_path.parent.mkdir(parents=True)
+            dta_partition.drop(PARTITION_COLS).write_parquet(
+                partition_path, row_group_size=CORPUS_ROW_GROUP_SIZE
+            )
+            partitions.append(
+                {
+                    "company_name": company_name,
+                    "year": year,
+                    "file": partition_path.relative_to(partitioned_dir).as_posix(),
+                    "rows": dta_partition.height,
+                    "bytes": partition_path.stat().st_size,
+                }
+            )
+        partitioned_corpus = {
+            "version": version,
+            "dir": partitioned_dir.name,
+            "columns": dta.columns,
+            "partitions": partitions,
+        }
+        print(
+            f"Partitioned corpus version {version} into {len(partitions)} company x year partitions"
+        )
+    else:
+        print(f"Partitioned corpus version {version} is already up to date")
+    for old_partitioned_dir in corpus_dir.glob("partitioned_corpus_*"):
+        if old_partitioned_dir != partitioned_dir:
+            shutil.rmtree(old_partitioned_dir)
+    manifest["partitioned_corpus"] = partitioned_corpus
+    write_manifest(manifest)
+    return partitioned_dir
+
+
+def add_partitioned_documents(partitioned_corpus: dict, dta_new: pl.DataFrame) -> Path:
+    """
+    Adds new documents to the partitioned corpus of the previous corpus version and moves it
+    to the current version, rewriting only the partitions of the companies and years of the
+    new documents. The other partitions are kept as they are, so the cost follows the
+    partitions a batch touches rather than the corpus.
+
+    Args:
+        partitioned_corpus (dict): The manifest entry of the partitioned corpus before the
+                                   documents were added (see `get_partitioned_corpus`).
+        dta_new (pl.DataFrame): The new documents with the columns of the corpus.
+
+    Returns:
+        Path: The directory of the partitioned corpus.
+    """
+    manifest = read_manifest()
+    version = manifest["version"]
+    corpus_dir = get_corpus_dir()
+    partitioned_dir = corpus_dir / f"partitioned_corpus_{version}"
+    (corpus_dir / partitioned_corpus["dir"]).rename(partitioned_dir)
+    partitions = {
+        (partition["company_name"], partition["year"]): partition
+        for partition in partitioned_corpus["partitions"]
+    }
+    dta_new = dta_new.select(partitioned_corpus["columns"])
+    for (company_name, year), dta_partition in dta_new.partition_by(
+        PARTITION_COLS, as_dict=True, maintain_order=True
+    ).items():
+        partition_path = get_partition_path(partitioned_dir, company_name, year)
+        dta_partition = dta_partition.drop(PARTITION_COLS)
+        if partition_path.exists():
+            dta_partition = pl.concat([pl.read_parquet(partition_path), dta_partition]).sort(
+                "date", maintain_order=True
+            )
+        else:
+            partition_path.parent.mkdir(parents=True)
+        dta_partition.write_parquet(partition_path, row_group_size=CORPUS_ROW_GROUP_SIZE)
+        partitions[(company_name, year)] = {
+            "company_name": company_name,
+            "year": year,
+            "file": partition_path.relative_to(partitioned_dir).as_posix(),
+            "rows": dta_partition.height,
+            "bytes": partition_path.stat().st_size,
+        }
+    manifest["partitioned_corpus"] = {
+        "version": version,
+        "dir": partitioned_dir.name,
+        "columns": partitioned_corpus["columns"],
+        "partitions": [partitions[partition_key] for partition_key in sorted(partitions)],
+    }
+    write_manifest(manifest)
+    print(
+        f"Added {dta_new.height} documents to {dta_new.select(PARTITION_COLS).n_unique()} "
+        "company x year partitions"
+    )
+    return partitioned_dir
+
+
+def get_partitioned_corpus() -> dict | None:
+    """
+    Returns the manifest entry of the partitioned corpus if it matches the current corpus.
+
+    Returns:
+        dict | None: The 'version', 'dir', 'columns' and 'partitions' of the partitioned
+                     corpus, or None if it is missing or stale.
+    """
+    if get_corpus_paths() is None:
+        return None
+    manifest = read_manifest()
+    partitioned_corpus = manifest.get("partitioned_corpus")
+    if (
+        partitioned_corpus is None
+        or partitioned_corpus["version"] != manifest["version"]
+        or not (get_corpus_dir() / partitioned_corpus["dir"]).exists()
+    ):
+        return None
+    return partitioned_corpus
+
+
+def select_partitions(
+    partitions: list[dict],
+    companies: list[str] | None = None,
+    year_range: tuple[int, int] | None = None,
+) -> list[dict]:
+    """
+    Prunes the partitions of the partitioned corpus to the given companies and years.
+
+    Args:
+        partitions (list[dict]): The 'partitions' of `get_partitioned_corpus`.
+        companies (list[str] | None): The companies to keep, None for every company.
+        year_range (tuple[int, int] | None): The first and last year to keep, None for every
+                                             year.
+
+    Returns:
+        list[dict]: The partitions of the selected companies and years.
+    """
+    return [
+        partition
+        for partition in partitions
+        if (companies is None or partition["company_name"] in companies)
+        and (year_range is None or year_range[0] <= partition["year"] <= year_range[1])
+    ]
+
+
+def scan_corpus_partitions(
+    companies: list[str] | None = None, year_range: tuple[int, int] | None = None
+) -> pl.LazyFrame:
+    """
+    Scans the corpus of the given companies and years, reading only their partitions.
+
+    The partitions are pruned from the manifest (see `select_partitions`) before anything is
+    read, so e.g. BP and Exxon for 2015 to 2020 only open those 12 files. The rows come in
+    company, year and then date order, with the columns and dtypes of `scan_corpus`. Without
+    a current partitioned corpus the companies and years are filtered from `scan_corpus`,
+    where the year filter still skips row groups of the date sorted file.
+
+    Args:
+        companies (list[str] | None): The companies to read, None for every company.
+        year_range (tuple[int, int] | None): The first and last year to read, None for every
+                                             year.
+
+    Returns:
+        pl.LazyFrame: The lazy corpus of the selected companies and years.
+    """
+    partitioned_corpus = get_partitioned_corpus()
+    if partitioned_corpus is None:
+        dta = scan_corpus()
+        if companies is not None:
+            dta = dta.filter(pl.col("company_name").is_in(companies))
+        if year_range is not None:
+            dta = dta.filter(pl.col("year").is_between(*year_range))
+        return dta
+    partitioned_dir = get_corpus_dir() / partitioned_corpus["dir"]
+    all_partitions = partitioned_corpus["partitions"]
+    partitions = select_partitions(all_partitions, companies, year_range)
+    dta = pl.scan_parquet(
+        # a schema is still needed when nothing is selected
+        [partitioned_dir / partition["file"] for partition in partitions or all_partitions[:1]],
+        hive_partitioning=True,
+        hive_schema={"company_name": pl.Utf8, "year": pl.Int16},
+    )
+    company_name_dtype = company_functs.get_company_name_dtype(
+        pl.Series([partition["company_name"] for partition in all_partitions])
+    )
+    dta = dta.with_columns(pl.col("company_name").cast(company_name_dtype))
+    dta = dta.select(partitioned_corpus["columns"])
+    if not partitions:
+        return dta.clear()
+    return dta
+
+
+def get_partition_read_share(
+    companies: list[str] | None = None, year_range: tuple[int, int] | None = None
+) -> float | None:
+    """
+    Returns the share of the partitioned corpus bytes `scan_corpus_partitions` reads for the
+    given companies and years, or None without a current partitioned corpus.
+    """
+    partitioned_corpus = get_partitioned_corpus()
+    if partitioned_corpus is None:
+        return None
+    partitions = partitioned_corpus["partitions"]
+    total_bytes = sum(partition["bytes"] for partition in partitions)
+    selected_bytes = sum(
+        partition["bytes"] for partition in select_partitions(partitions, companies, year_range)
+    )
+    return selected_bytes / total_bytes
+
+
+def get_term_store_version(corpus_version: str, dictionary_hash: str) -> str:
+    return hashlib.sha256(f"{corpus_version}:{dictionary_hash}".encode()).hexdigest()[:16]
+
+
+def build_term_store(force: bool = False) -> tuple[Path, Path]:
+    """
+    Builds the sparse document x term count store next to the current corpus.
+
+    Writes the vocabulary of `term_functions.get_term_vocab` and the non zero counts of
+    `term_functions.build_term_counts` for every term and dictionary of
+    `create_dictionary_dicts`. The store version is keyed by the corpus version and the hash
+    of the dictionaries, so it is rebuilt when either changes (or when `force` is set).
+
+    Args:
+        force (bool): Rebuild the store even if the current version already exists.
+
+    Returns:
+        tuple[Path, Path]: The paths of the vocabulary and the counts files.
+    """
+    corpus_paths = get_corpus_paths()
+    if corpus_paths is None:
+        raise FileNotFoundError("Build the corpus before the term store")
+    manifest = read_manifest()
+    dictionary_dicts = functs.create_dictionary_dicts()
+    dictionary_hash = term_functs.get_dictionary_hash(dictionary_dicts)
+    version = get_term_store_version(manifest["version"], dictionary_hash)
+    corpus_dir = get_corpus_dir()
+    vocab_path = corpus_dir / f"term_vocab_{version}.parquet"
+    counts_path = corpus_dir / f"term_counts_{version}.parquet"
+    if force or not vocab_path.exists() or not counts_path.exists():
+        term_vocab = term_functs.get_term_vocab(dictionary_dicts)
+        dta = pl.read_parquet(corpus_paths, columns=["doc_id", "clean_text"])
+        term_counts = term_functs.build_term_counts(dta, term_vocab)
+        term_vocab.write_parquet(vocab_path)
+        term_counts.write_parquet(counts_path)
+        print(
+            f"Built term store version {version} with {term_vocab.height} terms and "
+            f"{term_counts.height} non zero counts"
+        )
+    else:
+        print(f"Term store version {version} is already up to date")
+    for old_store_path in [
+        *corpus_dir.glob("term_vocab_*.parquet"),
+        *corpus_dir.glob("term_counts_*.parquet"),
+    ]:
+        if old_store_path not in (vocab_path, counts_path):
+            old_store_path.unlink()
+    manifest["term_store"] = {
+        "version": version,
+        "corpus_version": manifest["version"],
+        "dictionary_hash": dictionary_hash,
+        "vocab_file": vocab_path.name,
+        "counts_file": counts_path.name,
+    }
+    write_manifest(manifest)
+    return vocab_path, counts_path
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_term_store_cached(version: str, vocab_path: str, counts_path: str) -> dict:
+    return {
+        "source": f"term_store_{version}",
+        "key": "doc_id",
+        "vocab": pl.read_parquet(vocab_path),
+        "counts": pl.read_parquet(counts_path),
+    }
+
+
+def load_term_store() -> dict | None:
+    """
+    Loads the sparse term store if it matches the current corpus and dictionaries.
+
+    Returns:
+        dict | None: A dictionary with the 'key' column ('doc_id') and the 'vocab' and 'counts'
+                     DataFrames (see `term_functions.build_term_counts`), or None if the store
+                     is missing or stale, in which case the term counts have to be computed
+                     from the text.
+    """
+    if get_corpus_paths() is None:
+        return None
+    manifest = read_manifest()
+    term_store = manifest.get("term_store")
+    if (
+        term_store is None
+        or term_store["corpus_version"] != manifest["version"]
+        or term_store["dictionary_hash"]
+        != term_functs.get_dictionary_hash(functs.create_dictionary_dicts())
+    ):
+        return None
+    vocab_path = get_corpus_dir() / term_store["vocab_file"]
+    counts_path = get_corpus_dir() / term_store["counts_file"]
+    if not vocab_path.exists() or not counts_path.exists():
+        return None
+    return load_term_store_cached(term_store["version"], str(vocab_path), str(counts_path))
+
+
+def get_cube_version(term_store_version: str) -> str:
+    cube_key = f"{term_store_version}:{aggregate_functs.CUBE_FORMAT_VERSION}"
+    return hashlib.sha256(cube_key.encode()).hexdigest()[:16]
+
+
+def build_cube(force: bool = False) -> tuple[Path, Path]:
+    """
+    Builds the company x week of month cube (see `aggregate_functions.build_cube`) from the current
+    corpus and term store. The cube version is keyed by the version of the term store it is
+    built from and the cube format version.
+
+    Args:
+        force (bool): Rebuild the cube even if the current version already exists.
+
+    Returns:
+        tuple[Path, Path]: The paths of the cube words and counts files.
+    """
+    term_store = load_term_store()
+    if term_store is None:
+        raise FileNotFoundError("Build the corpus and the term store before the cube")
+    manifest = read_manifest()
+    version = get_cube_version(manifest["term_store"]["version"])
+    corpus_dir = get_corpus_dir()
+    words_path = corpus_dir / f"cube_words_{version}.parquet"
+    counts_path = corpus_dir / f"cube_counts_{version}.parquet"
+    if force or not words_path.exists() or not counts_path.exists():
+        dta = pl.read_parquet(
+            get_corpus_paths(),
+            columns=[
+                "doc_id",
+                "company_name",
+                "date",
+                "year_month_dt",
+                "year",
+                "year_dt",
+                "month",
+                "word_count",
+            ],
+        )
+        cube_words, cube_counts = aggregate_functs.build_cube(dta, term_store["counts"])
+        cube_words.write_parquet(words_path)
+        cube_counts.write_parquet(counts_path)
+        print(
+            f"Built cube version {version} with {cube_words.height} company x week of month "
+            f"cells and {cube_counts.height} non zero counts"
+        )
+    else:
+        print(f"Cube version {version} is already up to date")
+    for old_cube_path in [
+        *corpus_dir.glob("cube_words_*.parquet"),
+        *corpus_dir.glob("cube_counts_*.parquet"),
+    ]:
+        if old_cube_path not in (words_path, counts_path):
+            old_cube_path.unlink()
+    manifest["cube"] = {
+        "version": version,
+        "words_file": words_path.name,
+        "counts_file": counts_path.name,
+    }
+    write_manifest(manifest)
+    return words_path, counts_path
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_cube_cached(version: str, words_path: str, counts_path: str, vocab_path: str) -> dict:
+    return {
+        "source": f"cube_{version}",
+        "key": "cell_id",
+        "vocab": pl.read_parquet(vocab_path),
+        "counts": pl.read_parquet(counts_path),
+        "words": pl.read_parquet(words_path),
+    }
+
+
+def load_cube() -> dict | None:
+    """
+    Loads the company x week of month cube if it matches the current term store.
+
+    Returns:
+        dict | None: A term store like dictionary keyed by 'cell_id' with the 'vocab',
+                     'counts' and 'words' DataFrames, or None if the cube is missing or stale.
+    """
+    if load_term_store() is None:
+        return None
+    manifest = read_manifest()
+    cube = manifest.get("cube")
+    if cube is None or cube["version"] != get_cube_version(manifest["term_store"]["version"]):
+        return None
+    words_path = get_corpus_dir() / cube["words_file"]
+    counts_path = get_corpus_dir() / cube["counts_file"]
+    vocab_path = get_corpus_dir() / manifest["term_store"]["vocab_file"]
+    if not words_path.exists() or not counts_path.exists():
+        return None
+    return load_cube_cached(cube["version"], str(words_path), str(counts_path), str(vocab_path))
+
+
+def scan_term_count_source(col_names: list[str]) -> tuple[pl.LazyFrame, dict | None]:
+    """
+    Returns the rows the dictionary pages count terms on and the store to read them from.
+
+    Prefers the company x week of month cube, whose cells add up to the same graphs as the
+    documents and are bounded by the number of companies and weeks however many documents
+    there are. Without a current cube the documents are used with the sparse term store, and
+    without a store with their 'clean_text' so the counts are scanned from the text.
+
+    Args:
+        col_names (list[str]): The columns the page needs besides the term counts, any of
+                               'company_name', the date columns and 'word_count'.
+
+    Returns:
+        tuple[pl.LazyFrame, dict | None]: The lazy rows and the store to pass to the term
+                                          count functions (None to scan the text).
+    """
+    cube = load_cube()
+    if cube is not None:
+        return cube["words"].lazy().select(pl.col(["cell_id", *col_names])), cube
+    term_store = load_term_store()
+    if term_store is not None:
+        return scan_corpus().select(pl.col(["doc_id", *col_names])), term_store
+    return scan_corpus().select(pl.col([*col_names, "clean_text"])), None
+
+
+def build_token_index(force: bool = False) -> tuple[Path, Path]:
+    """
+    Builds the positional token index (see `index_functions.build_token_postings`) of the
+    current corpus. The index has the same version as the corpus it is built from.
+
+    Args:
+        force (bool): Rebuild the index even if the current version already exists.
+
+    Returns:
+        tuple[Path, Path]: The paths of the token vocabulary and the postings files.
+    """
+    corpus_paths = get_corpus_paths()
+    if corpus_paths is None:
+        raise FileNotFoundError("Build the corpus before the token index")
+    manifest = read_manifest()
+    version = manifest["version"]
+    corpus_dir = get_corpus_dir()
+    vocab_path = corpus_dir / f"token_vocab_{version}.parquet"
+    postings_path = corpus_dir / f"token_postings_{version}.parquet"
+    if force or not vocab_path.exists() or not postings_path.exists():
+        dta = pl.read_parquet(corpus_paths, columns=["doc_id", "clean_text"])
+        token_vocab = index_functs.get_token_vocab(dta)
+        token_postings = index_functs.build_token_postings(dta, token_vocab)
+        token_vocab.write_parquet(vocab_path)
+        token_postings.write_parquet(
+            postings_path, row_group_size=index_functs.TOKEN_INDEX_ROW_GROUP_SIZE
+        )
+        print(
+            f"Built token index version {version} with {token_vocab.height} tokens and "
+            f"{token_postings.height} postings"
+        )
+    else:
+        print(f"Token index version {version} is already up to date")
+    for old_index_path in [
+        *corpus_dir.glob("token_vocab_*.parquet"),
+        *corpus_dir.glob("token_postings_*.parquet"),
+    ]:
+        if old_index_path not in (vocab_path, postings_path):
+            old_index_path.unlink()
+    manifest["token_index"] = {
+        "version": version,
+        "vocab_file": vocab_path.name,
+        "postings_file": postings_path.name,
+    }
+    write_manifest(manifest)
+    return vocab_path, postings_path
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_token_index_cached(
+    version: str, vocab_path: str, postings_path: str, corpus_paths: tuple[str, ...]
+) -> dict:
+    return {
+        "source": f"token_index_{version}",
+        "vocab": pl.read_parquet(vocab_path),
+        "postings_path": postings_path,
+        "corpus_paths": list(corpus_paths),
+    }
+
+
+def load_token_index() -> dict | None:
+    """
+    Loads the positional token index if it matches the current corpus.
+
+    Only the vocabulary is read, the postings are scanned per query for the tokens it needs.
+
+    Returns:
+        dict | None: A dictionary with the 'vocab' DataFrame, the 'postings_path' and
+                     'corpus_paths' files and the versioned 'source' name of the index (see
+                     `cache_functions.get_count_source`), or None if the index is missing or
+                     stale.
+    """
+    corpus_paths = get_corpus_paths()
+    if corpus_paths is None:
+        return None
+    manifest = read_manifest()
+    token_index = manifest.get("token_index")
+    if token_index is None or token_index["version"] != manifest["version"]:
+        return None
+    vocab_path = get_corpus_dir() / token_index["vocab_file"]
+    postings_path = get_corpus_dir() / token_index["postings_file"]
+    if not vocab_path.exists() or not postings_path.exists():
+        return None
+    return load_token_index_cached(
+        token_index["version"],
+        str(vocab_path),
+        str(postings_path),
+        tuple(map(str, corpus_paths)),
+    )
+
+
+def scan_term_query_source(
+    col_names: list[str], year_range: tuple[int, int] | None = None
+) -> tuple[pl.LazyFrame, dict | None]:
+    """
+    Returns the documents the free text term queries are counted on and the token index to
+    count them with.
+
+    The documents of the selected years are scanned with `scan_corpus_partitions`, so only
+    the partitions of those years are read when the partitioned corpus is current, with
+    their 'doc_id', and without a current token index also with their 'clean_text' so the
+    terms are scanned from the text.
+
+    Args:
+        col_names (list[str]): The columns the page needs besides the term counts.
+        year_range (tuple[int, int] | None): The first and last year to read, None for every
+                                             year.
+
+    Returns:
+        tuple[pl.LazyFrame, dict | None]: The lazy documents and the token index to pass to
+                                          `get_term_count` (None to scan the text).
+    """
+    token_index = load_token_index()
+    dta = scan_corpus_partitions(year_range=year_range)
+    if token_index is not None:
+        return dta.select(pl.col(["doc_id", *col_names])), token_index
+    return dta.select(pl.col(["doc_id", *col_names, "clean_text"])), None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the preprocessed oil company corpus.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser(
+        "build", help="build the preprocessed corpus, term store, cube and token index files"
+    )
+    build_parser.add_argument(
+        "--force", action="store_true", help="rebuild even if the corpus is up to date"
+    )
+    partition_parser = subparsers.add_parser(
+        "partition", help="rewrite the corpus into a company x year hive partitioned dataset"
+    )
+    partition_parser.add_argument(
+        "--force", action="store_true", help="rewrite even if the dataset is up to date"
+    )
+    args = parser.parse_args()
+    if args.command == "build":
+        build_corpus(force=args.force)
+        build_term_store(force=args.force)
+        build_cube(force=args.force)
+        build_token_index(force=args.force)
+    elif args.command == "partition":
+        build_partitioned_corpus(force=args.force)
+
+
+if __name__ == "__main__":
+    main()
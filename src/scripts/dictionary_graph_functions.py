@@ -0,0 +1,337 @@
+import plotly.express as px
+import polars as pl
+import streamlit as st
+
+import scripts.aggregate_functions as aggregate_functs
+import scripts.cache_functions as cache_functs
+import scripts.chart_functions as chart_functs
+import scripts.company_functions as company_functs
+import scripts.corpus_functions as corpus_functs
+import scripts.profile_functions as profile_functs
+import scripts.script_functions as functs
+import scripts.term_functions as term_functs
+import scripts.viewer_functions as viewer_functs
+
+
+def get_dictionary_counts(
+    dta: pl.DataFrame, dictionary_dicts: dict, term_store: dict | None, rows_key: tuple
+) -> tuple[pl.DataFrame, list[str], dict]:
+    """
+    Counts the dictionaries in the given rows and sums the word and dictionary counts by
+    company and week of month, the finest grain of the dictionary graphs.
+
+    The result is kept in the shared result cache, so switching granularity or page only
+    rolls the cached totals up (see `aggregate_functions.rollup_to_granularity`).
+
+    Args:
+        dta (pl.DataFrame): The rows from `corpus_functions.scan_term_count_source` with
+                            'company_name', 'date' and 'word_count' columns.
+        dictionary_dicts (dict): The dictionaries from `create_dictionary_dicts`.
+        term_store (dict | None): The store returned with the rows.
+        rows_key (tuple): The corpus key and year range of the rows.
+
+    Returns:
+        tuple[pl.DataFrame, list[str], dict]: The company x week of month totals, the
+                                              dictionary count columns and their colors.
+    """
+    result_cache = cache_functs.get_result_cache()
+    result_key = cache_functs.get_result_key(
+        "dictionary_counts",
+        *rows_key,
+        "week_of_month",
+        [term_functs.get_dictionary_hash(dictionary_dicts)],
+        cache_functs.get_count_source(term_store),
+    )
+    dictionary_counts = result_cache.get(result_key)
+    if dictionary_counts is None:
+        dta, term_col_names, term_col_colors = functs.get_dicts_combined_term_count(
+            dta, dictionary_dicts, term_store
+        )
+        with profile_functs.time_stage("aggregation"):
+            dta = aggregate_functs.get_fine_grain_totals(dta, ["word_count", *term_col_names])
+        dictionary_counts = (dta, term_col_names, term_col_colors)
+        result_cache.put(result_key, dictionary_counts)
+    dta, term_col_names, term_col_colors = dictionary_counts
+    # the graph functions extend the column list they are given
+    return dta, list(term_col_names), dict(term_col_colors)
+
+
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
+def graph_terms_by_date_raw_count(
+    fig_dta: pl.DataFrame, term_col_names: list[str], term_col_colors, period_col: str
+):
+    fig_title = "Terms by Date Raw Count (All Companies)"
+    col_names = term_col_names.copy()
+    col_names.append(period_col)
+    fig_dta = fig_dta.select(pl.col(col_names))
+    fig_dta = fig_dta.group_by(pl.col(period_col)).sum().sort(period_col)
+    fig = px.line(
+        fig_dta,
+        x=period_col,
+        y=term_col_names,
+        title=fig_title,
+        color_discrete_map=term_col_colors,
+    )
+    return fig, fig_title, fig_dta
+
+
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
+def graph_terms_by_date_raw_count_companies(
+    fig_dta: pl.DataFrame,
+    term_col_names: list[str],
+    term_col_colors,
+    companies_selection: list[str],
+    period_col: str,
+):
+    companies_selection_string = ", ".join(companies_selection)
+    fig_title = f"Terms by Date Raw Count ({companies_selection_string})"
+    col_names = term_col_names.copy()
+    col_names.append(period_col)
+    fig_dta = fig_dta.select(pl.col(col_names))
+    fig_dta = fig_dta.group_by(pl.col(period_col)).sum().sort(period_col)
+    fig = px.line(
+        fig_dta,
+        x=period_col,
+        y=term_col_names,
+        color_discrete_map=term_col_colors,
+        title=fig_title,
+    )
+    return fig, fig_title, fig_dta
+
+
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
+def graph_terms_by_date_prop(
+    fig_dta: pl.DataFrame, term_col_names: list[str], term_col_colors: dict, period_col: str
+):
+    fig_title = "Terms by Date Proportion of Words (All Companies)"
+    col_names = term_col_names.copy()
+    col_names.append(period_col)
+    col_names.append("word_count")
+    fig_dta = fig_dta.select(pl.col(col_names))
+    fig_dta = fig_dta.group_by(pl.col(period_col)).sum().sort(period_col)
+    for term in term_col_names:
+        fig_dta = fig_dta.with_columns(
+            (pl.col(term) / pl.col("word_count")).alias(f"{term.replace('_count', '_prop')}")
+        )
+    fig = px.line(
+        fig_dta,
+        x=period_col,
+        y=term_col_names,
+        color_discrete_map=term_col_colors,
+        title=fig_title,
+    )
+    return fig, fig_title, fig_dta
+
+
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
+def graph_terms_by_date_prop_companies(
+    fig_dta: pl.DataFrame,
+    term_col_names: list[str],
+    term_col_colors: dict,
+    companies_selection: list[str],
+    period_col: str,
+):
+    companies_selection_string = ", ".join(companies_selection)
+    fig_title = f"Terms by Date Proportion of Words ({companies_selection_string})"
+    col_names = term_col_names.copy()
+    col_names.append(period_col)
+    col_names.append("word_count")
+    col_names.append("company_name")
+    fig_dta = fig_dta.filter(pl.col("company_name").is_in(companies_selection))
+    fig_dta = fig_dta.select(pl.col(col_names))
+    fig_dta = fig_dta.group_by(pl.col(period_col)).sum().sort(period_col)
+    for term in term_col_names:
+        fig_dta = fig_dta.with_columns(
+            (pl.col(term) / pl.col("word_count")).alias(f"{term.replace('_count', '_prop')}")
+        )
+    fig = px.line(
+        fig_dta,
+        x=period_col,
+        y=term_col_names,
+        color_discrete_map=term_col_colors,
+        title=fig_title,
+    )
+    return fig, fig_title, fig_dta
+
+
+@chart_functs.cached_figure
+@profile_functs.timed_stage("figure_build")
+def graph_terms_by_date_prop_select_companies_dictionary(
+    fig_dta: pl.DataFrame,
+    term_col_names: list[str],
+    term_col_colors: dict,
+    companies_selection: list[str],
+    dict_selection_label: str,
+    granularity: str,
+):
+    period_col = aggregate_functs.GRANULARITIES[granularity]["period_col"]
+    period_label = aggregate_functs.GRANULARITIES[granularity]["label"]
+    companies_selection_string = ", ".join(companies_selection)
+    fig_title = f"Terms by Date Proportion of Words in {dict_selection_label} Dictionary ({companies_selection_string})"
+    col_names = term_col_names.copy()
+    col_names.append(period_col)
+    col_names.append("word_count")
+    col_names.append("company_name")
+    fig_dta = fig_dta.filter(pl.col("company_name").is_in(companies_selection))
+    fig_dta = fig_dta.select(pl.col(col_names))
+    fig_dta = fig_dta.group_by(pl.col(period_col), pl.col("company_name")).sum().sort(period_col)
+    for term in term_col_names:
+        fig_dta = fig_dta.with_columns(
+            (pl.col(term) / pl.col("word_count")).alias(f"{term.replace('_count', '_prop')}")
+        )
+    fig = px.line(
+        fig_dta,
+        x=period_col,
+        y=fig_dta[dict_selection_label],
+        color=fig_dta["company_name"],
+        color_discrete_map=company_functs.company_colors_dict(),
+        title=fig_title,
+    )
+    fig.update_yaxes(title_text="Proportion of Words in Dictionary")
+    fig.update_xaxes(title_text=f"Date by {period_label}")
+    return fig, fig_title, fig_dta
+
+
+def display_graph_dta(fig_dta, fig_title):
+    chart_display = st.checkbox(f"Display Dataframe for {fig_title}?")
+    if chart_display:
+        st.write(f"#### {fig_title} Dataframe")
+        viewer_functs.display_frame_viewer(fig_dta, fig_title)
+        st.write(f"Dataframe shape: {fig_dta.shape}")
+
+
+@st.fragment
+@profile_functs.profiled_section("companies terms chart")
+def display_companies_terms_section(
+    dta: pl.DataFrame,
+    term_col_names: list[str],
+    term_col_colors: dict,
+    period_col: str,
+    raw_counts_selection: bool,
+) -> None:
+    """
+    Displays the terms chart of the selected companies as a section that reruns on its own,
+    so selecting companies only rebuilds this chart.
+    """
+    companies_selection = st.segmented_control(
+        label="Select Companies to Include in Line Graphs",
+        options=dta["company_name"].unique().sort().to_list(),
+        selection_mode="multi",
+    )
+    if raw_counts_selection:
+        fig, fig_title, fig_dta = graph_terms_by_date_raw_count_companies(  # todo:
+            dta, term_col_names, term_col_colors, companies_selection, period_col
+        )
+    else:
+        fig, fig_title, fig_dta = graph_terms_by_date_prop_companies(  # todo:
+            dta, term_col_names, term_col_colors, companies_selection, period_col
+        )
+    functs.display_chart(fig)
+    display_graph_dta(fig_dta, fig_title)
+
+
+@st.fragment
+@profile_functs.profiled_section("companies by dictionary chart")
+def display_companies_dictionary_section(
+    dta: pl.DataFrame,
+    dictionary_dicts: dict,
+    term_col_names: list[str],
+    term_col_colors: dict,
+    granularity: str,
+) -> None:
+    """
+    Displays the chart of one dictionary by company as a section that reruns on its own, so
+    selecting companies or a dictionary only rebuilds this chart.
+    """
+    st.write("### Companies by Dictionary Selection (Proportion of Words)")
+    companies_selection = st.segmented_control(
+        label="Select Companies to Include in Line Graphs",
+        options=dta["company_name"].unique().sort().to_list(),
+        selection_mode="multi",
+        key="prop_companies_dict_selection",
+        default=["BP", "Exxon"],
+    )
+    dict_selection = st.segmented_control(
+        label="Select Dictionary to Include in Line Graph",
+        options=dictionary_dicts.keys(),
+        selection_mode="single",
+        key="prop_dictionary_selection",
+        default=["CLIMATE CHANGE"],
+    )
+    dict_selection_label = dictionary_dicts[dict_selection]["label"]
+    fig, fig_title, fig_dta = graph_terms_by_date_prop_select_companies_dictionary(
+        dta, term_col_names, term_col_colors, companies_selection, dict_selection_label, granularity
+    )
+    functs.display_chart(fig)
+    display_graph_dta(fig_dta, fig_title)
+
+
+def select_granularity(default_granularity: str) -> str:
+    granularities = list(aggregate_functs.GRANULARITIES.keys())
+    return st.sidebar.selectbox(
+        label="Select a time granularity:",
+        options=granularities,
+        index=granularities.index(default_granularity),
+        format_func=lambda granularity: aggregate_functs.GRANULARITIES[granularity]["label"],
+    )
+
+
+def display_dictionary_graphs_page(page_title: str, default_granularity: str) -> None:
+    """
+    Runs a dictionary graphs page: the dictionary counts are computed once per corpus and
+    year range at the company x week of month grain (see `get_dictionary_counts`) and rolled
+    up to the week, month, quarter or year selected in the sidebar. The charts are sections
+    that rerun on their own with the rolled up counts of the last page rerun when their
+    widgets change.
+
+    Args:
+        page_title (str): The title of the page.
+        default_granularity (str): The key of `aggregate_functions.GRANULARITIES` selected
+                                   when the page opens.
+    """
+    functs.set_page_configs(page_title)
+    profile_functs.start_page_profile(page_title)
+    dictionary_dicts = functs.create_dictionary_dicts()
+    dict_key, dict_label, dict_terms, dict_terms_colors = functs.select_dictionary(dictionary_dicts)
+    granularity = select_granularity(default_granularity)
+    period_col = aggregate_functs.GRANULARITIES[granularity]["period_col"]
+
+    with profile_functs.time_stage("load"):
+        dta, term_store = corpus_functs.scan_term_count_source(
+            ["company_name", "year", "date", "word_count"]
+        )
+    with profile_functs.time_stage("year_filter"):
+        dta = functs.get_year_selection_filter_bar(dta).collect()
+    profile_functs.record_frame("year_filter", dta)
+    year_range = (dta["year"].min(), dta["year"].max())
+    rows_key = (corpus_functs.get_corpus_key(), year_range)
+    dta, term_col_names, term_col_colors = get_dictionary_counts(
+        dta, dictionary_dicts, term_store, rows_key
+    )
+    with profile_functs.time_stage("aggregation"):
+        dta = aggregate_functs.rollup_to_granularity(dta, granularity)
+    raw_counts_selection = st.checkbox("Show Raw Counts?", value=False)
+    if raw_counts_selection:
+        fig, fig_title, fig_dta = graph_terms_by_date_raw_count(
+            dta, term_col_names, term_col_colors, period_col
+        )
+    else:
+        fig, fig_title, fig_dta = graph_terms_by_date_prop(
+            dta, term_col_names, term_col_colors, period_col
+        )  # todo:
+    functs.display_chart_section(fig, fig_title, fig_dta)
+    display_companies_terms_section(
+        dta, term_col_names, term_col_colors, period_col, raw_counts_selection
+    )
+    display_companies_dictionary_section(
+        dta, dictionary_dicts, term_col_names, term_col_colors, granularity
+    )
+    cache_functs.display_result_cache_stats()
+
+    profile_functs.finish_page_profile()
+    st.sidebar.write(functs.print_updated_time())  # PROGRESSTRACKING:
+    print(functs.print_updated_time())  # PROGRESSTRACKING:
@@ -0,0 +1,379 @@
+import re
+
+import polars as pl
+
+import scripts.term_functions as term_functs
+
+# documents tokenized per batch when building the postings, bounds the exploded intermediate
+TOKEN_INDEX_BATCH_SIZE = 10_000
+# small row groups so a query only decodes the postings of the row groups holding its tokens
+TOKEN_INDEX_ROW_GROUP_SIZE = 50_000
+# a query the index can answer: lowercase tokens of 'clean_text' separated by single spaces
+INDEXED_TERM_REGEX = re.compile(r"[a-z0-9]+( [a-z0-9]+)*")
+
+
+def get_document_tokens(dta: pl.DataFrame) -> pl.DataFrame:
+    """
+    Splits the 'clean_text' of each document into one row per token with its position.
+
+    Args:
+        dta (pl.DataFrame): The corpus with 'doc_id' and 'clean_text' columns.
+
+    Returns:
+        pl.DataFrame: The tokens with 'doc_id', 'token' and 'position' columns.
+    """
+    return (
+        dta.select("doc_id", pl.col("clean_text").str.split(" ").alias("token"))
+        .explode("token")
+        .with_columns(pl.int_range(pl.len(), dtype=pl.UInt32).over("doc_id").alias("position"))
+        .filter(pl.col("token") != "")
+    )
+
+
+def get_token_vocab(dta: pl.DataFrame) -> pl.DataFrame:
+    """
+    Builds the sorted vocabulary of the tokens of the corpus.
+
+    Args:
+        dta (pl.DataFrame): The corpus with 'doc_id' and 'clean_text' columns.
+
+    Returns:
+        pl.DataFrame: The vocabulary with 'token_id' and 'token' columns.
+    """
+    batch_tokens = [
+        get_document_tokens(dta_batch).select(pl.col("token").unique())
+        for dta_batch in dta.select("doc_id", "clean_text").iter_slices(TOKEN_INDEX_BATCH_SIZE)
+    ]
+    if not batch_tokens:
+        return pl.DataFrame(schema={"token_id": pl.UInt32, "token": pl.Utf8})
+    return pl.concat(batch_tokens).unique().sort("token").with_row_index("token_id")
+
+
+def build_token_postings(dta: pl.DataFrame, token_vocab: pl.DataFrame) -> pl.DataFrame:
+    """
+    Builds the positional postings of every token in the corpus.
+
+    Each row holds the positions of one token in one document. Rows are sorted by 'token_id'
+    and then 'doc_id', so the postings of a token are contiguous and a query only has to read
+    the row groups holding its tokens. Documents are tokenized in batches of
+    TOKEN_INDEX_BATCH_SIZE to bound the exploded intermediate.
+
+    Args:
+        dta (pl.DataFrame): The corpus with 'doc_id' and 'clean_text' columns.
+        token_vocab (pl.DataFrame): The vocabulary from `get_token_vocab`.
+
+    Returns:
+        pl.DataFrame: The postings with 'token_id', 'doc_id' and 'positions' columns.
+    """
+    postings = []
+    for dta_batch in dta.select("doc_id", "clean_text").iter_slices(TOKEN_INDEX_BATCH_SIZE):
+        postings.append(
+            get_document_tokens(dta_batch)
+            .join(token_vocab, on="token", how="inner")
+            .group_by("token_id", "doc_id")
+            .agg(pl.col("position").sort().alias("positions"))
+        )
+    if not postings:
+        return pl.DataFrame(
+            schema={
+                "token_id": pl.UInt32,
+                "doc_id": pl.UInt32,
+                "positions": pl.List(pl.UInt32),
+            }
+        )
+    return pl.concat(postings).sort("token_id", "doc_id")
+
+
+def extend_token_index(
+    token_vocab: pl.DataFrame, token_postings: pl.DataFrame, dta: pl.DataFrame
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Adds new documents to a token index, tokenizing only the new documents.
+
+    The tokens of the new documents are merged into the sorted vocabulary and the postings
+    of the existing documents are moved to the renumbered token ids, so the result is the
+    index `get_token_vocab` and `build_token_postings` build from all the documents.
+
+    Args:
+        token_vocab (pl.DataFrame): The vocabulary of the existing index.
+        token_postings (pl.DataFrame): The postings of the existing index.
+        dta (pl.DataFrame): The new documents with 'doc_id' and 'clean_text' columns.
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame]: The merged vocabulary and postings.
+    """
+    merged_vocab = (
+        pl.concat([token_vocab.select("token"), get_token_vocab(dta).select("token")])
+        .unique()
+        .sort("token")
+        .with_row_index("token_id")
+    )
+    token_ids = token_vocab.join(
+        merged_vocab.rename({"token_id": "merged_token_id"}), on="token", how="inner"
+    ).select("token_id", "merged_token_id")
+    token_postings = token_postings.join(token_ids, on="token_id", how="inner").select(
+        pl.col("merged_token_id").alias("token_id"), "doc_id", "positions"
+    )
+    merged_postings = pl.concat([token_postings, build_token_postings(dta, merged_vocab)]).sort(
+        "token_id", "doc_id"
+    )
+    return merged_vocab, merged_postings
+
+
+def is_indexed_term(term: str) -> bool:
+    return INDEXED_TERM_REGEX.fullmatch(term.lower()) is not None
+
+
+def count_non_overlapping(starts: list[tuple[int, bool]], phrase_length: int) -> int:
+    """
+    Counts the occurrences of a phrase in a document that do not overlap an earlier counted
+    one, like the left to right matching of `str.count_matches`.
+
+    Args:
+        starts (list[tuple[int, bool]]): The start of each occurrence and whether its first
+                                         word can also end an earlier occurrence (see
+                                         `get_phrase_starts`).
+        phrase_length (int): The number of words of the phrase.
+
+    Returns:
+        int: The number of occurrences counted.
+    """
+    count = 0
+    last_start = None
+    for start, shares_first_word in sorted(starts):
+        if last_start is not None and (
+            start < last_start + phrase_length - 1
+            or (start == last_start + phrase_length - 1 and not shares_first_word)
+        ):
+            continue
+        count += 1
+        last_start = start
+    return count
+
+
+def get_term_word_matches(token_vocab: pl.DataFrame, term: str) -> list[pl.DataFrame]:
+    """
+    Finds the words of the vocabulary that each word of a term can match.
+
+    Terms are matched as substrings of 'clean_text', like the text scan of
+    `term_functions.count_terms`. As the words of the text are separated by single spaces, a
+    single word term matches inside any word, and the first word of a phrase matches the end
+    of a word, its last word the start of a word and the words in between whole words.
+
+    Args:
+        token_vocab (pl.DataFrame): The vocabulary with 'token_id' and 'token' columns.
+        term (str): A term for which `is_indexed_term` is True.
+
+    Returns:
+        list[pl.DataFrame]: For each word of the term, the 'token_id' and 'token' of the
+                            words it matches.
+    """
+    words = term.lower().split(" ")
+    if len(words) == 1:
+        return [token_vocab.filter(pl.col("token").str.contains(words[0], literal=True))]
+    return [
+        token_vocab.filter(
+            pl.col("token").str.ends_with(word)
+            if offset == 0
+            else pl.col("token").str.starts_with(word)
+            if offset == len(words) - 1
+            else pl.col("token") == word
+        )
+        for offset, word in enumerate(words)
+    ]
+
+
+def get_phrase_starts(token_index: dict, term: str) -> pl.DataFrame:
+    """
+    Finds every occurrence of a word or phrase from the positional index.
+
+    The words of the term are matched as in the text (see `get_term_word_matches`) and the
+    positions of the words matching each word of a phrase are intersected, shifted by their
+    offset in the phrase, so only the postings of those words are read. Every occurrence is
+    returned, including those overlapping an earlier one, and a word holding a single word
+    term more than once is one occurrence.
+
+    Args:
+        token_index (dict): The index from `corpus_functions.load_token_index`.
+        term (str): A term for which `is_indexed_term` is True.
+
+    Returns:
+        pl.DataFrame: The 'doc_id' and Int64 'start' (the position of the first word in the
+                      split 'clean_text') of each occurrence, and for a phrase whether its
+                      first word is long enough to also hold the last word of the phrase
+                      ending an earlier occurrence without overlapping it
+                      ('shares_first_word').
+    """
+    words = term.lower().split(" ")
+    word_matches = get_term_word_matches(token_index["vocab"], term)
+    if any(matches.is_empty() for matches in word_matches):
+        return pl.DataFrame(
+            schema={"doc_id": pl.UInt32, "start": pl.Int64, "shares_first_word": pl.Boolean}
+        )
+    token_ids = pl.concat([matches["token_id"] for matches in word_matches]).unique()
+    postings = (
+        pl.scan_parquet(token_index["postings_path"])
+        .filter(pl.col("token_id").is_in(token_ids.to_list()))
+        .collect()
+    )
+    shared_length = len(words[0]) + len(words[-1])
+    phrase_starts = None
+    for offset, matches in enumerate(word_matches):
+        word_starts = (
+            postings.join(matches, on="token_id", how="semi")
+            .explode("positions")
+            .select("doc_id", (pl.col("positions").cast(pl.Int64) - offset).alias("start"))
+        )
+        if phrase_starts is None:
+            phrase_starts = (
+                postings.join(matches, on="token_id", how="inner")
+                .explode("positions")
+                .select(
+                    "doc_id",
+                    pl.col("positions").cast(pl.Int64).alias("start"),
+                    (pl.col("token").str.len_chars() >= shared_length).alias("shares_first_word"),
+                )
+            )
+        else:
+            phrase_starts = phrase_starts.join(word_starts, on=["doc_id", "start"], how="inner")
+    return phrase_starts
+
+
+def get_phrase_counts(token_index: dict, term: str) -> pl.DataFrame:
+    """
+    Counts the occurrences of a word or phrase in every document from the positional index,
+    with the same counts as the text scan of `term_functions.count_terms`.
+
+    A single word is counted from the length of the postings of the words holding it, times
+    the number of times they hold it, and a phrase from its occurrences (see
+    `get_phrase_starts`). Occurrences of a phrase that overlap an earlier one (e.g. "a a" in
+    "a a a") are not counted again, like `str.count_matches`.
+
+    Args:
+        token_index (dict): The index from `corpus_functions.load_token_index`.
+        term (str): A term for which `is_indexed_term` is True.
+
+    Returns:
+        pl.DataFrame: The 'doc_id' and Int32 'count' of the documents containing the term.
+    """
+    words = term.lower().split(" ")
+    if len(words) == 1:
+        word_matches = get_term_word_matches(token_index["vocab"], term)[0].select(
+            "token_id", pl.col("token").str.count_matches(words[0], literal=True).alias("matches")
+        )
+        return (
+            pl.scan_parquet(token_index["postings_path"])
+            .filter(pl.col("token_id").is_in(word_matches["token_id"].to_list()))
+            .join(word_matches.lazy(), on="token_id", how="inner")
+            .group_by("doc_id")
+            .agg(
+                (pl.col("positions").list.len() * pl.col("matches"))
+                .sum()
+                .cast(pl.Int32)
+                .alias("count")
+            )
+            .collect()
+        )
+    phrase_length = len(words)
+    phrase_starts = get_phrase_starts(token_index, term).sort("doc_id", "start")
+    # an occurrence starting before the end of the previous one may not be counted, the
+    # documents without any are counted from their number of occurrences
+    overlaps_previous = (pl.col("start") - pl.col("start").shift(1).over("doc_id")) < (
+        phrase_length - 1
+    ) + pl.col("shares_first_word").not_().cast(pl.Int64)
+    phrase_starts = phrase_starts.with_columns(
+        overlaps_previous.fill_null(False).alias("has_overlap")
+    ).with_columns(pl.col("has_overlap").any().over("doc_id"))
+    counts = (
+        phrase_starts.filter(pl.col("has_overlap").not_())
+        .group_by("doc_id")
+        .agg(pl.len().cast(pl.Int32).alias("count"))
+    )
+    overlapping_counts = pl.DataFrame(
+        [
+            (doc_id, count_non_overlapping(list(zip(starts, shares_first_word)), phrase_length))
+            for doc_id, starts, shares_first_word in phrase_starts.filter("has_overlap")
+            .group_by("doc_id")
+            .agg("start", "shares_first_word")
+            .rows()
+        ],
+        schema={"doc_id": pl.UInt32, "count": pl.Int32},
+        orient="row",
+    )
+    return pl.concat([counts, overlapping_counts])
+
+
+def get_indexed_term_counts(
+    dta: pl.DataFrame, token_index: dict, count_cols: dict[str, str]
+) -> pl.DataFrame:
+    """
+    Counts the occurrences of each term in the documents of `dta` from the positional index.
+
+    Words and phrases are matched as substrings of the text, with the same counts as the
+    text scan (see `get_phrase_counts`), so the counts do not depend on whether the index
+    was built. Terms that are not plain words (regex patterns or terms with punctuation)
+    fall back to the text scan of `term_functions.plan_term_counts` on the 'clean_text' of
+    the documents, which is read from the corpus file for just those documents when `dta`
+    does not hold it.
+
+    Args:
+        dta (pl.DataFrame): The documents with a 'doc_id' column.
+        token_index (dict): The index from `corpus_functions.load_token_index`.
+        count_cols (dict[str, str]): Maps each count column to the term (or regex pattern)
+                                     it counts.
+
+    Returns:
+        pl.DataFrame: The 'doc_id' of the documents and their Int32 count columns.
+    """
+    term_counts = dta.select("doc_id")
+    for count_col, term in count_cols.items():
+        if is_indexed_term(term):
+            term_counts = term_counts.join(
+                get_phrase_counts(token_index, term).rename({"count": count_col}),
+                on="doc_id",
+                how="left",
+            )
+    scanned_cols = {
+        count_col: term for count_col, term in count_cols.items() if not is_indexed_term(term)
+    }
+    if scanned_cols:
+        if "clean_text" in dta.columns:
+            dta_text = dta.select("doc_id", "clean_text")
+        else:
+            dta_text = (
+                pl.scan_parquet(token_index["corpus_paths"])
+                .select("doc_id", "clean_text")
+                .join(dta.lazy().select("doc_id"), on="doc_id", how="semi")
+                .collect()
+            )
+        scanned_counts = term_functs.count_planned_terms(
+            dta_text, term_functs.plan_term_counts(scanned_cols)
+        )
+        term_counts = term_counts.join(
+            scanned_counts.select("doc_id", *scanned_cols), on="doc_id", how="left"
+        )
+    return term_counts.select(
+        "doc_id", *(pl.col(count_col).fill_null(0).cast(pl.Int32) for count_col in count_cols)
+    )
+
+
+def count_indexed_terms(dta: pl.DataFrame, token_index: dict, terms: list[str]) -> pl.DataFrame:
+    """
+    Counts the occurrences of each term in the documents of `dta` from the positional index,
+    see `get_indexed_term_counts`.
+
+    Args:
+        dta (pl.DataFrame): The documents with a 'doc_id' column.
+        token_index (dict): The index from `corpus_functions.load_token_index`.
+        terms (list[str]): The terms (or regex patterns) to count.
+
+    Returns:
+        pl.DataFrame: The DataFrame with one Int32 count column per term, named after the
+                      term (replacing a column of the same name).
+    """
+    count_cols = term_functs.get_count_cols(terms)
+    return term_functs.join_term_counts(
+        dta,
+        get_indexed_term_counts(dta, token_index, count_cols),
+        {f"{term}": count_col for count_col, term in count_cols.items()},
+    )
@@ -0,0 +1,252 @@
+import argparse
+from pathlib import Path
+
+import polars as pl
+
+import scripts.aggregate_functions as aggregate_functs
+import scripts.company_functions as company_functs
+import scripts.corpus_functions as corpus_functs
+import scripts.index_functions as index_functs
+import scripts.script_functions as functs
+import scripts.term_functions as term_functs
+
+
+def get_batch_paths(paths: list[str]) -> list[Path]:
+    """
+    Expands the given files and directories into the parquet files to ingest, the files of a
+    directory in name order.
+    """
+    batch_paths = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            batch_paths.extend(sorted(path.glob("*.parquet")))
+        else:
+            batch_paths.append(path)
+    return batch_paths
+
+
+def read_new_documents(batch_paths: list[Path], corpus_paths: list[Path]) -> pl.DataFrame:
+    """
+    Reads article batches and keeps the documents that are not in the corpus yet.
+
+    Documents with missing values are dropped and a document is identified by its
+    'source_url': only the first document of each 'source_url' in the batches is kept, and
+    only if the corpus does not hold it already, so ingesting the same batch twice adds
+    nothing the second time.
+
+    Args:
+        batch_paths (list[Path]): Parquet files with the columns of the source file.
+        corpus_paths (list[Path]): The current corpus files.
+
+    Returns:
+        pl.DataFrame: The new documents with the columns of the source file.
+    """
+    dta = (
+        pl.concat(
+            [
+                pl.scan_parquet(batch_path).select(
+                    pl.col("company_name").cast(pl.Utf8),
+                    pl.col("date").cast(pl.Date),
+                    "text",
+                    "source_url",
+                )
+                for batch_path in batch_paths
+            ]
+        )
+        .drop_nulls()
+        .unique(subset="source_url", keep="first", maintain_order=True)
+        .join(
+            pl.scan_parquet(corpus_paths).select("source_url"),
+            on="source_url",
+            how="anti",
+        )
+        .collect()
+    )
+    return dta
+
+
+def write_ingested_batch(dta: pl.DataFrame) -> Path:
+    """
+    Writes new documents to the next batch of the ingested directory, which
+    `corpus_functions.build_corpus` reads after the source file. The file name holds a
+    sequence number and the hash of its contents.
+    """
+    ingested_dir = corpus_functs.get_ingested_dir()
+    ingested_dir.mkdir(parents=True, exist_ok=True)
+    batch_number = len(corpus_functs.get_ingested_paths()) + 1
+    pending_path = ingested_dir / f"pending_{batch_number:05d}.parquet"
+    dta.write_parquet(pending_path)
+    batch_hash = corpus_functs.get_file_hash(pending_path)
+    batch_path = ingested_dir / f"batch_{batch_number:05d}_{batch_hash[:16]}.parquet"
+    pending_path.rename(batch_path)
+    return batch_path
+
+
+def ingest_batches(batch_paths: list[Path]) -> Path | None:
+    """
+    Adds article batches to the corpus and to the files derived from it, normalizing,
+    counting and indexing only the new documents.
+
+    The new documents (see `read_new_documents`) are written to the ingested directory and
+    numbered after the documents of the corpus. They are appended to the corpus as a file of
+    their own (see `corpus_functions.get_corpus_paths`), so the files already in the corpus
+    are neither read nor rewritten, unless the batches hold a company the corpus has not
+    seen, which changes the 'company_name' Enum of every document and rewrites the corpus
+    into one file. The term store, the cube and the token index are merged with the rows of
+    the new documents. Everything is written under the versions `corpus_functions.build`
+    gives it when it builds from scratch with the new batch, and with the same rows, so the
+    build command afterwards finds them up to date. Only the partitions of the companies and
+    years of the new documents are rewritten in a current partitioned corpus (see
+    `corpus_functions.add_partitioned_documents`). Derived files that are missing or stale
+    before the ingest are left to the build and partition commands.
+
+    Args:
+        batch_paths (list[Path]): Parquet files with the columns of the source file.
+
+    Returns:
+        Path | None: The path of the corpus file holding the new documents, or None if the
+                     batches hold no new documents.
+    """
+    corpus_paths = corpus_functs.get_corpus_paths()
+    if corpus_paths is None:
+        raise FileNotFoundError("Build the corpus before ingesting article batches")
+    term_store = corpus_functs.load_term_store()
+    cube = corpus_functs.load_cube()
+    token_index = corpus_functs.load_token_index()
+    partitioned_corpus = corpus_functs.get_partitioned_corpus()
+    manifest = corpus_functs.read_manifest()
+
+    dta_new = read_new_documents(batch_paths, corpus_paths)
+    if dta_new.is_empty():
+        print("No new documents to ingest")
+        return None
+    batch_path = write_ingested_batch(dta_new)
+    # the row count and the company Enum are read from the parquet metadata and first row
+    first_doc_id = pl.scan_parquet(corpus_paths).select(pl.len()).collect().item()
+    corpus_head = pl.read_parquet(corpus_paths[0], n_rows=1)
+    dta_new = corpus_functs.number_documents(dta_new.lazy(), first_doc_id).collect()
+    dta_new = functs.get_year_month_column(dta_new)
+    dta_new = functs.get_article_word_count(dta_new)
+    corpus_company_dtype = corpus_head.schema["company_name"]
+    company_name_dtype = company_functs.get_company_name_dtype(
+        pl.concat([corpus_company_dtype.categories, dta_new["company_name"]])
+    )
+    dta_new = (
+        dta_new.with_columns(pl.col("company_name").cast(company_name_dtype))
+        .select(corpus_head.columns)
+        .sort("date", maintain_order=True)
+    )
+
+    corpus_dir = corpus_functs.get_corpus_dir()
+    source_hash = corpus_functs.add_batch_hash(
+        manifest["source_hash"], corpus_functs.get_file_hash(batch_path)
+    )
+    version = corpus_functs.get_corpus_version(source_hash, manifest["rules_hash"])
+    if company_name_dtype == corpus_company_dtype:
+        new_corpus_path = corpus_dir / f"appended_corpus_{version}.parquet"
+        dta_new.write_parquet(new_corpus_path, row_group_size=corpus_functs.CORPUS_ROW_GROUP_SIZE)
+        new_corpus_paths = [*corpus_paths, new_corpus_path]
+    else:
+        new_corpus_path = corpus_dir / f"combined_oil_company_corpus_{version}.parquet"
+        pl.concat(
+            [
+                pl.read_parquet(corpus_paths).with_columns(
+                    pl.col("company_name").cast(pl.Utf8).cast(company_name_dtype)
+                ),
+                dta_new,
+            ]
+        ).sort("date", maintain_order=True).write_parquet(
+            new_corpus_path, row_group_size=corpus_functs.CORPUS_ROW_GROUP_SIZE
+        )
+        new_corpus_paths = [new_corpus_path]
+        print("Rewrote the corpus for the new companies of the batches")
+    dta_new = dta_new.sort("doc_id")
+    manifest.update(
+        {
+            "version": version,
+            "corpus_file": new_corpus_paths[0].name,
+            "appended_corpus_files": [path.name for path in new_corpus_paths[1:]],
+            "source_hash": source_hash,
+            "ingested_batches": [path.name for path in corpus_functs.get_ingested_paths()],
+        }
+    )
+    keep_paths = list(new_corpus_paths)
+    print(f"Ingested {dta_new.height} documents into corpus version {version}")
+
+    if term_store is not None:
+        new_term_counts = term_functs.build_term_counts(dta_new, term_store["vocab"])
+        dictionary_hash = manifest["term_store"]["dictionary_hash"]
+        term_store_version = corpus_functs.get_term_store_version(version, dictionary_hash)
+        vocab_path = corpus_dir / f"term_vocab_{term_store_version}.parquet"
+        counts_path = corpus_dir / f"term_counts_{term_store_version}.parquet"
+        term_store["vocab"].write_parquet(vocab_path)
+        pl.concat([term_store["counts"], new_term_counts]).write_parquet(counts_path)
+        manifest["term_store"] = {
+            "version": term_store_version,
+            "corpus_version": version,
+            "dictionary_hash": dictionary_hash,
+            "vocab_file": vocab_path.name,
+            "counts_file": counts_path.name,
+        }
+        keep_paths.extend([vocab_path, counts_path])
+        print(f"Added {new_term_counts.height} non zero counts to the term store")
+        if cube is not None:
+            cube_words, cube_counts = aggregate_functs.merge_cube(
+                cube["words"], cube["counts"], dta_new, new_term_counts
+            )
+            cube_version = corpus_functs.get_cube_version(term_store_version)
+            words_path = corpus_dir / f"cube_words_{cube_version}.parquet"
+            cube_counts_path = corpus_dir / f"cube_counts_{cube_version}.parquet"
+            cube_words.write_parquet(words_path)
+            cube_counts.write_parquet(cube_counts_path)
+            manifest["cube"] = {
+                "version": cube_version,
+                "words_file": words_path.name,
+                "counts_file": cube_counts_path.name,
+            }
+            keep_paths.extend([words_path, cube_counts_path])
+            print(f"Merged the cube into {cube_words.height} company x week of month cells")
+
+    if token_index is not None:
+        token_vocab, token_postings = index_functs.extend_token_index(
+            token_index["vocab"], pl.read_parquet(token_index["postings_path"]), dta_new
+        )
+        token_vocab_path = corpus_dir / f"token_vocab_{version}.parquet"
+        postings_path = corpus_dir / f"token_postings_{version}.parquet"
+        token_vocab.write_parquet(token_vocab_path)
+        token_postings.write_parquet(
+            postings_path, row_group_size=index_functs.TOKEN_INDEX_ROW_GROUP_SIZE
+        )
+        manifest["token_index"] = {
+            "version": version,
+            "vocab_file": token_vocab_path.name,
+            "postings_file": postings_path.name,
+        }
+        keep_paths.extend([token_vocab_path, postings_path])
+        print(f"Extended the token index to {token_vocab.height} tokens")
+
+    corpus_functs.write_manifest(manifest)
+    # the files of the previous version are never read again once the manifest points to
+    # the new ones
+    corpus_functs.remove_old_files(corpus_functs.DERIVED_FILE_PATTERNS, keep_paths)
+    if partitioned_corpus is not None:
+        corpus_functs.add_partitioned_documents(partitioned_corpus, dta_new)
+    return new_corpus_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Add article batches to the corpus.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="add parquet files of new articles to the corpus and its derived files"
+    )
+    ingest_parser.add_argument(
+        "paths", nargs="+", help="parquet files or directories of parquet files"
+    )
+    args = parser.parse_args()
+    if args.command == "ingest":
+        ingest_batches(get_batch_paths(args.paths))
+
+
+if __name__ == "__main__":
+    main()
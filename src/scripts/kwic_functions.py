@@ -0,0 +1,166 @@
+import polars as pl
+
+import scripts.cache_functions as cache_functs
+import scripts.corpus_functions as corpus_functs
+import scripts.index_functions as index_functs
+import scripts.profile_functions as profile_functs
+
+# the words shown before and after a hit by default, and the most that can be asked for
+KWIC_DEFAULT_WINDOW = 10
+KWIC_MAX_WINDOW = 100
+# the hits of one page of results
+KWIC_PAGE_SIZE = 200
+KWIC_CONTEXT_COLS = ["before", "hit", "after"]
+
+
+def get_kwic_hits(token_index: dict, terms: list[str], rows_key: tuple) -> pl.DataFrame:
+    """
+    Finds every occurrence of the terms in the corpus from the positional token index.
+
+    The terms are matched in the text as they are counted (see
+    `index_functions.get_phrase_starts`) but resolved from the index, so no text is read, and
+    terms that are not plain words (see `index_functions.is_indexed_term`) have no hits. The
+    hits are kept in the shared result cache, so paging through them or changing the
+    context window does not look them up again, with narrow columns only, the company of a
+    hit is added with its context.
+
+    Args:
+        token_index (dict): The index from `corpus_functions.load_token_index`.
+        terms (list[str]): Words or phrases of tokens separated by single spaces.
+        rows_key (tuple): The corpus key (see `corpus_functions.get_corpus_key`) and the
+                          first and last year of the documents searched.
+
+    Returns:
+        pl.DataFrame: One row per hit with 'date', 'doc_id', 'word_index' (the position of
+                      the first word of the hit in the split 'clean_text'), 'term' and
+                      'hit_length' (the number of words holding it), in date, document and
+                      word order.
+    """
+    result_cache = cache_functs.get_result_cache()
+    corpus_key, year_range = rows_key
+    result_key = cache_functs.get_result_key(
+        "kwic_hits",
+        corpus_key,
+        year_range,
+        "hit",
+        terms,
+        cache_functs.get_count_source(token_index),
+    )
+    hits = result_cache.get(result_key)
+    if hits is not None:
+        return hits
+    normalized_terms = [
+        term for term in cache_functs.normalize_terms(terms) if index_functs.is_indexed_term(term)
+    ]
+    term_dtype = pl.Enum(normalized_terms)
+    term_hits = [
+        index_functs.get_phrase_starts(token_index, term).select(
+            pl.col("doc_id").cast(pl.UInt32),
+            pl.col("start").cast(pl.UInt32).alias("word_index"),
+            pl.lit(term, dtype=term_dtype).alias("term"),
+            pl.lit(len(term.split(" ")), dtype=pl.UInt8).alias("hit_length"),
+        )
+        for term in normalized_terms
+    ]
+    hits = pl.concat(
+        [
+            pl.DataFrame(
+                schema={
+                    "doc_id": pl.UInt32,
+                    "word_index": pl.UInt32,
+                    "term": term_dtype,
+                    "hit_length": pl.UInt8,
+                }
+            ),
+            *term_hits,
+        ]
+    )
+    hits = (
+        corpus_functs.read_corpus_files(
+            token_index["corpus_paths"], pl.col("year").is_between(*year_range), ["doc_id", "date"]
+        )
+        .select(pl.col("doc_id").cast(pl.UInt32), "date")
+        .join(hits, on="doc_id", how="inner")
+        .select("date", "doc_id", "word_index", "term", "hit_length")
+        .sort("date", "doc_id", "word_index", "term")
+    )
+    result_cache.put(result_key, hits)
+    return hits
+
+
+def get_kwic_contexts(token_index: dict, hits: pl.DataFrame, window: int) -> pl.DataFrame:
+    """
+    Cuts the context of each hit from the words of its document.
+
+    Only the 'clean_text' of the documents of the given hits is read and split, the words
+    before and after each hit are sliced around its stored word index, so the cost follows
+    the hits of one page rather than the corpus. The hits of a page are in date order, so
+    filtering on their dates as well lets the reader skip the row groups of the date sorted
+    corpus outside of the page.
+
+    Args:
+        token_index (dict): The index the hits were found with.
+        hits (pl.DataFrame): Hits from `get_kwic_hits`, e.g. one page of them.
+        window (int): The number of words shown before and after each hit.
+
+    Returns:
+        pl.DataFrame: The hits with their 'company_name' and 'before', 'hit' and 'after'
+                      text columns.
+    """
+    if hits.is_empty():
+        return hits.select(
+            pl.lit("", dtype=pl.Utf8).alias("company_name"),
+            pl.all(),
+            *(pl.lit("", dtype=pl.Utf8).alias(context_col) for context_col in KWIC_CONTEXT_COLS),
+        )
+    words = corpus_functs.read_corpus_files(
+        token_index["corpus_paths"],
+        pl.col("date").is_between(hits["date"].min(), hits["date"].max())
+        & pl.col("doc_id").is_in(hits["doc_id"].unique()),
+        ["doc_id", "company_name", "clean_text"],
+    ).select(
+        pl.col("doc_id").cast(pl.UInt32),
+        "company_name",
+        pl.col("clean_text").str.split(" ").alias("words"),
+    )
+    context_start = (pl.col("word_index") - window).clip(lower_bound=0)
+    hit_end = pl.col("word_index") + pl.col("hit_length")
+    return (
+        hits.with_columns(pl.col("word_index", "hit_length").cast(pl.Int64))
+        .join(words, on="doc_id", how="left")
+        .with_columns(
+            pl.col("words")
+            .list.slice(context_start, pl.col("word_index") - context_start)
+            .list.join(" ")
+            .alias("before"),
+            pl.col("words")
+            .list.slice(pl.col("word_index"), pl.col("hit_length"))
+            .list.join(" ")
+            .alias("hit"),
+            pl.col("words").list.slice(hit_end, window).list.join(" ").alias("after"),
+        )
+        .select("company_name", *hits.columns, *KWIC_CONTEXT_COLS)
+    )
+
+
+def get_kwic_page(
+    token_index: dict, hits: pl.DataFrame, page_number: int, window: int
+) -> pl.DataFrame:
+    """
+    Serves one page of keyword in context results.
+
+    Args:
+        token_index (dict): The index the hits were found with.
+        hits (pl.DataFrame): All hits of the search from `get_kwic_hits`, looked up once
+                             by the caller and also used to count the pages.
+        page_number (int): The page, starting at 1, of KWIC_PAGE_SIZE hits.
+        window (int): The number of words shown before and after each hit.
+
+    Returns:
+        pl.DataFrame: The hits of the page with their context, see `get_kwic_contexts`.
+    """
+    page_hits = hits.slice((page_number - 1) * KWIC_PAGE_SIZE, KWIC_PAGE_SIZE)
+    with profile_functs.time_stage("kwic_contexts"):
+        contexts = get_kwic_contexts(token_index, page_hits, window)
+    profile_functs.record_counter("kwic_snippets", contexts.height)
+    return contexts
@@ -0,0 +1,415 @@
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import polars as pl
+import streamlit as st
+
+# environment variable that turns the timing log off when set to 0
+PAGE_PROFILE_LOG_ENV_VAR = "PAGE_PROFILE_LOG"
+PAGE_PROFILE_LOG_FILE_NAME = "page_timings.jsonl"
+SHOW_STAGE_TIMINGS_KEY = "show_stage_timings"
+# the title of the page last profiled by the session, sections rerun alone are logged under it
+PROFILED_PAGE_TITLE_KEY = "profiled_page_title"
+SHOW_MEMORY_REPORT_KEY = "show_memory_report"
+# environment variable that turns the memory report on for every rerun when set to 1
+PAGE_MEMORY_REPORT_ENV_VAR = "PAGE_MEMORY_REPORT"
+# frames (and the columns of the largest frame) listed as the largest allocations
+MEMORY_REPORT_TOP_N = 5
+# a frame above this estimated size is flagged with a warning in the memory report
+MEMORY_REPORT_WARNING_MB = 500
+# the profile of the rerun running in the current thread, every session reruns its page in
+# its own script thread
+current_profile = threading.local()
+
+
+def get_rss_bytes() -> int:
+    """
+    Returns the current resident set size of the process.
+
+    Reads /proc/self/statm where available (Linux) and otherwise falls back to the peak
+    resident set size reported by `resource.getrusage`. The `resource` module only exists on
+    POSIX systems, so on Windows the memory is not measured.
+
+    Returns:
+        int: The resident set size in bytes, 0 on Windows.
+    """
+    if sys.platform == "win32":
+        return 0
+    import resource
+
+    statm_path = Path("/proc/self/statm")
+    if statm_path.exists():
+        resident_pages = int(statm_path.read_text().split()[1])
+        return resident_pages * resource.getpagesize()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class PeakRssSampler:
+    """
+    Context manager that samples the resident set size in a background thread and keeps the
+    peak, so allocations made by polars outside of the Python heap are included.
+    """
+
+    def __init__(self, interval_seconds: float = 0.005):
+        self.interval_seconds = interval_seconds
+        self.start_rss = 0
+        self.peak_rss = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self) -> None:
+        while not self.stop_event.is_set():
+            self.peak_rss = max(self.peak_rss, get_rss_bytes())
+            time.sleep(self.interval_seconds)
+
+    def __enter__(self):
+        self.start_rss = get_rss_bytes()
+        self.peak_rss = self.start_rss
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak_rss = max(self.peak_rss, get_rss_bytes())
+
+    @property
+    def peak_delta(self) -> int:
+        return self.peak_rss - self.start_rss
+
+
+def get_frame_memory(label: str, dta: pl.DataFrame) -> dict:
+    """
+    Measures the estimated size of a frame and of its largest columns.
+
+    Args:
+        label (str): What the frame is, e.g. the stage or function that produced it.
+        dta (pl.DataFrame): The frame.
+
+    Returns:
+        dict: The label, shape, estimated size in MB and the MEMORY_REPORT_TOP_N largest
+              columns with their size in MB.
+    """
+    column_sizes = sorted(
+        ((column.name, column.estimated_size()) for column in dta.iter_columns()),
+        key=lambda column_size: column_size[1],
+        reverse=True,
+    )
+    return {
+        "frame": label,
+        "rows": dta.height,
+        "columns": dta.width,
+        "size_mb": round(dta.estimated_size() / 1024**2, 3),
+        "largest_columns": {
+            column_name: round(column_size / 1024**2, 3)
+            for column_name, column_size in column_sizes[:MEMORY_REPORT_TOP_N]
+        },
+    }
+
+
+class PageProfile:
+    """
+    Collects the time spent in each stage of one page rerun.
+
+    Stages are timed with `time_stage`, which can be nested and repeated: the breakdown sums
+    the time and counts the calls of each stage name, and the time of the rerun not spent in
+    any stage is reported as 'other'. With `track_memory` every stage also samples the peak
+    resident set size of the process and the frames recorded with `record_frame` are kept
+    for the memory report. Counters added with `record_counter` (e.g. the passes the term
+    counts make over the text) are summed over the rerun.
+    """
+
+    def __init__(self, page_title: str, track_memory: bool = False):
+        self.page_title = page_title
+        self.track_memory = track_memory
+        self.start_time = time.perf_counter()
+        self.start_rss = get_rss_bytes() if track_memory else 0
+        self.spans = []
+        self.frames = []
+        self.counters = {}
+        self.open_stages = 0
+
+    def add_span(
+        self, stage_name: str, seconds: float, nested: bool, peak_rss: int | None = None
+    ) -> None:
+        self.spans.append(
+            {"stage": stage_name, "seconds": seconds, "nested": nested, "peak_rss": peak_rss}
+        )
+
+    def get_memory_report(self) -> dict:
+        """
+        Returns the process peak resident set size of each stage and of the whole rerun and
+        the recorded frames, largest first.
+        """
+        stages = {}
+        for span in self.spans:
+            if span["peak_rss"] is not None:
+                stages[span["stage"]] = max(stages.get(span["stage"], 0), span["peak_rss"])
+        return {
+            "start_rss_mb": round(self.start_rss / 1024**2, 2),
+            "peak_rss_mb": round(max([self.start_rss, *stages.values()]) / 1024**2, 2),
+            "stage_peak_rss_mb": {
+                stage_name: round(peak_rss / 1024**2, 2) for stage_name, peak_rss in stages.items()
+            },
+            "frames": sorted(self.frames, key=lambda frame: frame["size_mb"], reverse=True),
+        }
+
+    def get_breakdown(self) -> dict:
+        """
+        Returns the total seconds of the rerun, the seconds and calls of each stage, in the
+        order the stages first ran, and the counters.
+        """
+        total_seconds = time.perf_counter() - self.start_time
+        stages = {}
+        for span in self.spans:
+            stage = stages.setdefault(span["stage"], {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += span["seconds"]
+            stage["calls"] += 1
+        outer_seconds = sum(span["seconds"] for span in self.spans if not span["nested"])
+        stages["other"] = {"seconds": max(total_seconds - outer_seconds, 0.0), "calls": 1}
+        for stage in stages.values():
+            stage["seconds"] = round(stage["seconds"], 4)
+        return {
+            "total_seconds": round(total_seconds, 4),
+            "stages": stages,
+            "counters": dict(self.counters),
+        }
+
+
+def get_profile_log_path() -> Path:
+    return Path(__file__).parent.parent / "Dataframes" / "logs" / PAGE_PROFILE_LOG_FILE_NAME
+
+
+def start_page_profile(page_title: str) -> PageProfile:
+    """
+    Starts timing a page rerun, call it at the top of the page's `main()` and
+    `finish_page_profile` at the end.
+
+    Memory is tracked when the 'Memory Report' toggle of the previous rerun was on or
+    PAGE_MEMORY_REPORT is 1.
+
+    Args:
+        page_title (str): The title of the page, recorded in the log.
+
+    Returns:
+        PageProfile: The profile of the rerun.
+    """
+    track_memory = (
+        st.session_state.get(SHOW_MEMORY_REPORT_KEY, False)
+        or os.environ.get(PAGE_MEMORY_REPORT_ENV_VAR, "0") == "1"
+    )
+    st.session_state[PROFILED_PAGE_TITLE_KEY] = page_title
+    current_profile.profile = PageProfile(page_title, track_memory)
+    return current_profile.profile
+
+
+@contextmanager
+def time_stage(stage_name: str):
+    """
+    Times the enclosed block as a stage of the current page rerun, does nothing outside of a
+    page rerun (e.g. in the build and benchmark commands).
+
+    Args:
+        stage_name (str): The stage, e.g. 'load', 'year_filter', 'normalization',
+                          'term_count', 'aggregation', 'figure_build',
+                          'figure_serialization' or 'dataframe_serialization'.
+    """
+    profile = getattr(current_profile, "profile", None)
+    if profile is None:
+        yield
+        return
+    nested = profile.open_stages > 0
+    profile.open_stages += 1
+    sampler = PeakRssSampler() if profile.track_memory else None
+    start_time = time.perf_counter()
+    try:
+        if sampler is None:
+            yield
+        else:
+            with sampler:
+                yield
+    finally:
+        profile.open_stages -= 1
+        profile.add_span(
+            stage_name,
+            time.perf_counter() - start_time,
+            nested,
+            None if sampler is None else sampler.peak_rss,
+        )
+
+
+def record_frame(label: str, result) -> None:
+    """
+    Records the estimated size of a frame for the memory report of the current page rerun,
+    does nothing unless memory is tracked.
+
+    Args:
+        label (str): What the frame is, e.g. the stage or function that produced it.
+        result: A DataFrame, or a tuple (as returned by the term count and graph functions)
+                whose DataFrames are recorded.
+    """
+    profile = getattr(current_profile, "profile", None)
+    if profile is None or not profile.track_memory:
+        return
+    frames = result if isinstance(result, tuple) else (result,)
+    for frame in frames:
+        if isinstance(frame, pl.DataFrame):
+            profile.frames.append(get_frame_memory(label, frame))
+
+
+def record_counter(counter_name: str, value: int) -> None:
+    """
+    Adds to a counter of the current page rerun, does nothing outside of a page rerun.
+
+    Args:
+        counter_name (str): The counter, e.g. 'clean_text_passes'.
+        value (int): The amount to add.
+    """
+    profile = getattr(current_profile, "profile", None)
+    if profile is None:
+        return
+    profile.counters[counter_name] = profile.counters.get(counter_name, 0) + value
+
+
+def timed_stage(stage_name: str):
+    """
+    Decorator timing every call of a function as a stage, see `time_stage`. The frames the
+    function returns are recorded for the memory report under the function name.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with time_stage(stage_name):
+                result = function(*args, **kwargs)
+            record_frame(function.__name__, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def profiled_section(section_name: str):
+    """
+    Decorator timing a page section that can rerun on its own (a `st.fragment`).
+
+    On a rerun of the whole page the stages of the section are part of the page profile. On
+    a rerun of the section alone they are timed as a rerun of their own, which is appended
+    to the timing log as '<page title> / <section name>' (unless PAGE_PROFILE_LOG is 0)
+    without touching the sidebar, which a fragment cannot write to.
+
+    Args:
+        section_name (str): The section, e.g. 'companies chart'.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if getattr(current_profile, "profile", None) is not None:
+                return function(*args, **kwargs)
+            page_title = st.session_state.get(PROFILED_PAGE_TITLE_KEY, "")
+            profile = PageProfile(f"{page_title} / {section_name}")
+            current_profile.profile = profile
+            try:
+                return function(*args, **kwargs)
+            finally:
+                current_profile.profile = None
+                write_profile_log(profile.get_breakdown(), profile.page_title)
+
+        return wrapper
+
+    return decorator
+
+
+def display_memory_report(memory_report: dict) -> None:
+    st.sidebar.write(
+        f"Peak RSS {memory_report['peak_rss_mb']} MB "
+        f"(started the rerun at {memory_report['start_rss_mb']} MB)"
+    )
+    st.sidebar.dataframe(
+        [
+            {"stage": stage_name, "peak_rss_mb": peak_rss_mb}
+            for stage_name, peak_rss_mb in memory_report["stage_peak_rss_mb"].items()
+        ],
+        hide_index=True,
+    )
+    frames = memory_report["frames"]
+    st.sidebar.write(f"Largest frames (of {len(frames)} recorded)")
+    st.sidebar.dataframe(
+        [
+            {key: frame[key] for key in ["frame", "rows", "columns", "size_mb"]}
+            for frame in frames[:MEMORY_REPORT_TOP_N]
+        ],
+        hide_index=True,
+    )
+    if frames:
+        largest_frame = frames[0]
+        st.sidebar.write(f"Largest columns of {largest_frame['frame']}")
+        st.sidebar.write(largest_frame["largest_columns"])
+    for frame in frames:
+        if frame["size_mb"] > MEMORY_REPORT_WARNING_MB:
+            st.sidebar.warning(f"{frame['frame']} holds {frame['size_mb']:.0f} MB")
+
+
+def write_profile_log(breakdown: dict, page_title: str) -> None:
+    if os.environ.get(PAGE_PROFILE_LOG_ENV_VAR, "1") == "0":
+        return
+    log_path = get_profile_log_path()
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    record = {
+        "run_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "page": page_title,
+        **breakdown,
+    }
+    with open(log_path, "a") as file:
+        file.write(json.dumps(record) + "\n")
+
+
+def display_stage_timings(breakdown: dict) -> None:
+    st.sidebar.write(f"Rerun took {breakdown['total_seconds']:.3f} s")
+    st.sidebar.dataframe(
+        [
+            {"stage": stage_name, "seconds": stage["seconds"], "calls": stage["calls"]}
+            for stage_name, stage in breakdown["stages"].items()
+        ],
+        hide_index=True,
+    )
+    for counter_name, value in breakdown["counters"].items():
+        st.sidebar.write(f"{counter_name}: {value}")
+
+
+def finish_page_profile() -> dict | None:
+    """
+    Finishes timing the current page rerun: appends its breakdown (with the memory report
+    when memory is tracked) to `Dataframes/logs/page_timings.jsonl` (unless PAGE_PROFILE_LOG
+    is 0) and shows it in the sidebar when the 'Show Stage Timings' or 'Memory Report'
+    toggles are on.
+
+    Returns:
+        dict | None: The breakdown of the rerun, see `PageProfile.get_breakdown`, or None
+                     if no rerun was being timed.
+    """
+    profile = getattr(current_profile, "profile", None)
+    if profile is None:
+        return None
+    current_profile.profile = None
+    breakdown = profile.get_breakdown()
+    if profile.track_memory:
+        breakdown["memory"] = profile.get_memory_report()
+    write_profile_log(breakdown, profile.page_title)
+    if st.sidebar.toggle("Show Stage Timings", key=SHOW_STAGE_TIMINGS_KEY):
+        display_stage_timings(breakdown)
+    # read by `start_page_profile` of the next rerun, the memory is only tracked from then on
+    if st.sidebar.toggle("Memory Report", key=SHOW_MEMORY_REPORT_KEY) and "memory" in breakdown:
+        display_memory_report(breakdown["memory"])
+    return breakdown
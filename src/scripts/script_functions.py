@@ -4,6 +4,21 @@ import plotly.express as px
 import polars as pl
 import streamlit as st
 
+import scripts.cache_functions as cache_functs
+import scripts.chart_functions as chart_functs
+import scripts.company_functions as company_functs
+import scripts.index_functions as index_functs
+import scripts.profile_functions as profile_functs
+import scripts.term_functions as term_functs
+import scripts.viewer_functions as viewer_functs
+
+# applied in order by get_clean_text_expr after lowercasing the text, any change here
+# also changes the version of the preprocessed corpus built by corpus_functions
+# a single pass gives the same result as the former [^A-Za-z0-9 ]+, \W, \n and " +" passes
+CLEAN_TEXT_REGEXES = [
+    (r"[^a-z0-9]+", " "),
+]
+
 
 def set_page_configs(page_title) -> None:
     """
@@ -873,7 +888,10 @@ def select_dictionary(dictionary_dicts):
     return dict_key, dict_label, dict_terms, dict_terms_colors
 
 
-def get_dicts_combined_term_count(dta: pl.DataFrame, dictionary_dicts):
+@profile_functs.timed_stage("term_count")
+def get_dicts_combined_term_count(
+    dta: pl.DataFrame, dictionary_dicts, term_store: dict | None = None
+):
     """
     Combines terms from multiple dictionaries and counts their occurrences in a DataFrame column.
     Args:
@@ -881,6 +899,8 @@ def get_dicts_combined_term_count(dta: pl.DataFrame, dictionary_dicts):
         dictionary_dicts (dict): A dictionary of dictionaries, where each key is a dictionary name and each value is a dictionary
                                  containing 'terms' (a dictionary of terms to count) and 'label' (a label for the term count column).
                                  Each dictionary should also contain 'dict_color' for the color associated with the term count.
+        term_store (dict | None): The sparse term store from `corpus_functions.load_term_store`. When it holds every
+                                  dictionary the counts are read from it by 'doc_id' and 'clean_text' is not needed.
     Returns:
         tuple: A tuple containing:
             - dta (pl.DataFrame): The updated DataFrame with new columns for each dictionary's term count.
@@ -892,28 +912,32 @@ def get_dicts_combined_term_count(dta: pl.DataFrame, dictionary_dicts):
         dict_terms = dictionary_dicts[dict_key]["terms"].keys()
         dict_terms = "|".join(dict_terms)
         dictionary_dicts[dict_key]["combined_terms"] = dict_terms
-    dictionary_dicts
     term_col_names = []
     term_col_colors = {}
+    combined_patterns = {}
     for dict_key in dict_keys:
         combined_terms = dictionary_dicts[dict_key]["combined_terms"]
         dict_label = dictionary_dicts[dict_key]["label"]
         term_col_colors.update({f"{dict_label}": dictionary_dicts[dict_key]["dict_color"]})
         term_col_names.append(f"{dict_label}")
-        combined_terms = combined_terms.lower()
-        dta = dta.with_columns(
-            pl.col("clean_text")
-            .str.count_matches(combined_terms)
-            .cast(pl.Int32)
-            .alias(f"{dict_label}")
-        )
+        combined_patterns[f"{dict_label}"] = combined_terms.lower()
+    if term_functs.has_stored_terms(term_store, term_col_names, kind="dictionary"):
+        dta = term_functs.get_stored_term_counts(dta, term_store, term_col_names, kind="dictionary")
+    else:
+        dta = term_functs.count_patterns(dta, combined_patterns)
     # st.write(dta)  # TEMPPRINT:
     # st.write(term_col_names)  # TEMPPRINT:
     # st.write(term_col_colors)  # TEMPPRINT:
     return dta, term_col_names, term_col_colors
 
 
-def get_dict_term_count(dta: pl.DataFrame, dict_terms: list[str]) -> tuple[pl.DataFrame, list[str]]:
+@profile_functs.timed_stage("term_count")
+def get_dict_term_count(
+    dta: pl.DataFrame,
+    dict_terms: list[str],
+    term_store: dict | None = None,
+    rows_key: tuple | None = None,
+) -> tuple[pl.DataFrame, list[str]]:
     """
     Calculate the count of dictionary terms in the 'text' column of the given DataFrame.
 
@@ -926,27 +950,44 @@ def get_dict_term_count(dta: pl.DataFrame, dict_terms: list[str]) -> tuple[pl.Da
     Args:
         dta (pl.DataFrame): A Polars DataFrame containing a 'text' column with text data.
         dict_terms (list[str]): A list of dictionary terms to count in the text data.
+        term_store (dict | None): The sparse term store from `corpus_functions.load_term_store`. When it holds every
+                                  term the counts are read from it by 'doc_id' instead of scanning the text.
+        rows_key (tuple | None): The corpus key and year range identifying the rows of `dta`. The
+                                 figures of the counted rows are then keyed by them instead of
+                                 their values (see `cache_functions.set_frame_key`).
 
     Returns:
         pl.DataFrame: A Polars DataFrame with an additional 'term_count' column representing the count of
                      dictionary terms in each row.
     """
-    for term in dict_terms:
-        target_term = term.lower()
-        dta = dta.with_columns(
-            pl.col("clean_text")
-            .str.count_matches(target_term)
-            .cast(pl.Int32)
-            .alias(f"{term}")
-            # pl.col("clean_text").str.contains(target_term).cast(pl.Int32).alias(f"{term}")
+    if term_functs.has_stored_terms(term_store, list(dict_terms)):
+        dta = term_functs.get_stored_term_counts(dta, term_store, list(dict_terms))
+    else:
+        dta = term_functs.count_terms(dta, list(dict_terms))
+    if rows_key is not None:
+        corpus_key, year_range = rows_key
+        result_key = cache_functs.get_result_key(
+            "dict_term_count",
+            corpus_key,
+            year_range,
+            term_store["key"] if term_store is not None else "document",
+            list(dict_terms),
+            cache_functs.get_count_source(term_store),
         )
+        cache_functs.set_frame_key(dta, result_key)
     # st.write(dta)  # TEMPPRINT:
     term_col_names = [f"{term}" for term in dict_terms]
     # st.write(term_col_names)  # TEMPPRINT:
     return dta, term_col_names
 
 
-def get_term_count(dta: pl.DataFrame, term: str) -> tuple[pl.DataFrame, list[str]]:
+@profile_functs.timed_stage("term_count")
+def get_term_count(
+    dta: pl.DataFrame,
+    term: str,
+    token_index: dict | None = None,
+    rows_key: tuple | None = None,
+) -> tuple[pl.DataFrame, list[str]]:
     """
     Calculate the count of dictionary terms in the 'text' column of the given DataFrame.
 
@@ -959,6 +1000,14 @@ def get_term_count(dta: pl.DataFrame, term: str) -> tuple[pl.DataFrame, list[str
     Args:
         dta (pl.DataFrame): A Polars DataFrame containing a 'text' column with text data.
         dict_terms (list[str]): A list of dictionary terms to count in the text data.
+        token_index (dict | None): The positional index from `corpus_functions.load_token_index`
+                                   to count words and phrases with (with the same counts) instead
+                                   of scanning the text of every row, `dta` then needs a
+                                   'doc_id' column instead of 'clean_text'.
+        rows_key (tuple | None): The corpus key, year range and granularity identifying the
+                                 rows of `dta` (which then needs a 'doc_id' column). The counts
+                                 are then kept in the shared result cache and reused by the
+                                 sessions asking for the same terms on the same rows.
 
     Returns:
         pl.DataFrame: A Polars DataFrame with an additional 'term_count' column representing the count of
@@ -968,71 +1017,174 @@ def get_term_count(dta: pl.DataFrame, term: str) -> tuple[pl.DataFrame, list[str
         target_terms = term.split(",")
     else:
         target_terms = [term]
-    for term in target_terms:
-        target_term = term.lower()
-        dta = dta.with_columns(
-            pl.col("clean_text")
-            .str.count_matches(target_term)
-            .cast(pl.Int32)
-            .alias(f"{term}")
-            # pl.col("clean_text").str.contains(target_term).cast(pl.Int32).alias(f"{term}")
+    if rows_key is None:
+        dta = count_term_columns(dta, target_terms, token_index)
+    else:
+        result_cache = cache_functs.get_result_cache()
+        result_key = cache_functs.get_result_key(
+            "term_count", *rows_key, target_terms, cache_functs.get_count_source(token_index)
         )
+        term_counts = result_cache.get(result_key)
+        if term_counts is None:
+            term_counts = get_term_count_table(
+                dta.select(
+                    pl.col(["doc_id", "clean_text"] if "clean_text" in dta.columns else "doc_id")
+                ),
+                term_functs.get_count_cols(list(cache_functs.normalize_terms(target_terms))),
+                token_index,
+            )
+            result_cache.put(result_key, term_counts)
+        count_cols = term_functs.get_count_cols(list(cache_functs.normalize_terms(target_terms)))
+        term_count_cols = {term: count_col for count_col, term in count_cols.items()}
+        dta = term_functs.join_term_counts(
+            dta,
+            term_counts,
+            {f"{term}": term_count_cols[term.lower()] for term in dict.fromkeys(target_terms)},
+        )
+        # the figures of the documents are keyed by their rows and terms, not their values
+        cache_functs.set_frame_key(dta, result_key)
     # st.write(dta)  # TEMPPRINT:
     term_col_names = [f"{term}" for term in target_terms]
     # st.write(term_col_names)  # TEMPPRINT:
     return dta, term_col_names
 
 
-def load_dta():
-    def get_dirs() -> Path:
-        parent_dir = Path(__file__).parent.parent
-        dataframe_dir = parent_dir / "Dataframes"
-        return dataframe_dir
+def get_term_count_table(
+    dta: pl.DataFrame, count_cols: dict[str, str], token_index: dict | None = None
+) -> pl.DataFrame:
+    """
+    Counts terms into a table of the 'doc_id' of the documents and their count columns.
+
+    Args:
+        dta (pl.DataFrame): The documents with a 'doc_id' column, and a 'clean_text' column
+                            without a token index.
+        count_cols (dict[str, str]): Maps each count column (see
+                                     `term_functions.get_count_cols`) to its term.
+        token_index (dict | None): The positional index to count with instead of the text.
+
+    Returns:
+        pl.DataFrame: The 'doc_id' and Int32 count columns.
+    """
+    if token_index is not None:
+        return index_functs.get_indexed_term_counts(dta, token_index, count_cols)
+    return term_functs.count_planned_terms(dta, term_functs.plan_term_counts(count_cols)).select(
+        "doc_id", *count_cols
+    )
+
 
-    def load_dta_path(dataframe_dir) -> pl.DataFrame:
-        return pl.read_parquet((dataframe_dir / "combined_oil_company_dta.parquet"))
+def count_term_columns(
+    dta: pl.DataFrame, terms: list[str], token_index: dict | None = None
+) -> pl.DataFrame:
+    if token_index is not None:
+        return index_functs.count_indexed_terms(dta, token_index, terms)
+    return term_functs.count_terms(dta, terms)
 
-    def remove_missing_values(dta: pl.DataFrame) -> pl.DataFrame:
-        return dta.drop_nulls()
 
-    def get_year_month_column(dta: pl.DataFrame) -> pl.DataFrame:
-        dta = dta.with_columns(pl.col("date").dt.strftime("%Y-%m").alias("year_month"))
-        dta = dta.with_columns(
-            pl.col("date").dt.strftime("%Y-%m").str.to_date(format="%Y-%m").alias("year_month_dt")
-        )
-        dta = dta.with_columns(pl.col("date").dt.year().cast(pl.Utf8).alias("year"))
-        dta = dta.with_columns(
-            pl.col("date").dt.strftime("%Y").str.to_date(format="%Y").alias("year_dt")
-        )
-        dta = dta.with_columns(pl.col("date").dt.month().cast(pl.Utf8).alias("month"))
-        return dta
-        # return dta.with_columns(pl.col("date").dt.strftime("%Y-%m").alias("year_month").sort())
+def get_dataframe_dir() -> Path:
+    parent_dir = Path(__file__).parent.parent
+    dataframe_dir = parent_dir / "Dataframes"
+    return dataframe_dir
+
+
+def get_year_month_column(dta: pl.DataFrame) -> pl.DataFrame:
+    """
+    Adds the date columns the pages filter and group on, as compact keys: 'year_month_dt'
+    and 'year_dt' are the first day of the month and year of the 'date', 'year' is an Int16
+    and 'month' an Int8.
+
+    Args:
+        dta (pl.DataFrame): The DataFrame with a 'date' column.
+
+    Returns:
+        pl.DataFrame: The DataFrame with the date columns added.
+    """
+    return dta.with_columns(
+        pl.col("date").dt.truncate("1mo").alias("year_month_dt"),
+        pl.col("date").dt.year().cast(pl.Int16).alias("year"),
+        pl.col("date").dt.truncate("1y").alias("year_dt"),
+        pl.col("date").dt.month().cast(pl.Int8).alias("month"),
+    )
+
+
+def get_company_name_column(dta: pl.DataFrame) -> pl.DataFrame:
+    """
+    Stores 'company_name' as an Enum (see `company_functions.get_company_name_dtype`), so
+    filters, group-bys and joins on the company compare small integer codes.
+
+    Args:
+        dta (pl.DataFrame): The DataFrame with a 'company_name' column.
+
+    Returns:
+        pl.DataFrame: The DataFrame with the encoded 'company_name' column.
+    """
+    company_name_dtype = company_functs.get_company_name_dtype(dta["company_name"])
+    return dta.with_columns(pl.col("company_name").cast(company_name_dtype))
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_dta_cached(dta_path: str, file_mtime_ns: int, file_size: int) -> pl.DataFrame:
+    """
+    Reads, cleans and adds the date columns to the combined parquet file.
+
+    The result is shared by every session and page in the process. `file_mtime_ns` and
+    `file_size` are only part of the cache key, so a rewritten parquet file produces a new
+    entry and (with `max_entries=1`) evicts the stale one.
+
+    Args:
+        dta_path (str): Path to the combined parquet file.
+        file_mtime_ns (int): Modification time of the file in nanoseconds.
+        file_size (int): Size of the file in bytes.
+
+    Returns:
+        pl.DataFrame: The loaded DataFrame with missing values removed and date columns added.
+    """
+    return read_dta(dta_path)
 
-    dataframe_dir = get_dirs()
-    dta = load_dta_path(dataframe_dir)
-    dta = remove_missing_values(dta)
+
+def read_dta(dta_path: str | Path) -> pl.DataFrame:
+    dta = pl.read_parquet(dta_path)
+    dta = dta.drop_nulls()
+    dta = get_company_name_column(dta)
     dta = get_year_month_column(dta)
     return dta
 
 
-def get_year_selection_filter_bar(dta: pl.DataFrame):
+def load_dta() -> pl.DataFrame:
+    """
+    Loads the combined oil company DataFrame through the process-wide cache.
+
+    The file is only stat'ed on each rerun; it is decoded again only when its modification
+    time or size changes.
+
+    Returns:
+        pl.DataFrame: The loaded DataFrame with missing values removed and date columns added.
+    """
+    dta_path = get_dataframe_dir() / "combined_oil_company_dta.parquet"
+    dta_stat = dta_path.stat()
+    return load_dta_cached(str(dta_path), dta_stat.st_mtime_ns, dta_stat.st_size)
+
+
+def get_year_selection_filter_bar(dta: pl.DataFrame | pl.LazyFrame):
     """
     Filters the given DataFrame based on a year range selected by the user through Streamlit sliders.
 
     Args:
-        dta (pl.DataFrame): The input DataFrame containing a 'year' column.
+        dta (pl.DataFrame | pl.LazyFrame): The input DataFrame containing an integer 'year' column.
 
     Returns:
-        pl.DataFrame: The filtered DataFrame with rows where the 'year' column is within the selected range.
+        pl.DataFrame | pl.LazyFrame: The filtered DataFrame with rows where the 'year' column is within
+                                     the selected range.
 
     Notes:
-        - The 'year' column in the input DataFrame is cast to an integer type for filtering.
         - Two Streamlit sliders are used to select the start and end years for the filter.
         - If the start year is greater than the end year, an error message is displayed.
+        - For a LazyFrame only the 'year' column is collected for the slider bounds and the filter
+          is pushed down into the parquet reader.
     """
-    dta = dta.with_columns(pl.col("year").cast(pl.Int32).alias("year_int"))
-    min_value = dta.select(pl.min("year_int")).item()
-    max_value = dta.select(pl.max("year_int")).item()
+    year_bounds = dta.select(pl.min("year").alias("min_value"), pl.max("year").alias("max_value"))
+    if isinstance(year_bounds, pl.LazyFrame):
+        year_bounds = year_bounds.collect()
+    min_value, max_value = year_bounds.row(0)
     start_year = st.sidebar.slider(
         "Select Start Year for Included Data:",
         min_value=min_value,
@@ -1048,110 +1200,45 @@ def get_year_selection_filter_bar(dta: pl.DataFrame):
     if start_year > end_year:
         st.error("Start year must be less than end year.")
     else:
-        dta = dta.filter(pl.col("year_int").is_between(start_year, end_year))
+        dta = dta.filter(pl.col("year").is_between(start_year, end_year))
     return dta
 
 
+def get_clean_text_expr() -> pl.Expr:
+    """
+    Builds the expression that normalizes the 'text' column into 'clean_text'.
+
+    The text is lowercased, every run of characters that are not a-z or 0-9 (punctuation,
+    non-ASCII letters, newlines and repeated spaces) is replaced by a single space through
+    CLEAN_TEXT_REGEXES and leading and trailing spaces are stripped.
+
+    Returns:
+        pl.Expr: The expression producing the cleaned text.
+    """
+    clean_text = pl.col("text").str.to_lowercase()
+    for regex_pattern, replacement in CLEAN_TEXT_REGEXES:
+        clean_text = clean_text.str.replace_all(regex_pattern, replacement)
+    return clean_text.str.strip_chars()
+
+
+@profile_functs.timed_stage("normalization")
 def get_article_word_count(dta: pl.DataFrame) -> pl.DataFrame:
     """
     Calculate the word count for each row in the 'text' column of the given DataFrame.
     This function performs the following steps:
-    1. Converts the text in the 'text' column to lowercase.
-    2. Removes all non-alphanumeric characters except spaces.
-    3. Replaces all non-word characters with spaces.
-    4. Replaces newline characters with spaces.
-    5. Replaces multiple spaces with a single space.
-    6. Strips leading and trailing spaces.
-    7. Splits the cleaned text into a list of words.
-    8. Calculates the length of the word list (i.e., the word count).
-    9. Drops the intermediate 'word_list' column.
+    1. Normalizes the 'text' column into 'clean_text' in a single expression (see
+       get_clean_text_expr).
+    2. Counts the words as the number of single spaces separating them plus one, so no
+       intermediate list of words is built.
     Args:
         dta (pl.DataFrame): A Polars DataFrame containing a 'text' column with text data.
     Returns:
         pl.DataFrame: A Polars DataFrame with an additional 'word_count' column representing the word count for each row.
     """
-    regex_pattern = r"[^A-Za-z0-9 ]+"
-    dta = dta.with_columns(pl.col("text").str.to_lowercase().alias("clean_text"))
-    dta = dta.with_columns(pl.col("clean_text").str.replace_all(regex_pattern, " "))
-    dta = dta.with_columns(pl.col("clean_text").str.replace_all(r"\W", " "))
-    dta = dta.with_columns(pl.col("clean_text").str.replace_all(r"\n", " "))
-    dta = dta.with_columns(pl.col("clean_text").str.replace_all(r" +", " "))
-    dta = dta.with_columns(pl.col("clean_text").str.strip_chars())
-    dta = dta.with_columns((pl.col("clean_text").str.split(" ")).alias("word_list"))
-    dta = dta.with_columns((pl.col("word_list").list.len()).alias("word_count"))
-    dta = dta.drop("word_list")
-    return dta
-
-
-def get_word_count_by_month_by_company(dta: pl.DataFrame) -> pl.DataFrame:
-    dta_count_month = dta.group_by(pl.col("year_month")).agg([pl.sum("word_count")])
-    dta_count_month = dta_count_month.sort("year_month")
-    dta_count_month = dta_count_month.rename({"word_count": "word_count_month"})
-    dta_count_month_company = dta.group_by(pl.col("year_month"), pl.col("company_name")).agg(
-        [pl.sum("word_count")]
-    )
-    dta_count_month_company = dta_count_month_company.sort("company_name", "year_month")
-    dta_count_month_company = dta_count_month_company.rename(
-        {"word_count": "word_count_month_company"}
+    dta = dta.with_columns(get_clean_text_expr().alias("clean_text"))
+    dta = dta.with_columns(
+        (pl.col("clean_text").str.count_matches(" ", literal=True) + 1).alias("word_count")
     )
-    dta = dta.join(dta_count_month, on=["year_month"], how="left")
-    dta = dta.join(dta_count_month_company, on=["year_month", "company_name"], how="left")
-    dta = dta.sort("company_name", "year_month")
-    # st.write(dta)  # TEMPPRINT:
-    return dta
-
-
-def get_word_count_by_year_by_company(dta: pl.DataFrame) -> pl.DataFrame:
-    dta_count_year = dta.group_by(pl.col("year")).agg([pl.sum("word_count")])
-    dta_count_year = dta_count_year.sort("year")
-    dta_count_year = dta_count_year.rename({"word_count": "word_count_year"})
-    dta_count_year_company = dta.group_by(pl.col("year"), pl.col("company_name")).agg(
-        [pl.sum("word_count")]
-    )
-    dta_count_year_company = dta_count_year_company.sort("company_name", "year")
-    dta_count_year_company = dta_count_year_company.rename(
-        {"word_count": "word_count_year_company"}
-    )
-    dta = dta.join(dta_count_year, on=["year"], how="left")
-    dta = dta.join(dta_count_year_company, on=["year", "company_name"], how="left")
-    dta = dta.sort("company_name", "year")
-    # st.write(dta)  # TEMPPRINT:
-    return dta
-
-
-def get_term_counts_by_month_by_company(dta: pl.DataFrame, target_term: str) -> pl.DataFrame:
-    dta = dta.filter(pl.col("clean_text").str.contains(target_term))
-    dta_count_month = dta.group_by(pl.col("year_month")).agg([pl.sum("word_count")])
-    dta_count_month = dta_count_month.sort("year_month")
-    dta_count_month = dta_count_month.rename({"word_count": "word_count_month"})
-    dta_count_month_company = dta.group_by(pl.col("year_month"), pl.col("company_name")).agg(
-        [pl.sum("word_count")]
-    )
-    dta_count_month_company = dta_count_month_company.sort("company_name", "year_month")
-    dta_count_month_company = dta_count_month_company.rename(
-        {"word_count": "word_count_month_company"}
-    )
-    dta = dta.join(dta_count_month, on=["year_month"], how="left")
-    dta = dta.join(dta_count_month_company, on=["year_month", "company_name"], how="left")
-    dta = dta.sort("company_name", "year_month")
-    return dta
-
-
-def get_term_counts_by_year_by_company(dta: pl.DataFrame, target_term: str) -> pl.DataFrame:
-    dta = dta.filter(pl.col("clean_text").str.contains(target_term))
-    dta_count_year = dta.group_by(pl.col("year")).agg([pl.sum("word_count")])
-    dta_count_year = dta_count_year.sort("year")
-    dta_count_year = dta_count_year.rename({"word_count": "word_count_month"})
-    dta_count_year_company = dta.group_by(pl.col("year"), pl.col("company_name")).agg(
-        [pl.sum("word_count")]
-    )
-    dta_count_year_company = dta_count_year_company.sort("company_name", "year")
-    dta_count_year_company = dta_count_year_company.rename(
-        {"word_count": "word_count_month_company"}
-    )
-    dta = dta.join(dta_count_year, on=["year"], how="left")
-    dta = dta.join(dta_count_year_company, on=["year", "company_name"], how="left")
-    dta = dta.sort("company_name", "year")
     return dta
 
 
@@ -1169,10 +1256,28 @@ def display_graph_dta(fig_dta: pl.DataFrame, fig_title):
     chart_display = st.checkbox(f"Display Dataframe for {fig_title}?")
     if chart_display:
         st.write(f"#### {fig_title} Dataframe")
-        st.dataframe(fig_dta)
+        viewer_functs.display_frame_viewer(fig_dta, fig_title)
         st.write(f"Dataframe shape: {fig_dta.shape}")
 
 
+def display_chart(fig) -> None:
+    with profile_functs.time_stage("figure_downsampling"):
+        chart_functs.prepare_figure(fig)
+    with profile_functs.time_stage("figure_serialization"):
+        st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+@profile_functs.profiled_section("chart")
+def display_chart_section(fig, fig_title: str, fig_dta: pl.DataFrame) -> None:
+    """
+    Displays a chart and its "Display Dataframe" checkbox as a section of the page that
+    reruns on its own, so ticking the checkbox does not rerun the rest of the page.
+    """
+    display_chart(fig)
+    display_graph_dta(fig_dta, fig_title)
+
+
 # def display_graph(fig_title, fig, fig_dta):
 #     st.write(f"## {fig_title}")
 #     # st.altair_chart(fig, use_container_width=True)
@@ -1185,6 +1290,7 @@ def display_graph_dta(fig_dta: pl.DataFrame, fig_title):
 
 
 # TESTCODE:
+@chart_functs.cached_figure
 def line_graph(fig_dta: pl.DataFrame, x_col: str, y_col: str, color_col: str, title: str):
     fig = px.line(fig_dta, x=x_col, y=y_col, color=color_col, title=title)
     return fig
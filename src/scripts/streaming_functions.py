@@ -0,0 +1,429 @@
+import argparse
+import shutil
+from pathlib import Path
+
+import polars as pl
+
+import scripts.aggregate_functions as aggregate_functs
+import scripts.company_functions as company_functs
+import scripts.corpus_functions as corpus_functs
+import scripts.index_functions as index_functs
+import scripts.profile_functions as profile_functs
+import scripts.script_functions as functs
+import scripts.term_functions as term_functs
+
+# memory ceiling of the streaming build when none is given
+STREAMING_MEMORY_MB = 1024
+# documents read to estimate the in memory size of a document
+STREAMING_SAMPLE_DOCUMENTS = 1_000
+# how many times the raw size of a batch is held while it is processed: the raw and clean
+# text, the exploded tokens of the token index and the dense term counts, measured on the
+# 100k synthetic corpus
+STREAMING_MEMORY_FACTOR = 20
+STREAMING_PARTS_DIR_NAME = "streaming_parts"
+
+
+def get_batch_documents(memory_mb: int) -> int:
+    """
+    Sizes the document batches of the streaming build so a batch and its intermediates stay
+    within the memory ceiling.
+
+    The size of a document is estimated from the first STREAMING_SAMPLE_DOCUMENTS documents
+    of the source file and a batch is assumed to need STREAMING_MEMORY_FACTOR times its raw
+    size while it is processed.
+
+    Args:
+        memory_mb (int): The memory ceiling in MB.
+
+    Returns:
+        int: The number of documents per batch.
+    """
+    dta_sample = (
+        pl.scan_parquet(corpus_functs.get_source_path()).head(STREAMING_SAMPLE_DOCUMENTS).collect()
+    )
+    document_bytes = dta_sample.estimated_size() / max(dta_sample.height, 1)
+    return max(int(memory_mb * 1024**2 / (document_bytes * STREAMING_MEMORY_FACTOR)), 1)
+
+
+def scan_document_slices(documents_path: Path, batch_documents: int):
+    """
+    Reads a documents file in slices of `batch_documents` rows.
+
+    Yields:
+        pl.DataFrame: The rows of each slice with their row number in the file as
+                      'source_row'.
+    """
+    n_rows = pl.scan_parquet(documents_path).select(pl.len()).collect().item()
+    for offset in range(0, n_rows, batch_documents):
+        yield (
+            pl.scan_parquet(documents_path)
+            .slice(offset, batch_documents)
+            .collect()
+            .with_row_index("source_row", offset=offset)
+        )
+
+
+def get_document_numbers(
+    documents_path: Path, first_doc_id: int, batch_documents: int
+) -> pl.DataFrame:
+    """
+    Numbers the documents of one file the way `corpus_functions.number_documents` does
+    without holding their text: documents with missing values are dropped and the others are
+    numbered in date order.
+
+    Args:
+        documents_path (Path): The source file or an ingested batch.
+        first_doc_id (int): The 'doc_id' of the first document of the file.
+        batch_documents (int): The number of rows read at a time.
+
+    Returns:
+        pl.DataFrame: The 'doc_id', 'source_row' (row number in the file), 'date' and
+                      'company_name' of every kept document.
+    """
+    document_numbers = [
+        dta.drop_nulls().select("source_row", "date", pl.col("company_name").cast(pl.Utf8))
+        for dta in scan_document_slices(documents_path, batch_documents)
+    ]
+    return (
+        pl.concat(document_numbers)
+        .sort("date", maintain_order=True)
+        .with_row_index("doc_id", offset=first_doc_id)
+    )
+
+
+def get_corpus_buckets(document_numbers: pl.DataFrame, batch_documents: int) -> pl.DataFrame:
+    """
+    Splits the documents into buckets of consecutive rows of the corpus file, which is
+    sorted by date and then 'doc_id', so each bucket can be sorted on its own.
+
+    Args:
+        document_numbers (pl.DataFrame): The numbers of every documents file.
+        batch_documents (int): The number of documents per bucket.
+
+    Returns:
+        pl.DataFrame: The 'doc_id' and 'bucket' of every document.
+    """
+    return (
+        document_numbers.select("doc_id", "date")
+        .sort("date", "doc_id")
+        .with_row_index("position")
+        .select("doc_id", (pl.col("position") // batch_documents).alias("bucket"))
+    )
+
+
+def get_token_buckets(token_doc_counts: pl.DataFrame, n_buckets: int) -> pl.DataFrame:
+    """
+    Builds the token vocabulary (see `index_functions.get_token_vocab`) and splits it into
+    buckets of consecutive token ids holding about the same number of postings.
+
+    Args:
+        token_doc_counts (pl.DataFrame): The number of documents ('doc_count') of every
+                                         'token', i.e. its number of postings.
+        n_buckets (int): The number of buckets.
+
+    Returns:
+        pl.DataFrame: The 'token_id', 'token' and 'bucket' of every token.
+    """
+    bucket_postings = max(token_doc_counts["doc_count"].sum() // n_buckets, 1)
+    return (
+        token_doc_counts.sort("token")
+        .with_row_index("token_id")
+        .select(
+            "token_id",
+            "token",
+            ((pl.col("doc_count").cum_sum() - pl.col("doc_count")) // bucket_postings).alias(
+                "bucket"
+            ),
+        )
+    )
+
+
+def write_bucket_parts(
+    dta: pl.DataFrame, buckets: pl.DataFrame, key: str, parts_path: Path, part_number: int
+) -> None:
+    """
+    Writes the rows of a batch to one part file per bucket, named
+    '<parts_path>_<bucket>_<part_number>.parquet'.
+    """
+    dta = dta.join(buckets.select(key, "bucket"), on=key, how="inner")
+    for (bucket,), dta_bucket in dta.partition_by("bucket", as_dict=True).items():
+        dta_bucket.drop("bucket").write_parquet(
+            f"{parts_path}_{bucket:05d}_{part_number:05d}.parquet"
+        )
+
+
+def sink_buckets(
+    parts_path: Path,
+    sort_cols: list[str],
+    output_path: Path,
+    row_group_size: int | None = None,
+    dtypes: dict | None = None,
+) -> None:
+    """
+    Writes the part files of `write_bucket_parts` to one file, every bucket sorted on its
+    own and the buckets one after the other, so only one bucket is held at a time.
+
+    Args:
+        parts_path (Path): The part files path without the bucket and part numbers.
+        sort_cols (list[str]): The columns the file is sorted by.
+        output_path (Path): The file to write.
+        row_group_size (int | None): The row group size of the file, None for the default.
+        dtypes (dict | None): Columns to cast before writing, scanned parquet files report an
+                              Enum as a Categorical, which the sink would write.
+    """
+    bucket_paths = parts_path.parent.glob(f"{parts_path.name}_*.parquet")
+    buckets = sorted({bucket_path.stem.split("_")[-2] for bucket_path in bucket_paths})
+    pl.concat(
+        [
+            pl.scan_parquet(f"{parts_path}_{bucket}_*.parquet").cast(dtypes or {}).sort(sort_cols)
+            for bucket in buckets
+        ],
+        parallel=False,
+    ).sink_parquet(output_path, row_group_size=row_group_size)
+
+
+def prepare_document_batch(
+    dta: pl.DataFrame, document_numbers: pl.DataFrame, company_name_dtype: pl.Enum
+) -> pl.DataFrame:
+    """
+    Prepares a slice of a documents file like `corpus_functions.prepare_corpus`, so the batch
+    holds exactly the rows and columns it contributes to the corpus.
+
+    Args:
+        dta (pl.DataFrame): A slice from `scan_document_slices`.
+        document_numbers (pl.DataFrame): The numbers of the file from `get_document_numbers`.
+        company_name_dtype (pl.Enum): The company Enum of the whole corpus.
+
+    Returns:
+        pl.DataFrame: The prepared documents of the slice.
+    """
+    source_cols = [col_name for col_name in dta.columns if col_name != "source_row"]
+    dta = dta.join(
+        document_numbers.select("source_row", "doc_id"), on="source_row", how="inner"
+    ).select("doc_id", *source_cols)
+    dta = dta.with_columns(pl.col("company_name").cast(pl.Utf8).cast(company_name_dtype))
+    dta = functs.get_year_month_column(dta)
+    dta = functs.get_article_word_count(dta)
+    return dta
+
+
+def stream_build(memory_mb: int = STREAMING_MEMORY_MB, force: bool = False) -> Path:
+    """
+    Builds the corpus, term store, cube and token index of `corpus_functions.main` in
+    batches of documents, for corpora larger than the memory of one worker.
+
+    1. The documents files are read in slices sized from the memory ceiling (see
+       `get_batch_documents`) and the documents numbered from their dates (see
+       `get_document_numbers`).
+    2. The documents files are read in slices again and each slice is normalized and
+       counted on its own: its corpus rows and term counts are written to bucket part
+       files, its cells are summed into the cube (see `aggregate_functions.merge_cube`) and
+       its tokens into the vocabulary.
+    3. The postings are built from the corpus parts and written to bucket part files of
+       token id ranges.
+    4. Every output file is written bucket by bucket (see `sink_buckets`): a bucket holds a
+       range of the sorted file, so sorting each bucket sorts the file the way the in memory
+       build does.
+
+    The files and manifest entries are the same as the ones `corpus_functions.main` writes.
+    Only the document numbers, the cube and the vocabularies are held for the whole build,
+    they grow with the number of documents, company x week of month cells and distinct tokens, not
+    with the text.
+
+    Args:
+        memory_mb (int): The memory ceiling in MB the batches are sized for.
+        force (bool): Rebuild even if the current version already exists.
+
+    Returns:
+        Path: The path of the corpus file.
+    """
+    manifest = corpus_functs.read_manifest() or {}
+    source_hash = corpus_functs.get_source_hash()
+    rules_hash = corpus_functs.get_rules_hash()
+    version = corpus_functs.get_corpus_version(source_hash, rules_hash)
+    dictionary_dicts = functs.create_dictionary_dicts()
+    dictionary_hash = term_functs.get_dictionary_hash(dictionary_dicts)
+    term_store_version = corpus_functs.get_term_store_version(version, dictionary_hash)
+    cube_version = corpus_functs.get_cube_version(term_store_version)
+    corpus_dir = corpus_functs.get_corpus_dir()
+    corpus_path = corpus_dir / f"combined_oil_company_corpus_{version}.parquet"
+    corpus_paths = corpus_functs.get_corpus_paths()
+    if (
+        not force
+        and corpus_paths is not None
+        and manifest.get("version") == version
+        and corpus_functs.load_cube() is not None
+        and corpus_functs.load_token_index() is not None
+    ):
+        print(f"Corpus version {version} and its derived files are already up to date")
+        return corpus_paths[0]
+
+    batch_documents = get_batch_documents(memory_mb)
+    parts_dir = corpus_dir / STREAMING_PARTS_DIR_NAME
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    parts_dir.mkdir(parents=True)
+    term_vocab = term_functs.get_term_vocab(dictionary_dicts)
+    with profile_functs.PeakRssSampler() as sampler:
+        numbered_files = []
+        first_doc_id = 0
+        for documents_path in corpus_functs.get_documents_paths():
+            document_numbers = get_document_numbers(documents_path, first_doc_id, batch_documents)
+            first_doc_id += document_numbers.height
+            numbered_files.append((documents_path, document_numbers))
+        document_numbers = pl.concat([document_numbers for _, document_numbers in numbered_files])
+        company_name_dtype = company_functs.get_company_name_dtype(document_numbers["company_name"])
+        corpus_buckets = get_corpus_buckets(document_numbers, batch_documents)
+        doc_buckets = document_numbers.select(
+            "doc_id", (pl.col("doc_id") // batch_documents).alias("bucket")
+        )
+        del document_numbers
+
+        cube_words, cube_counts = None, None
+        token_doc_counts = pl.DataFrame(schema={"token": pl.Utf8, "doc_count": pl.UInt32})
+        part_number = 0
+        for documents_path, document_numbers in numbered_files:
+            for dta in scan_document_slices(documents_path, batch_documents):
+                dta = prepare_document_batch(dta, document_numbers, company_name_dtype)
+                term_counts = term_functs.build_term_counts(dta, term_vocab)
+                write_bucket_parts(dta, corpus_buckets, "doc_id", parts_dir / "corpus", part_number)
+                write_bucket_parts(
+                    term_counts, doc_buckets, "doc_id", parts_dir / "term_counts", part_number
+                )
+                if cube_words is None:
+                    cube_words, cube_counts = aggregate_functs.build_cube(dta, term_counts)
+                else:
+                    cube_words, cube_counts = aggregate_functs.merge_cube(
+                        cube_words, cube_counts, dta, term_counts
+                    )
+                batch_token_doc_counts = (
+                    index_functs.get_document_tokens(dta)
+                    .select("token", "doc_id")
+                    .unique()
+                    .group_by("token")
+                    .agg(pl.len().cast(pl.UInt32).alias("doc_count"))
+                )
+                token_doc_counts = (
+                    pl.concat([token_doc_counts, batch_token_doc_counts])
+                    .group_by("token")
+                    .agg(pl.sum("doc_count"))
+                )
+                part_number += 1
+                print(f"Processed batch {part_number} ({dta.height} documents)")
+                del dta, term_counts
+
+        token_buckets = get_token_buckets(token_doc_counts, part_number)
+        token_vocab = token_buckets.select("token_id", "token")
+        for postings_part_number, corpus_part_path in enumerate(
+            sorted(parts_dir.glob("corpus_*.parquet"))
+        ):
+            dta = pl.read_parquet(corpus_part_path, columns=["doc_id", "clean_text"])
+            write_bucket_parts(
+                index_functs.build_token_postings(dta, token_vocab),
+                token_buckets,
+                "token_id",
+                parts_dir / "token_postings",
+                postings_part_number,
+            )
+            del dta
+
+        sink_buckets(
+            parts_dir / "corpus",
+            ["date", "doc_id"],
+            corpus_path,
+            corpus_functs.CORPUS_ROW_GROUP_SIZE,
+            {"company_name": company_name_dtype},
+        )
+        term_vocab_path = corpus_dir / f"term_vocab_{term_store_version}.parquet"
+        term_counts_path = corpus_dir / f"term_counts_{term_store_version}.parquet"
+        term_vocab.write_parquet(term_vocab_path)
+        sink_buckets(parts_dir / "term_counts", ["doc_id", "term_id"], term_counts_path)
+        cube_words_path = corpus_dir / f"cube_words_{cube_version}.parquet"
+        cube_counts_path = corpus_dir / f"cube_counts_{cube_version}.parquet"
+        cube_words.write_parquet(cube_words_path)
+        cube_counts.write_parquet(cube_counts_path)
+        token_vocab_path = corpus_dir / f"token_vocab_{version}.parquet"
+        postings_path = corpus_dir / f"token_postings_{version}.parquet"
+        token_vocab.write_parquet(token_vocab_path)
+        sink_buckets(
+            parts_dir / "token_postings",
+            ["token_id", "doc_id"],
+            postings_path,
+            index_functs.TOKEN_INDEX_ROW_GROUP_SIZE,
+        )
+    shutil.rmtree(parts_dir)
+
+    source_stat = corpus_functs.get_source_path().stat()
+    manifest.update(
+        {
+            "version": version,
+            "corpus_file": corpus_path.name,
+            "appended_corpus_files": [],
+            "source_hash": source_hash,
+            "source_mtime_ns": source_stat.st_mtime_ns,
+            "source_size": source_stat.st_size,
+            "rules_hash": rules_hash,
+            "ingested_batches": [path.name for path in corpus_functs.get_ingested_paths()],
+            "term_store": {
+                "version": term_store_version,
+                "corpus_version": version,
+                "dictionary_hash": dictionary_hash,
+                "vocab_file": term_vocab_path.name,
+                "counts_file": term_counts_path.name,
+            },
+            "cube": {
+                "version": cube_version,
+                "words_file": cube_words_path.name,
+                "counts_file": cube_counts_path.name,
+            },
+            "token_index": {
+                "version": version,
+                "vocab_file": token_vocab_path.name,
+                "postings_file": postings_path.name,
+            },
+        }
+    )
+    corpus_functs.write_manifest(manifest)
+    corpus_functs.remove_old_files(
+        corpus_functs.DERIVED_FILE_PATTERNS,
+        [
+            corpus_path,
+            term_vocab_path,
+            term_counts_path,
+            cube_words_path,
+            cube_counts_path,
+            token_vocab_path,
+            postings_path,
+        ],
+    )
+    print(
+        f"Built corpus version {version} with {first_doc_id} documents in {part_number} "
+        f"batches of up to {batch_documents} documents, peak memory growth "
+        f"{sampler.peak_delta / 1024**2:.0f} MB (ceiling {memory_mb} MB)"
+    )
+    return corpus_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build the preprocessed corpus in batches within a memory ceiling."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser(
+        "build", help="build the corpus, term store, cube and token index files in batches"
+    )
+    build_parser.add_argument(
+        "--memory-mb",
+        type=int,
+        default=STREAMING_MEMORY_MB,
+        help="the memory ceiling the document batches are sized for",
+    )
+    build_parser.add_argument(
+        "--force", action="store_true", help="rebuild even if the corpus is up to date"
+    )
+    args = parser.parse_args()
+    if args.command == "build":
+        stream_build(args.memory_mb, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
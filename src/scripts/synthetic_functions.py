@@ -0,0 +1,217 @@
+import argparse
+import datetime
+import shutil
+from pathlib import Path
+
+import polars as pl
+
+import scripts.company_functions as company_functs
+import scripts.script_functions as functs
+
+SYNTHETIC_CORPUS_SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+# documents generated per batch, every batch is written to its own part file so the full
+# corpus is never held in memory
+SYNTHETIC_BATCH_SIZE = 10_000
+# the word count of a document is drawn uniformly from this range
+SYNTHETIC_MIN_WORDS = 50
+SYNTHETIC_MAX_WORDS = 1_000
+# share of the words replaced by a dictionary term, about 4 terms per 1000 words
+SYNTHETIC_TERM_RATE = 0.004
+# share of the documents without text, which `load_dta` drops
+SYNTHETIC_NULL_TEXT_RATE = 0.005
+SYNTHETIC_START_DATE = datetime.date(2000, 1, 1)
+SYNTHETIC_END_DATE = datetime.date(2024, 12, 31)
+# filler words and how often they are drawn relative to each other, with the casing and
+# punctuation of press release text so the text normalizer has the same work to do
+SYNTHETIC_FILLER_WORDS = {
+    "the": 40,
+    "of": 25,
+    "and": 25,
+    "to": 20,
+    "in": 18,
+    "a": 15,
+    "our": 8,
+    "company": 6,
+    "The": 6,
+    "oil": 5,
+    "gas": 5,
+    "energy": 5,
+    "production": 4,
+    "will": 4,
+    "said": 4,
+    "year": 4,
+    "new": 4,
+    "with": 4,
+    "for": 4,
+    "on": 4,
+    "million": 3,
+    "barrels": 3,
+    "per": 3,
+    "day": 3,
+    "project": 3,
+    "projects.": 2,
+    "market": 2,
+    "quarter": 2,
+    "results,": 2,
+    "growth": 2,
+    "investment": 2,
+    "strategy.": 2,
+    "Group": 2,
+    "CEO": 2,
+    "2023": 1,
+    "Q4": 1,
+    "$1.2": 1,
+    "billion,": 1,
+    "LNG": 1,
+    "upstream": 1,
+    "downstream": 1,
+    "refinery": 1,
+    "pipeline;": 1,
+    "(including": 1,
+    "operations)": 1,
+    "well-being": 1,
+    "e.g.": 1,
+    "—": 1,
+    "today.\n": 2,
+}
+
+
+def get_synthetic_dir() -> Path:
+    return functs.get_dataframe_dir() / "synthetic"
+
+
+def get_synthetic_path(size_label: str) -> Path:
+    return get_synthetic_dir() / f"synthetic_oil_company_dta_{size_label}.parquet"
+
+
+def get_synthetic_terms() -> list[str]:
+    """
+    Returns every distinct term of `create_dictionary_dicts`, the terms injected into the
+    synthetic text.
+    """
+    dictionary_dicts = functs.create_dictionary_dicts()
+    terms = [
+        term for dictionary_dict in dictionary_dicts.values() for term in dictionary_dict["terms"]
+    ]
+    return list(dict.fromkeys(terms))
+
+
+def generate_synthetic_batch(n_documents: int, first_doc: int, seed: int) -> pl.DataFrame:
+    """
+    Generates synthetic documents with the schema of the combined oil company parquet file.
+
+    Every document gets a company of `company_colors_dict`, a date between
+    SYNTHETIC_START_DATE and SYNTHETIC_END_DATE and a text of SYNTHETIC_MIN_WORDS to
+    SYNTHETIC_MAX_WORDS words drawn from SYNTHETIC_FILLER_WORDS, with SYNTHETIC_TERM_RATE of
+    the words replaced by dictionary terms. SYNTHETIC_NULL_TEXT_RATE of the texts are null.
+    Everything is drawn with polars from `seed`, so a batch is reproducible.
+
+    Args:
+        n_documents (int): The number of documents.
+        first_doc (int): The number of the first document, used in the 'source_url'.
+        seed (int): The random seed of the batch.
+
+    Returns:
+        pl.DataFrame: The documents with 'company_name', 'date', 'text' and 'source_url'.
+    """
+    filler_words = pl.Series(
+        [word for word, weight in SYNTHETIC_FILLER_WORDS.items() for _ in range(weight)]
+    )
+    terms = pl.Series(get_synthetic_terms())
+    companies = pl.Series(list(company_functs.company_colors_dict().keys()))
+    n_days = (SYNTHETIC_END_DATE - SYNTHETIC_START_DATE).days
+    word_counts = pl.int_range(SYNTHETIC_MIN_WORDS, SYNTHETIC_MAX_WORDS + 1, eager=True).sample(
+        n_documents, with_replacement=True, seed=seed
+    )
+    n_words = int(word_counts.sum())
+    words = filler_words.sample(n_words, with_replacement=True, seed=seed + 1)
+    n_terms = round(n_words * SYNTHETIC_TERM_RATE)
+    term_positions = pl.int_range(n_words, eager=True).sample(n_terms, seed=seed + 2).sort()
+    words = words.scatter(
+        term_positions, terms.sample(n_terms, with_replacement=True, seed=seed + 3)
+    )
+    texts = (
+        pl.DataFrame({"word_count": word_counts})
+        .select(pl.int_range(pl.len()).repeat_by("word_count").explode().alias("doc"))
+        .with_columns(words.alias("word"))
+        .group_by("doc", maintain_order=True)
+        .agg(pl.col("word").str.join(" ").alias("text"))
+    )
+    null_text_docs = (
+        pl.int_range(n_documents, eager=True)
+        .sample(round(n_documents * SYNTHETIC_NULL_TEXT_RATE), seed=seed + 4)
+        .sort()
+    )
+    return pl.DataFrame(
+        {
+            "company_name": companies.sample(n_documents, with_replacement=True, seed=seed + 5),
+            "day": pl.int_range(n_days + 1, eager=True).sample(
+                n_documents, with_replacement=True, seed=seed + 6
+            ),
+            "text": texts["text"].scatter(null_text_docs, None),
+        }
+    ).select(
+        "company_name",
+        (pl.lit(SYNTHETIC_START_DATE) + pl.duration(days="day")).cast(pl.Date).alias("date"),
+        "text",
+        pl.format(
+            "https://www.{}.example.com/news/{}",
+            pl.col("company_name").str.to_lowercase(),
+            pl.int_range(first_doc, first_doc + n_documents),
+        ).alias("source_url"),
+    )
+
+
+def generate_synthetic_corpus(size_label: str, seed: int = 0, force: bool = False) -> Path:
+    """
+    Writes a synthetic corpus of one of the SYNTHETIC_CORPUS_SIZES to
+    `Dataframes/synthetic/synthetic_oil_company_dta_<size>.parquet`.
+
+    The documents are generated in batches of SYNTHETIC_BATCH_SIZE (see
+    `generate_synthetic_batch`) written to part files that are then streamed into the final
+    file, so even the 1m corpus is generated in bounded memory.
+
+    Args:
+        size_label (str): A key of SYNTHETIC_CORPUS_SIZES.
+        seed (int): The random seed, the same seed and size always give the same corpus.
+        force (bool): Generate the corpus even if the file already exists.
+
+    Returns:
+        Path: The path of the synthetic corpus.
+    """
+    synthetic_path = get_synthetic_path(size_label)
+    if synthetic_path.exists() and not force:
+        return synthetic_path
+    n_documents = SYNTHETIC_CORPUS_SIZES[size_label]
+    parts_dir = get_synthetic_dir() / f"parts_{size_label}"
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    parts_dir.mkdir(parents=True)
+    for batch_number, first_doc in enumerate(range(0, n_documents, SYNTHETIC_BATCH_SIZE)):
+        dta_batch = generate_synthetic_batch(
+            min(SYNTHETIC_BATCH_SIZE, n_documents - first_doc),
+            first_doc,
+            seed * 1_000_003 + batch_number * 7,
+        )
+        dta_batch.write_parquet(parts_dir / f"part_{batch_number:05d}.parquet")
+    pl.scan_parquet(parts_dir / "*.parquet").sink_parquet(synthetic_path)
+    shutil.rmtree(parts_dir)
+    print(f"Generated synthetic corpus {synthetic_path.name} with {n_documents} documents")
+    return synthetic_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic oil company corpora.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser("generate", help="generate a synthetic corpus")
+    generate_parser.add_argument("size_label", choices=SYNTHETIC_CORPUS_SIZES.keys())
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.add_argument(
+        "--force", action="store_true", help="generate even if the corpus already exists"
+    )
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate_synthetic_corpus(args.size_label, seed=args.seed, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
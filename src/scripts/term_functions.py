@@ -0,0 +1,362 @@
+import hashlib
+import json
+
+import polars as pl
+
+import scripts.profile_functions as profile_functs
+
+REGEX_METACHARACTERS = set("\\.^$*+?()[]{}|")
+# temporary column flagging the documents where a term overlaps itself
+OVERLAP_FLAG_COL = "__term_overlap"
+# prefix of the count columns of a table of term counts, numbered after the position of the
+# term so a term named like a column of the documents (e.g. "doc_id") does not clash with it
+COUNT_COL_PREFIX = "__term_count_"
+# documents counted per batch when building the sparse term counts, bounds the dense
+# intermediate to TERM_STORE_BATCH_SIZE x vocabulary size cells
+TERM_STORE_BATCH_SIZE = 10_000
+
+
+def is_literal_term(term: str) -> bool:
+    return not any(character in REGEX_METACHARACTERS for character in term)
+
+
+def get_overlap_sentinels(term: str) -> list[str]:
+    """
+    Returns the strings that contain two overlapping occurrences of a term.
+
+    A term can overlap itself at an offset `period` when it is periodic with that period
+    (for example "aa" or "health"). The returned strings are the shortest text spans holding
+    such an overlap, so a document containing none of them has no overlapping occurrences of
+    the term.
+
+    Args:
+        term (str): A literal term.
+
+    Returns:
+        list[str]: One string per period of the term, empty if the term cannot overlap itself.
+    """
+    return [
+        term[:period] + term for period in range(1, len(term)) if term[period:] == term[:-period]
+    ]
+
+
+def plan_term_counts(terms: dict[str, str], patterns: dict[str, str] | None = None) -> dict:
+    """
+    Plans the count columns of terms and patterns as one list of expressions, evaluated
+    together in a single lazy `with_columns` context (see `count_planned_terms`).
+
+    Every literal term is counted from the matches of one multi-pattern (Aho-Corasick) scan
+    with `str.extract_many` in overlapping mode. Every count expression repeats that scan,
+    and polars' common subexpression elimination evaluates it once and shares its matches
+    between them, so all the literal terms take a single pass over 'clean_text'. The counts
+    are identical to `str.count_matches(term)`:
+    - Terms containing regex syntax and the patterns are counted with
+      `str.count_matches`, one pass each, in parallel with the other expressions.
+    - Terms that can overlap themselves are recounted with `str.count_matches`, but only on
+      the few documents where such an overlap was actually found (flagged by the
+      OVERLAP_FLAG_COL expression of the plan), since `count_matches` counts
+      non-overlapping matches.
+
+    Args:
+        terms (dict[str, str]): Maps each count column to the term (or regex pattern) it
+                                counts, matched in lowercase.
+        patterns (dict[str, str] | None): Maps each count column to the regex pattern it
+                                          counts, e.g. the dictionary alternations
+                                          ("term_1|term_2|...") whose leftmost-first match
+                                          semantics cannot be reproduced from the
+                                          overlapping matches.
+
+    Returns:
+        dict: The 'exprs' to evaluate, the 'overlap_terms' to recount (column to term) and
+              the number of full 'text_passes' the expressions make over 'clean_text'.
+    """
+    target_terms = {col_name: term.lower() for col_name, term in terms.items()}
+    literal_terms = list(
+        dict.fromkeys(target for target in target_terms.values() if is_literal_term(target))
+    )
+    overlap_sentinels = {
+        target: get_overlap_sentinels(target)
+        for target in literal_terms
+        if get_overlap_sentinels(target)
+    }
+    term_matches = None
+    if literal_terms:
+        match_patterns = literal_terms.copy()
+        for sentinels in overlap_sentinels.values():
+            match_patterns.extend(sentinels)
+        term_matches = pl.col("clean_text").str.extract_many(
+            list(dict.fromkeys(match_patterns)), overlapping=True
+        )
+    count_exprs = []
+    for col_name, target_term in target_terms.items():
+        if is_literal_term(target_term):
+            count_expr = term_matches.list.count_matches(target_term)
+        else:
+            count_expr = pl.col("clean_text").str.count_matches(target_term)
+        count_exprs.append(count_expr.cast(pl.Int32).alias(col_name))
+    for col_name, pattern in (patterns or {}).items():
+        count_exprs.append(
+            pl.col("clean_text").str.count_matches(pattern).cast(pl.Int32).alias(col_name)
+        )
+    if overlap_sentinels:
+        all_sentinels = [
+            sentinel for sentinels in overlap_sentinels.values() for sentinel in sentinels
+        ]
+        count_exprs.append(
+            term_matches.list.eval(pl.element().is_in(all_sentinels))
+            .list.any()
+            .alias(OVERLAP_FLAG_COL)
+        )
+    regex_terms = {target for target in target_terms.values() if not is_literal_term(target)}
+    return {
+        "exprs": count_exprs,
+        "overlap_terms": {
+            col_name: target_term
+            for col_name, target_term in target_terms.items()
+            if target_term in overlap_sentinels
+        },
+        "text_passes": int(bool(literal_terms)) + len(regex_terms) + len(patterns or {}),
+    }
+
+
+def count_planned_terms(dta: pl.DataFrame, term_count_plan: dict) -> pl.DataFrame:
+    """
+    Adds the count columns of a plan from `plan_term_counts` to the documents.
+
+    The passes over 'clean_text' are recorded in the page profile as 'clean_text_passes',
+    and the documents recounted for overlapping terms as 'overlap_recount_rows'.
+
+    Args:
+        dta (pl.DataFrame): A Polars DataFrame containing a 'clean_text' column.
+        term_count_plan (dict): The plan from `plan_term_counts`.
+
+    Returns:
+        pl.DataFrame: The DataFrame with one Int32 count column per term and pattern.
+    """
+    dta = dta.lazy().with_columns(term_count_plan["exprs"]).collect()
+    profile_functs.record_counter("clean_text_passes", term_count_plan["text_passes"])
+    overlap_terms = term_count_plan["overlap_terms"]
+    if not overlap_terms:
+        return dta
+    overlap_rows = dta[OVERLAP_FLAG_COL].arg_true()
+    dta = dta.drop(OVERLAP_FLAG_COL)
+    profile_functs.record_counter("overlap_recount_rows", overlap_rows.len())
+    if overlap_rows.len() == 0:
+        return dta
+    recounts = dta[overlap_rows].select(
+        pl.col("clean_text").str.count_matches(target_term).cast(pl.Int32).alias(col_name)
+        for col_name, target_term in overlap_terms.items()
+    )
+    return dta.with_columns(
+        dta[col_name].scatter(overlap_rows, recounts[col_name]) for col_name in overlap_terms
+    )
+
+
+def get_count_cols(terms: list[str]) -> dict[str, str]:
+    return {
+        f"{COUNT_COL_PREFIX}{term_number}": term
+        for term_number, term in enumerate(dict.fromkeys(terms))
+    }
+
+
+def join_term_counts(
+    dta: pl.DataFrame, term_counts: pl.DataFrame, term_cols: dict[str, str]
+) -> pl.DataFrame:
+    """
+    Joins term count columns onto the documents by 'doc_id'.
+
+    A term named like a column of the documents (e.g. "year") replaces that column, as the
+    counts of `count_terms` do, instead of clashing with it.
+
+    Args:
+        dta (pl.DataFrame): The documents with a 'doc_id' column.
+        term_counts (pl.DataFrame): The 'doc_id' and count columns (see `get_count_cols`) of
+                                    the documents.
+        term_cols (dict[str, str]): Maps each column to add to its count column in
+                                    `term_counts`.
+
+    Returns:
+        pl.DataFrame: The documents with one Int32 count column per term, 0 for the
+                      documents missing from `term_counts`.
+    """
+    return (
+        dta.join(term_counts, on="doc_id", how="left")
+        .with_columns(
+            pl.col(count_col).fill_null(0).cast(pl.Int32).alias(col_name)
+            for col_name, count_col in term_cols.items()
+        )
+        .select(*dict.fromkeys([*dta.columns, *term_cols]))
+    )
+
+
+def count_terms(dta: pl.DataFrame, terms: list[str]) -> pl.DataFrame:
+    """
+    Counts the occurrences of each term in the 'clean_text' column, see `plan_term_counts`.
+
+    Args:
+        dta (pl.DataFrame): A Polars DataFrame containing a 'clean_text' column.
+        terms (list[str]): The terms (or regex patterns) to count, matched in lowercase.
+
+    Returns:
+        pl.DataFrame: The DataFrame with one Int32 count column per term, named after the term.
+    """
+    return count_planned_terms(dta, plan_term_counts({term: term for term in terms}))
+
+
+def count_patterns(dta: pl.DataFrame, patterns: dict[str, str]) -> pl.DataFrame:
+    """
+    Counts the non-overlapping matches of several regex patterns in the 'clean_text' column
+    in a single context, so polars evaluates them in parallel (see `plan_term_counts`).
+
+    Args:
+        dta (pl.DataFrame): A Polars DataFrame containing a 'clean_text' column.
+        patterns (dict[str, str]): Maps each new column name to the pattern it counts.
+
+    Returns:
+        pl.DataFrame: The DataFrame with one Int32 count column per pattern.
+    """
+    return count_planned_terms(dta, plan_term_counts({}, patterns))
+
+
+def get_dictionary_hash(dictionary_dicts: dict) -> str:
+    """
+    Hashes the dictionary keys, labels and ordered terms, which decide the vocabulary and the
+    counts of the sparse term store (the order matters for the combined alternations).
+
+    Args:
+        dictionary_dicts (dict): The dictionaries from `create_dictionary_dicts`.
+
+    Returns:
+        str: The hex digest of the dictionaries.
+    """
+    dictionaries = [
+        [dict_key, dictionary_dict["label"], list(dictionary_dict["terms"].keys())]
+        for dict_key, dictionary_dict in dictionary_dicts.items()
+    ]
+    return hashlib.sha256(json.dumps(dictionaries).encode()).hexdigest()
+
+
+def get_term_vocab(dictionary_dicts: dict) -> pl.DataFrame:
+    """
+    Builds the vocabulary of the sparse term store from the dictionaries.
+
+    Every distinct term gets a 'term' entry and every dictionary a 'dictionary' entry (named
+    after its label) for the combined count of its terms. Term ids follow the order of
+    `create_dictionary_dicts`.
+
+    Args:
+        dictionary_dicts (dict): The dictionaries from `create_dictionary_dicts`.
+
+    Returns:
+        pl.DataFrame: The vocabulary with 'term_id', 'term', 'kind' and 'pattern' columns.
+    """
+    vocab = {}
+    for dictionary_dict in dictionary_dicts.values():
+        for term in dictionary_dict["terms"]:
+            vocab.setdefault(("term", term), term.lower())
+    for dictionary_dict in dictionary_dicts.values():
+        combined_terms = "|".join(dictionary_dict["terms"].keys())
+        vocab[("dictionary", dictionary_dict["label"])] = combined_terms.lower()
+    return pl.DataFrame(
+        {
+            "term_id": range(len(vocab)),
+            "term": [term for _, term in vocab],
+            "kind": [kind for kind, _ in vocab],
+            "pattern": list(vocab.values()),
+        },
+        schema={"term_id": pl.UInt32, "term": pl.Utf8, "kind": pl.Utf8, "pattern": pl.Utf8},
+    )
+
+
+def build_term_counts(dta: pl.DataFrame, term_vocab: pl.DataFrame) -> pl.DataFrame:
+    """
+    Counts every vocabulary entry in every document and keeps only the non zero counts.
+
+    The result is sorted by 'doc_id' and then 'term_id', i.e. the rows of a compressed sparse
+    row (CSR) matrix whose row offsets are implied by the runs of 'doc_id' (which parquet
+    stores run length encoded). Most documents only contain a handful of terms, so this is a
+    small fraction of the dense documents x terms matrix. Documents are counted in batches of
+    TERM_STORE_BATCH_SIZE to bound the dense intermediate.
+
+    Args:
+        dta (pl.DataFrame): The corpus with 'doc_id' and 'clean_text' columns.
+        term_vocab (pl.DataFrame): The vocabulary from `get_term_vocab`.
+
+    Returns:
+        pl.DataFrame: The sparse counts with 'doc_id', 'term_id' and 'count' columns.
+    """
+    terms = term_vocab.filter(pl.col("kind") == "term")
+    dictionaries = term_vocab.filter(pl.col("kind") == "dictionary")
+    term_col_ids = {f"term_{term_id}": term_id for term_id in term_vocab["term_id"]}
+    term_count_plan = plan_term_counts(
+        {f"term_{term_id}": term for term_id, term in terms.select("term_id", "term").rows()},
+        {
+            f"term_{term_id}": pattern
+            for term_id, pattern in dictionaries.select("term_id", "pattern").rows()
+        },
+    )
+    term_counts = []
+    for dta_batch in dta.select("doc_id", "clean_text").iter_slices(TERM_STORE_BATCH_SIZE):
+        dta_batch = count_planned_terms(dta_batch, term_count_plan)
+        term_counts.append(
+            dta_batch.drop("clean_text")
+            .unpivot(index="doc_id", variable_name="term_col", value_name="count")
+            .filter(pl.col("count") > 0)
+            .select(
+                "doc_id",
+                pl.col("term_col")
+                .replace_strict(term_col_ids, return_dtype=pl.UInt32)
+                .alias("term_id"),
+                "count",
+            )
+        )
+    if not term_counts:
+        return pl.DataFrame(schema={"doc_id": pl.UInt32, "term_id": pl.UInt32, "count": pl.Int32})
+    return pl.concat(term_counts).sort("doc_id", "term_id")
+
+
+def get_stored_term_counts(
+    dta: pl.DataFrame, term_store: dict, terms: list[str], kind: str = "term"
+) -> pl.DataFrame:
+    """
+    Adds term count columns to the rows of a term store instead of scanning their text.
+
+    Args:
+        dta (pl.DataFrame): The rows to add the counts to with the store's key column: the
+                            corpus with 'doc_id' for the document store or the cube words with
+                            'cell_id' for the company x week of month cube (or a filtered part
+                            of them).
+        term_store (dict): The store from `corpus_functions.load_term_store` or
+                           `corpus_functions.load_cube` with 'key', 'vocab' and 'counts' entries.
+        terms (list[str]): The terms (or, for kind 'dictionary', the dictionary labels).
+        kind (str): 'term' for per-term counts or 'dictionary' for combined dictionary counts.
+
+    Returns:
+        pl.DataFrame: The DataFrame with one Int32 count column per term, named after the term.
+    """
+    key = term_store["key"]
+    term_ids = term_store["vocab"].filter((pl.col("kind") == kind) & pl.col("term").is_in(terms))
+    term_names = dict(term_ids.select("term_id", "term").rows())
+    term_counts = (
+        term_store["counts"]
+        .filter(pl.col("term_id").is_in(term_ids["term_id"]))
+        .join(dta.select(key), on=key, how="semi")
+        .with_columns(pl.col("term_id").replace_strict(term_names, return_dtype=pl.Utf8))
+        .pivot(on="term_id", index=key, values="count")
+    )
+    return dta.join(term_counts, on=key, how="left").select(
+        *dta.columns,
+        *(
+            pl.col(f"{term}").fill_null(0).cast(pl.Int32)
+            if f"{term}" in term_counts.columns
+            else pl.lit(0, dtype=pl.Int32).alias(f"{term}")
+            for term in terms
+        ),
+    )
+
+
+def has_stored_terms(term_store: dict | None, terms: list[str], kind: str = "term") -> bool:
+    if term_store is None:
+        return False
+    stored_terms = set(term_store["vocab"].filter(pl.col("kind") == kind)["term"].to_list())
+    return all(term in stored_terms for term in terms)
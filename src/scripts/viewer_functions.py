@@ -0,0 +1,157 @@
+import io
+
+import polars as pl
+import streamlit as st
+
+import scripts.profile_functions as profile_functs
+
+# the rows of one page of the dataframe viewer
+VIEWER_PAGE_ROWS_OPTIONS = [25, 50, 100, 250]
+VIEWER_DEFAULT_PAGE_ROWS = 50
+DOWNLOAD_FORMATS = ["parquet", "csv"]
+
+
+def query_frame(
+    dta: pl.DataFrame,
+    columns: list[str],
+    sort_col: str | None = None,
+    descending: bool = False,
+    filter_col: str | None = None,
+    filter_text: str = "",
+) -> pl.LazyFrame:
+    """
+    Builds the query of the dataframe viewer over a frame.
+
+    Args:
+        dta (pl.DataFrame): The frame shown in the viewer.
+        columns (list[str]): The columns to keep, in order.
+        sort_col (str | None): The column to sort by, the rows keep their order if None.
+        descending (bool): Whether to sort in descending order.
+        filter_col (str | None): The column to filter on.
+        filter_text (str): Rows whose filter column, as text, contains this (ignoring case)
+                           are kept, every row is kept if it is empty.
+
+    Returns:
+        pl.LazyFrame: The filtered, sorted and selected rows.
+    """
+    query = dta.lazy()
+    if filter_col is not None and filter_text:
+        query = query.filter(
+            pl.col(filter_col)
+            .cast(pl.Utf8)
+            .str.to_lowercase()
+            .str.contains(filter_text.lower(), literal=True)
+        )
+    if sort_col is not None:
+        query = query.sort(sort_col, descending=descending, nulls_last=True, maintain_order=True)
+    return query.select(columns)
+
+
+def get_page_count(n_rows: int, page_rows: int) -> int:
+    return max((n_rows + page_rows - 1) // page_rows, 1)
+
+
+def get_viewer_page(query: pl.LazyFrame, page_number: int, page_rows: int) -> pl.DataFrame:
+    """
+    Collects one page of the viewer query, a sort followed by the slice only keeps the top
+    rows of the page instead of sorting the whole frame.
+
+    Args:
+        query (pl.LazyFrame): The query from `query_frame`.
+        page_number (int): The page, starting at 1.
+        page_rows (int): The rows of a page.
+
+    Returns:
+        pl.DataFrame: The rows of the page.
+    """
+    return query.slice((page_number - 1) * page_rows, page_rows).collect()
+
+
+def get_download_bytes(dta: pl.DataFrame, file_format: str) -> bytes:
+    """
+    Writes a frame as a parquet or csv file in memory.
+
+    Args:
+        dta (pl.DataFrame): The frame.
+        file_format (str): One of DOWNLOAD_FORMATS.
+
+    Returns:
+        bytes: The contents of the file.
+    """
+    if file_format == "csv":
+        return dta.write_csv().encode()
+    buffer = io.BytesIO()
+    dta.write_parquet(buffer)
+    return buffer.getvalue()
+
+
+@st.fragment
+@profile_functs.profiled_section("dataframe viewer")
+def display_frame_viewer(dta: pl.DataFrame, title: str) -> None:
+    """
+    Displays a frame one page at a time, with the columns, sorting and filtering chosen in
+    the viewer applied on the server, so only the rows of the visible page are sent to the
+    browser. The viewer reruns on its own when its widgets change, and the filtered and
+    sorted rows can be downloaded as a parquet or csv file written directly from the frame.
+
+    Args:
+        dta (pl.DataFrame): The frame.
+        title (str): The title of the frame, which also keys the widgets of the viewer.
+    """
+    key = f"viewer_{title}"
+    columns = st.multiselect(
+        "Columns", options=dta.columns, default=dta.columns, key=f"{key}_columns"
+    )
+    sort_column, order_column, filter_column, text_column = st.columns(4)
+    sort_col = sort_column.selectbox(
+        "Sort by", options=dta.columns, index=None, key=f"{key}_sort_col"
+    )
+    descending = order_column.toggle("Descending", key=f"{key}_descending")
+    filter_col = filter_column.selectbox(
+        "Filter column", options=dta.columns, index=None, key=f"{key}_filter_col"
+    )
+    filter_text = text_column.text_input("Contains", key=f"{key}_filter_text")
+    with profile_functs.time_stage("dataframe_query"):
+        query = query_frame(dta, columns, sort_col, descending, filter_col, filter_text)
+        n_rows = query.select(pl.len()).collect().item()
+    rows_column, page_column = st.columns(2)
+    page_rows = rows_column.selectbox(
+        "Rows per page",
+        options=VIEWER_PAGE_ROWS_OPTIONS,
+        index=VIEWER_PAGE_ROWS_OPTIONS.index(VIEWER_DEFAULT_PAGE_ROWS),
+        key=f"{key}_page_rows",
+    )
+    page_count = get_page_count(n_rows, page_rows)
+    # a filter or a larger page can leave fewer pages than the page shown before
+    if st.session_state.get(f"{key}_page_number", 1) > page_count:
+        st.session_state[f"{key}_page_number"] = page_count
+    page_number = page_column.number_input(
+        "Page",
+        min_value=1,
+        max_value=page_count,
+        key=f"{key}_page_number",
+    )
+    with profile_functs.time_stage("dataframe_query"):
+        page_dta = get_viewer_page(query, page_number, page_rows)
+    with profile_functs.time_stage("dataframe_serialization"):
+        st.dataframe(page_dta)
+    profile_functs.record_counter("viewer_rows_sent", page_dta.height)
+    st.write(
+        f"Page {page_number} of {page_count}, {n_rows} of {dta.height} rows, "
+        f"{len(columns)} of {dta.width} columns"
+    )
+
+    format_column, download_column = st.columns(2)
+    file_format = format_column.radio(
+        "Download format", options=DOWNLOAD_FORMATS, horizontal=True, key=f"{key}_format"
+    )
+    # the file is only written when asked for, not on every rerun of the viewer
+    if download_column.button("Prepare download", key=f"{key}_prepare"):
+        with profile_functs.time_stage("dataframe_download"):
+            file_bytes = get_download_bytes(query.collect(), file_format)
+        download_column.download_button(
+            f"Download {file_format}",
+            data=file_bytes,
+            file_name=f"{title}.{file_format}",
+            key=f"{key}_download",
+        )